@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import UserProfile, UploadedFile
+from .models import UserProfile, UploadedFile, IngestionJob, Conversation, Message, ChatLog
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
@@ -9,5 +9,24 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 @admin.register(UploadedFile)
 class UploadedFileAdmin(admin.ModelAdmin):
-    list_display = ['original_filename', 'professor', 'file_type', 'uploaded_at']
-    list_filter = ['file_type', 'uploaded_at']
\ No newline at end of file
+    list_display = ['original_filename', 'professor', 'file_type', 'status', 'uploaded_at']
+    list_filter = ['file_type', 'status', 'uploaded_at']
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ['file', 'status', 'attempts', 'run_after', 'finished_at']
+    list_filter = ['status']
+
+class MessageInline(admin.TabularInline):
+    model = Message
+    extra = 0
+
+@admin.register(Conversation)
+class ConversationAdmin(admin.ModelAdmin):
+    list_display = ['id', 'created_at', 'updated_at']
+    inlines = [MessageInline]
+
+@admin.register(ChatLog)
+class ChatLogAdmin(admin.ModelAdmin):
+    list_display = ['created_at', 'endpoint', 'model', 'course_name', 'cache', 'prompt_eval_count', 'eval_count']
+    list_filter = ['endpoint', 'cache', 'model']
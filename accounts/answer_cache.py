@@ -0,0 +1,164 @@
+"""Cache of chat answers for repeated questions.
+
+Exact repeats are found in the ``ANSWER_CACHE_ALIAS`` cache (size and TTL
+bounded by its ``TIMEOUT`` and ``MAX_ENTRIES``); paraphrases are found by
+embedding similarity in a ``SemanticCache``. Both are keyed by a context
+covering the file or course asked about, the conversation so far, and a
+version of the documents derived from the database, so uploading,
+re-processing or deleting material changes the key instead of requiring
+explicit invalidation (which would not reach other worker processes).
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Q, Sum
+
+from .embeddings import get_embedder
+from .metrics import CACHE_LOOKUPS
+from .models import UploadedFile
+from .retrieval import course_files, course_key
+from .semantic_cache import SemanticCache
+
+logger = logging.getLogger(__name__)
+
+_counts = {"hits": 0, "misses": 0}
+_counts_lock = threading.Lock()
+_semantic_cache = None
+
+
+def get_cache():
+    return caches[settings.ANSWER_CACHE_ALIAS]
+
+
+def get_semantic_cache():
+    global _semantic_cache
+    if _semantic_cache is None:
+        _semantic_cache = SemanticCache(settings.SEMANTIC_CACHE_CAPACITY, settings.SEMANTIC_CACHE_THRESHOLD)
+    return _semantic_cache
+
+
+def normalize_question(question):
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!. ")
+
+
+def document_version(file_id=None, course_name=None):
+    if file_id:
+        row = UploadedFile.objects.filter(id=file_id).values_list("id", "content_hash", "status").first()
+        return "-".join(map(str, row)) if row else "missing"
+    if course_name is not None:     # "" is the uncategorized files
+        files = course_files(course_name).aggregate(
+            count=Count("id"), id_sum=Sum("id"), ready=Count("id", filter=Q(status="ready"))
+        )
+        return f"{files['count']}-{files['id_sum']}-{files['ready']}"
+    return "none"
+
+
+def context_key(chat_history=(), file_id=None, course_name=None):
+    """Everything an answer depends on except the question itself"""
+    if file_id:
+        scope = f"file:{file_id}"
+    elif course_name is not None:
+        scope = f"course:{course_key(course_name)}"
+    else:
+        scope = "general"
+
+    history = json.dumps([[m.get("role"), m.get("content")] for m in chat_history])
+    return "\x1f".join([
+        scope,
+        document_version(file_id, course_name),
+        hashlib.sha256(history.encode()).hexdigest(),
+    ])
+
+
+def make_key(question, chat_history=(), file_id=None, course_name=None):
+    context = context_key(chat_history, file_id, course_name)
+    return _exact_key(context, question)
+
+
+def _exact_key(context, question):
+    raw = f"{context}\x1f{normalize_question(question)}"
+    return "answer:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _embed_question(question):
+    try:
+        return get_embedder().embed([normalize_question(question)])[0]
+    except Exception as e:
+        logger.warning("Embedding the question failed: %s", e)
+        return None
+
+
+class Lookup:
+    """Result of looking a question up; pass it to ``store`` after a miss"""
+
+    def __init__(self, context, question):
+        self.context = context
+        self.key = _exact_key(context, question)
+        self.vector = None      # the question's embedding; retrieval reuses it
+        self.entry = None
+        self.source = None
+
+
+def lookup(question, chat_history=(), file_id=None, course_name=None):
+    """Look for an exact, then a semantically similar, cached answer"""
+    result = Lookup(context_key(chat_history, file_id, course_name), question)
+
+    result.entry = get_cache().get(result.key)
+    _count(result.entry is not None)
+    if result.entry is not None:
+        result.source = "exact"
+        CACHE_LOOKUPS.inc(result="exact")
+        return result
+
+    if settings.SEMANTIC_CACHE_ENABLED:
+        result.vector = _embed_question(question)
+        if result.vector is not None:
+            result.entry = get_semantic_cache().get(result.context, result.vector)
+            if result.entry is not None:
+                result.source = "semantic"
+    CACHE_LOOKUPS.inc(result=result.source or "miss")
+    return result
+
+
+def store(result, answer, file_used=None):
+    if not answer:
+        return
+    entry = {"answer": answer, "file_used": file_used}
+    get_cache().set(result.key, entry)
+    if result.vector is not None:
+        get_semantic_cache().put(result.context, result.vector, entry)
+
+
+def _count(hit):
+    with _counts_lock:
+        _counts["hits" if hit else "misses"] += 1
+
+
+def stats():
+    with _counts_lock:
+        hits, misses = _counts["hits"], _counts["misses"]
+    total = hits + misses
+    semantic = get_semantic_cache().stats()
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else 0.0,
+        **semantic,
+        # every hit in either tier is a generation that didn't happen
+        "llm_calls_saved": hits + semantic["semantic_hits"],
+    }
+
+
+def reset():
+    """Drop every cached answer and zero the counters"""
+    get_cache().clear()
+    get_semantic_cache().clear()
+    with _counts_lock:
+        _counts.update(hits=0, misses=0)
@@ -1,5 +1,30 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.backends.signals import connection_created
 
 class AccountsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "accounts"
+
+    def ready(self):
+        from . import chat_log, ingestion, llm, metrics, timing
+
+        connection_created.connect(timing.install_query_timer)
+        metrics.REGISTRY.start_flusher()
+
+        llm.get_client()
+        # servers only: a migrate or test run shouldn't load a model
+        command = sys.argv[1] if len(sys.argv) > 1 and sys.argv[0].endswith("manage.py") else None
+        serving = command in (None, "runserver")
+        if settings.OLLAMA_WARM_UP and serving:
+            llm.warm_up_in_background()
+        if serving:
+            chat_log.start_writer()
+        # runserver's autoreloader runs ready() in the watching process too
+        reloader = command == "runserver" and "--noreload" not in sys.argv and os.environ.get("RUN_MAIN") != "true"
+        if settings.INGESTION_RUN_IN_PROCESS and serving and not reloader:
+            # pick up jobs queued before a restart without waiting for the next upload
+            ingestion.get_pool()
@@ -0,0 +1,121 @@
+"""Per-request Ollama usage, kept for capacity planning.
+
+The chat views hand each answer's generation stats (prompt and output
+token counts, prefill/decode/load durations) to ``record``, which only
+appends them to an in-memory buffer. A writer thread inserts the buffer
+into ``ChatLog`` every ``CHAT_LOG_FLUSH_INTERVAL`` seconds with
+``bulk_create``, so a chat never waits on the log. At most
+``CHAT_LOG_MAX_PENDING`` rows are buffered; beyond that the oldest are
+dropped. ``summarize`` aggregates the table for ``manage.py chat_stats``.
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import ChatLog
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_FIELDS = ("prompt_eval_count", "eval_count", "total_duration", "load_duration",
+                 "prompt_eval_duration", "eval_duration")
+
+_pending = deque(maxlen=settings.CHAT_LOG_MAX_PENDING)
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def record(endpoint, cache="miss", response=None, file_id=None, course_name=None, prompt_tokens=None):
+    """Queue a log row; ``response`` is Ollama's (final) chat response, if any"""
+    row = ChatLog(
+        created_at=timezone.now(),
+        endpoint=endpoint,
+        model=(response.get("model") if response else None) or "",
+        file_id=int(file_id) if str(file_id).isdigit() else None,
+        course_name=course_name or "",
+        cache=cache,
+        prompt_tokens=prompt_tokens["used"] if prompt_tokens else 0,
+    )
+    if response:
+        for field in OLLAMA_FIELDS:
+            setattr(row, field, response.get(field))
+    _pending.append(row)
+
+
+def flush():
+    """Write the buffered rows in the calling thread; returns how many"""
+    written = 0
+    while _pending:
+        batch = []
+        while _pending and len(batch) < settings.CHAT_LOG_BATCH_SIZE:
+            batch.append(_pending.popleft())
+        try:
+            ChatLog.objects.bulk_create(batch)
+            written += len(batch)
+        except Exception:
+            logger.warning("Dropped %s chat log rows", len(batch), exc_info=True)
+    return written
+
+
+def _write_forever():
+    while True:
+        time.sleep(settings.CHAT_LOG_FLUSH_INTERVAL)
+        if _pending:
+            flush()
+            close_old_connections()
+
+
+def start_writer():
+    """Start the background writer (servers only; see ``AccountsConfig.ready``)"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_forever, name="chat-log-writer", daemon=True)
+            _writer.start()
+            atexit.register(flush)
+    return _writer
+
+
+def summarize(bucket="hour", since=None):
+    """Per time window: requests, cache hits, prefill/decode speed and split, model loads"""
+    trunc = {"hour": TruncHour, "day": TruncDay}[bucket]
+    logs = ChatLog.objects.all()
+    if since is not None:
+        logs = logs.filter(created_at__gte=since)
+    rows = (
+        logs.annotate(window=trunc("created_at")).values("window").order_by("window").annotate(
+            requests=Count("id"),
+            cache_hits=Count("id", filter=~Q(cache="miss")),
+            generations=Count("id", filter=Q(eval_duration__isnull=False)),
+            prompt_tokens=Sum("prompt_eval_count"),
+            output_tokens=Sum("eval_count"),
+            prefill_ns=Sum("prompt_eval_duration"),
+            decode_ns=Sum("eval_duration"),
+            load_ns=Sum("load_duration"),
+            # Ollama reports a few ms of load time even when the model is resident
+            model_loads=Count("id", filter=Q(load_duration__gt=settings.CHAT_LOG_RELOAD_SECONDS * 1e9)),
+        )
+    )
+    summary = []
+    for row in rows:
+        prefill, decode = (row["prefill_ns"] or 0) / 1e9, (row["decode_ns"] or 0) / 1e9
+        summary.append({
+            "window": row["window"],
+            "requests": row["requests"],
+            "cache_hits": row["cache_hits"],
+            "generations": row["generations"],
+            "prefill_tokens_per_s": (row["prompt_tokens"] or 0) / prefill if prefill else None,
+            "decode_tokens_per_s": (row["output_tokens"] or 0) / decode if decode else None,
+            "prefill_share": prefill / (prefill + decode) if prefill + decode else None,
+            "model_loads": row["model_loads"],
+            "load_seconds": (row["load_ns"] or 0) / 1e9,
+        })
+    return summary
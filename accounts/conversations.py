@@ -0,0 +1,158 @@
+"""Server-side chat conversations with a rolling summary.
+
+Clients send only the new question and a ``conversation_id``. A
+conversation belongs to the Django session that started it; other
+sessions get a 404 for its id. Older clients that send the whole
+``chat_history`` themselves get no conversation and nothing is stored.
+The prompt history is the conversation's summary followed by the turns not yet
+folded into it. Once ``CONVERSATION_SUMMARY_EVERY`` turns have piled up
+the summary is refreshed on a background thread, keeping the most recent
+``CONVERSATION_KEEP_TURNS`` turns verbatim, so the prompt stays about the
+same size however long a study session runs.
+"""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import close_old_connections, transaction
+
+from . import llm
+from .models import Conversation, Message
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_INSTRUCTION = (
+    "Summarize this tutoring conversation between a student and a study assistant in a few sentences. "
+    "Keep the topics, definitions and open questions the student will likely refer back to."
+)
+
+_executor = None
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def session_key(request):
+    """The key of the request's session, creating the session if needed"""
+    if not request.session.session_key:
+        request.session.create()
+    return request.session.session_key
+
+
+def resume(session_key, conversation_id=None):
+    """This session's conversation with this id, or a new one; raises ``Conversation.DoesNotExist``.
+
+    A new conversation is not saved until ``record_turn`` has a turn for it,
+    so a request that fails (busy, Ollama down) leaves no empty row behind.
+    """
+    if not conversation_id:
+        return Conversation(session_key=session_key)
+    try:
+        return Conversation.objects.get(id=conversation_id, session_key=session_key)
+    except ValidationError:
+        # not a UUID: can't be one of ours
+        raise Conversation.DoesNotExist
+
+
+def open_conversation(request, data):
+    """``(conversation, chat_history)`` for a chat request; raises ``Conversation.DoesNotExist``.
+
+    Legacy requests (``chat_history`` and no ``conversation_id``) get
+    ``(None, their own history)``.
+    """
+    conversation_id = data.get("conversation_id")
+    if not conversation_id and "chat_history" in data:
+        return None, data.get("chat_history") or []
+    conversation = resume(session_key(request), conversation_id)
+    return conversation, history(conversation) if conversation_id else []
+
+
+def history(conversation):
+    """Chat history for the prompt: the summary, then the turns after it"""
+    messages = []
+    if conversation.summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the conversation so far: {conversation.summary}",
+        })
+    for role, content in conversation.messages.filter(id__gt=conversation.summarized_until).values_list("role", "content"):
+        messages.append({"role": role, "content": content})
+    return messages
+
+
+def record_turn(conversation, question, answer):
+    """Save a question/answer pair and schedule a summary refresh if due"""
+    if conversation is None:
+        return      # legacy request: the client keeps the history
+    with transaction.atomic():
+        if conversation._state.adding:
+            conversation.save()     # its first answered turn
+        else:
+            conversation.save(update_fields=["updated_at"])
+        Message.objects.bulk_create([
+            Message(conversation=conversation, role="user", content=question),
+            Message(conversation=conversation, role="assistant", content=answer),
+        ])
+
+    unsummarized = conversation.messages.filter(id__gt=conversation.summarized_until).count()
+    due = settings.CONVERSATION_SUMMARY_EVERY + settings.CONVERSATION_KEEP_TURNS
+    if unsummarized >= 2 * due:
+        conversation_id = conversation.id
+        transaction.on_commit(lambda: schedule_summary(conversation_id))
+
+
+def summarize(previous_summary, messages):
+    transcript = "\n".join(f"{m.role}: {m.content}" for m in messages)
+    if previous_summary:
+        transcript = f"Earlier summary: {previous_summary}\n\n{transcript}"
+    response = llm.chat(
+        model=settings.CONVERSATION_SUMMARY_MODEL,
+        messages=[
+            {"role": "system", "content": SUMMARY_INSTRUCTION},
+            {"role": "user", "content": transcript},
+        ],
+    )
+    return response["message"]["content"].strip()
+
+
+def refresh_summary(conversation_id):
+    """Fold all but the most recent turns of a conversation into its summary"""
+    conversation = Conversation.objects.get(id=conversation_id)
+    messages = list(conversation.messages.filter(id__gt=conversation.summarized_until))
+    keep = 2 * settings.CONVERSATION_KEEP_TURNS
+    fold = messages[:len(messages) - keep] if keep else messages
+    if not fold:
+        return False
+
+    summary = summarize(conversation.summary, fold)
+    # a concurrent refresh that got there first wins; ours is dropped
+    return bool(
+        Conversation.objects.filter(id=conversation.id, summarized_until=conversation.summarized_until)
+        .update(summary=summary, summarized_until=fold[-1].id)
+    )
+
+
+def _run_refresh(conversation_id):
+    close_old_connections()
+    try:
+        refresh_summary(conversation_id)
+    except Exception:
+        logger.warning("Summarizing conversation %s failed", conversation_id, exc_info=True)
+    finally:
+        with _pending_lock:
+            _pending.discard(conversation_id)
+        close_old_connections()
+
+
+def schedule_summary(conversation_id):
+    """Refresh a summary on the background thread, at most once at a time per conversation"""
+    global _executor
+    with _pending_lock:
+        if conversation_id in _pending:
+            return
+        _pending.add(conversation_id)
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-summary")
+    _executor.submit(_run_refresh, conversation_id)
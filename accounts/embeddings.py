@@ -0,0 +1,80 @@
+"""Pluggable text embedders for semantic retrieval.
+
+``OllamaEmbedder`` asks the local Ollama server for embeddings.
+``HashingEmbedder`` is a deterministic feature-hashing embedder with no
+external dependencies, used offline and in tests. Both return an
+L2-normalized float32 matrix with one row per input text.
+"""
+
+import zlib
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from . import llm
+from .retrieval import tokenize
+
+
+def normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class HashingEmbedder:
+    """Signed feature hashing of unigrams and bigrams"""
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def _features(self, text):
+        tokens = tokenize(text)
+        return tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+    def embed(self, texts):
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.array([zlib.crc32(f.encode()) for f in self._features(text)], dtype=np.uint32)
+            if not len(hashes):
+                continue
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0).astype(np.float32)
+            np.add.at(matrix[row], hashes % self.dim, signs)
+        return normalize_rows(matrix)
+
+
+class OllamaEmbedder:
+    """Embeddings from an Ollama embedding model"""
+
+    def __init__(self, model="nomic-embed-text", batch_size=32):
+        self.model = model
+        self.batch_size = batch_size
+
+    def embed(self, texts):
+        rows = []
+        for start in range(0, len(texts), self.batch_size):
+            response = llm.get_client().embed(
+                model=self.model, input=texts[start:start + self.batch_size], keep_alive=settings.OLLAMA_KEEP_ALIVE
+            )
+            rows.extend(response["embeddings"])
+        return normalize_rows(rows) if rows else np.zeros((0, 0), dtype=np.float32)
+
+
+EMBEDDER_BACKENDS = {
+    "hashing": lambda: HashingEmbedder(dim=settings.EMBEDDING_DIM),
+    "ollama": lambda: OllamaEmbedder(model=settings.EMBEDDING_MODEL),
+}
+
+
+@lru_cache(maxsize=None)
+def _build_embedder(backend):
+    if backend in EMBEDDER_BACKENDS:
+        return EMBEDDER_BACKENDS[backend]()
+    return import_string(backend)()
+
+
+def get_embedder():
+    """The configured embedder (``EMBEDDING_BACKEND``: a name or a dotted path)"""
+    return _build_embedder(settings.EMBEDDING_BACKEND)
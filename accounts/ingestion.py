@@ -0,0 +1,227 @@
+"""Background ingestion: text extraction, chunking and indexing of uploads.
+
+``upload_file`` only stores the file and queues an ``IngestionJob`` row.
+A small pool of worker threads claims due jobs from the table, processes
+them, and retries failures with exponential backoff. Course indexes are
+rebuilt once the queue runs dry (or after ``INGESTION_COURSE_INDEX_DELAY``),
+once per course changed, rather than after every job of a batch. Workers run inside
+the web process by default (``INGESTION_RUN_IN_PROCESS``; started with the
+server, so jobs queued before a restart are picked up) or standalone via
+``python manage.py ingestion_worker``.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .metrics import EXTRACTION_DURATION, INGESTION_JOBS
+from .models import IngestionJob, UploadedFile
+from .retrieval import build_course_index, copy_chunks, index_file
+from .storage import find_processed_copy
+from .timing import span, timed
+from .utils import extract_text
+from .vector_index import embed_file, unembed_file
+
+logger = logging.getLogger(__name__)
+
+
+# course name -> when a job first changed it since its index was rebuilt
+_dirty_courses = {}
+_dirty_lock = threading.Lock()
+
+
+def mark_course_dirty(course_name):
+    with _dirty_lock:
+        _dirty_courses.setdefault(course_name or "", time.monotonic())
+
+
+def flush_course_indexes(older_than=0):
+    """Rebuild the indexes of courses changed at least ``older_than`` seconds ago"""
+    cutoff = time.monotonic() - older_than
+    with _dirty_lock:
+        courses = [name for name, since in _dirty_courses.items() if since <= cutoff]
+        for name in courses:
+            del _dirty_courses[name]
+    if not courses:
+        return
+    with timed("course_index", courses=courses):
+        for name in courses:
+            try:
+                build_course_index(name)
+            except Exception:
+                logger.exception("Rebuilding the course index of %r failed", name)
+                mark_course_dirty(name)
+
+
+def set_progress(uploaded_file, progress, status="processing"):
+    UploadedFile.objects.filter(id=uploaded_file.id).update(status=status, progress=progress)
+
+
+def process_file(uploaded_file):
+    """Extract, chunk and index one file; exceptions propagate to the job"""
+    set_progress(uploaded_file, 0)
+    # a retry replaces the chunks: drop the vectors of the previous attempt's
+    unembed_file(uploaded_file)
+    source = find_processed_copy(uploaded_file)
+    if source is not None:
+        # same bytes were ingested before: reuse the chunks and index (the
+        # text is stored by content hash, so it is already shared)
+        with span("copy"):
+            copy_chunks(source, uploaded_file)
+        set_progress(uploaded_file, 75)
+    else:
+        with span("extract"), EXTRACTION_DURATION.time(file_type=uploaded_file.file_type):
+            uploaded_file.save_extracted_text(extract_text(
+                uploaded_file.file.path, uploaded_file.file_type, raise_errors=True,
+                # extraction is the first 60% of the work
+                progress=lambda done, total: set_progress(uploaded_file, 60 * done // total),
+            ))
+        set_progress(uploaded_file, 60)
+        with span("index"):
+            index_file(uploaded_file)
+        set_progress(uploaded_file, 75)
+
+    with span("embed"):
+        embed_file(uploaded_file)
+    set_progress(uploaded_file, 90)
+    # the course index only takes ready files; it is rebuilt once the
+    # queue runs dry, not after every file of a batch
+    set_progress(uploaded_file, 100, status="ready")
+    mark_course_dirty(uploaded_file.course_name)
+
+
+def enqueue(uploaded_file):
+    """Queue ingestion for a file and wake the workers once the row is committed"""
+    job = IngestionJob.objects.create(file=uploaded_file)
+    transaction.on_commit(wake_workers)
+    return job
+
+
+def enqueue_many(uploaded_files):
+    """Queue ingestion for several files with one insert"""
+    jobs = IngestionJob.objects.bulk_create([IngestionJob(file=f) for f in uploaded_files])
+    transaction.on_commit(wake_workers)
+    return jobs
+
+
+def claim_next_job():
+    """Atomically move one due job from queued to running, or return None"""
+    now = timezone.now()
+    due = IngestionJob.objects.filter(status="queued", run_after__lte=now).order_by("run_after", "id")
+    for job_id in due.values_list("id", flat=True)[:10]:
+        claimed = IngestionJob.objects.filter(id=job_id, status="queued").update(
+            status="running", started_at=now, attempts=F("attempts") + 1
+        )
+        if claimed:
+            return IngestionJob.objects.select_related("file").get(id=job_id)
+    return None
+
+
+def run_job(job):
+    # update() rather than save(): the file (and its jobs) may have been
+    # deleted while we were working on it
+    jobs = IngestionJob.objects.filter(id=job.id)
+    try:
+        with timed("ingestion", job_id=job.id, file_id=job.file_id, file_type=job.file.file_type):
+            process_file(job.file)
+    except Exception as e:
+        logger.warning("Ingestion job %s failed (attempt %s)", job.id, job.attempts, exc_info=True)
+        if job.attempts < settings.INGESTION_MAX_ATTEMPTS:
+            INGESTION_JOBS.inc(outcome="retried")
+            delay = settings.INGESTION_RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            jobs.update(status="queued", error=str(e), run_after=timezone.now() + timedelta(seconds=delay))
+            set_progress(job.file, 0, status="pending")
+        else:
+            INGESTION_JOBS.inc(outcome="failed")
+            jobs.update(status="failed", error=str(e), finished_at=timezone.now())
+            set_progress(job.file, 0, status="failed")
+    else:
+        INGESTION_JOBS.inc(outcome="done")
+        jobs.update(status="done", error="", finished_at=timezone.now())
+
+
+def run_pending():
+    """Process every due job in the calling thread; returns how many ran"""
+    count = 0
+    while (job := claim_next_job()) is not None:
+        run_job(job)
+        count += 1
+    flush_course_indexes()
+    return count
+
+
+def requeue_stale_jobs():
+    """Put back jobs left running by a worker that died mid-job"""
+    cutoff = timezone.now() - timedelta(seconds=settings.INGESTION_STALE_AFTER)
+    return IngestionJob.objects.filter(status="running", started_at__lt=cutoff).update(
+        status="queued", run_after=timezone.now()
+    )
+
+
+class WorkerPool:
+    """A fixed number of threads polling the job table"""
+
+    def __init__(self, size, poll_interval):
+        self.size = size
+        self.poll_interval = poll_interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        for n in range(self.size):
+            thread = threading.Thread(target=self._loop, args=(n,), name=f"ingestion-{n}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        for thread in self.threads:
+            thread.join()
+
+    def _loop(self, n):
+        if n == 0:
+            # in the thread: the pool can start before the database is usable
+            try:
+                requeue_stale_jobs()
+            except Exception:
+                logger.exception("Could not requeue stale ingestion jobs")
+        while not self.stopping.is_set():
+            close_old_connections()
+            try:
+                job = claim_next_job()
+                if job is not None:
+                    run_job(job)
+                    # a steady stream of uploads shouldn't hold the indexes back forever
+                    flush_course_indexes(older_than=settings.INGESTION_COURSE_INDEX_DELAY)
+                    continue
+                flush_course_indexes()
+            except Exception:
+                logger.exception("Ingestion worker error")
+            self.wakeup.wait(self.poll_interval)
+            self.wakeup.clear()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(settings.INGESTION_WORKERS, settings.INGESTION_POLL_INTERVAL).start()
+        return _pool
+
+
+def wake_workers():
+    if settings.INGESTION_RUN_IN_PROCESS:
+        get_pool().wakeup.set()
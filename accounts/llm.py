@@ -0,0 +1,146 @@
+"""Ollama clients used by the chat views.
+
+One ``ollama.Client`` is shared by every thread of the process. It is
+configured from settings (``OLLAMA_HOSTS``, timeouts, HTTP connection pool
+limits) and created in ``AccountsConfig.ready()``, which can also load the
+chat model in the background so the first question doesn't pay for it.
+Every request passes ``OLLAMA_KEEP_ALIVE`` so the model stays resident
+between questions.
+
+With several Ollama servers in ``OLLAMA_HOSTS``, a request can name a
+``route`` (the document or course it is about) and always lands on the
+same server, whose prompt cache already holds that document's prefix.
+Within one server Ollama picks the parallel slot with the longest
+matching prefix itself.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+import weakref
+import zlib
+
+import httpx
+import ollama
+from django.conf import settings
+
+from .metrics import LLM_DURATION, LLM_TOKENS_PER_SECOND
+
+logger = logging.getLogger(__name__)
+
+_clients = {}
+_client_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def client_options():
+    """Keyword arguments for ``ollama.Client``/``AsyncClient`` (passed on to httpx)"""
+    return {
+        "timeout": httpx.Timeout(settings.OLLAMA_TIMEOUT, connect=settings.OLLAMA_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(
+            max_connections=settings.OLLAMA_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.OLLAMA_MAX_CONNECTIONS,
+        ),
+    }
+
+
+def pick_host(route=None):
+    hosts = settings.OLLAMA_HOSTS
+    if route is None or len(hosts) == 1:
+        return hosts[0]
+    return hosts[zlib.crc32(route.encode()) % len(hosts)]
+
+
+def get_client(route=None):
+    """The process-wide ``ollama.Client`` (for the server ``route`` maps to)"""
+    return _client_for(pick_host(route))
+
+
+def _client_for(host):
+    client = _clients.get(host)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(host)
+            if client is None:
+                client = _clients[host] = ollama.Client(host=host, **client_options())
+    return client
+
+
+def get_async_client(route=None):
+    """An ``ollama.AsyncClient`` for the running event loop.
+
+    The underlying httpx connection pool is bound to the loop it was
+    created on, so each loop (normally just the ASGI server's) gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.setdefault(loop, {})
+    host = pick_host(route)
+    if host not in clients:
+        clients[host] = ollama.AsyncClient(host=host, **client_options())
+    return clients[host]
+
+
+def chat(route=None, **kwargs):
+    """``ollama.chat`` on the shared client, defaulting the model and keep_alive"""
+    kwargs.setdefault("model", settings.CHAT_MODEL)
+    kwargs.setdefault("keep_alive", settings.OLLAMA_KEEP_ALIVE)
+    start = time.perf_counter()
+    try:
+        response = get_client(route).chat(**kwargs)
+    except Exception:
+        LLM_DURATION.observe(time.perf_counter() - start, model=kwargs["model"], outcome="error")
+        raise
+    if kwargs.get("stream"):
+        return _observe_stream(response, kwargs["model"], start)
+    observe(response, kwargs["model"], start)
+    return response
+
+
+async def achat(route=None, **kwargs):
+    """Async ``chat`` on this event loop's client"""
+    kwargs.setdefault("model", settings.CHAT_MODEL)
+    kwargs.setdefault("keep_alive", settings.OLLAMA_KEEP_ALIVE)
+    start = time.perf_counter()
+    try:
+        response = await get_async_client(route).chat(**kwargs)
+    except Exception:
+        LLM_DURATION.observe(time.perf_counter() - start, model=kwargs["model"], outcome="error")
+        raise
+    observe(response, kwargs["model"], start)
+    return response
+
+
+def observe(response, model, start):
+    """Record a finished generation's duration and speed in the metrics"""
+    LLM_DURATION.observe(time.perf_counter() - start, model=model, outcome="ok")
+    tokens, nanoseconds = response.get("eval_count"), response.get("eval_duration")
+    if tokens and nanoseconds:
+        LLM_TOKENS_PER_SECOND.observe(tokens / (nanoseconds / 1e9), model=model)
+
+
+def _observe_stream(chunks, model, start):
+    try:
+        for chunk in chunks:
+            if chunk.get("done"):
+                observe(chunk, model, start)
+            yield chunk
+    except Exception:
+        LLM_DURATION.observe(time.perf_counter() - start, model=model, outcome="error")
+        raise
+
+
+def warm_up():
+    """Load the chat model into memory; a chat with no messages only loads it"""
+    for host in settings.OLLAMA_HOSTS:
+        try:
+            _client_for(host).chat(model=settings.CHAT_MODEL, messages=[], keep_alive=settings.OLLAMA_KEEP_ALIVE)
+            logger.info("Loaded %s on %s", settings.CHAT_MODEL, host)
+        except Exception as e:
+            logger.info("Warming up %s on %s failed: %s", settings.CHAT_MODEL, host, e)
+
+
+def warm_up_in_background():
+    thread = threading.Thread(target=warm_up, name="ollama-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,38 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.chat_log import summarize
+
+
+class Command(BaseCommand):
+    help = "Report chat generation speed, prefill/decode split and model reloads per time window"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--bucket", choices=["hour", "day"], default="hour")
+        parser.add_argument("--days", type=float, default=7, help="how far back to look")
+        parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(days=options["days"])
+        summary = summarize(options["bucket"], since)
+        if options["json"]:
+            self.stdout.write(json.dumps(summary, indent=2, default=str))
+            return
+        if not summary:
+            self.stdout.write("No chats logged in this period")
+            return
+
+        def number(value, fmt):
+            return "-" if value is None else format(value, fmt)
+
+        self.stdout.write(f"{'window':<18}{'requests':>9}{'cached':>8}{'prefill tok/s':>15}"
+                          f"{'decode tok/s':>14}{'prefill %':>11}{'loads':>7}{'load s':>8}")
+        for row in summary:
+            self.stdout.write(
+                f"{row['window']:%Y-%m-%d %H:%M}  {row['requests']:>9}{row['cache_hits']:>8}"
+                f"{number(row['prefill_tokens_per_s'], '.0f'):>15}{number(row['decode_tokens_per_s'], '.1f'):>14}"
+                f"{number(row['prefill_share'], '.0%'):>11}{row['model_loads']:>7}{row['load_seconds']:>8.1f}"
+            )
@@ -0,0 +1,22 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.ingestion import WorkerPool
+
+
+class Command(BaseCommand):
+    help = "Run the upload ingestion workers (extraction, chunking, indexing) in the foreground"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=settings.INGESTION_WORKERS)
+
+    def handle(self, *args, **options):
+        pool = WorkerPool(options["workers"], settings.INGESTION_POLL_INTERVAL).start()
+        self.stdout.write(f"Ingestion workers running ({options['workers']}), Ctrl-C to stop")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pool.stop()
@@ -0,0 +1,27 @@
+import shutil
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from accounts.models import UploadedFile
+from accounts.retrieval import build_course_index
+from accounts.vector_index import embed_file
+
+
+class Command(BaseCommand):
+    help = "Rebuild every course's BM25 index and embedding matrix from the stored chunks"
+
+    def handle(self, *args, **options):
+        # drop everything, including files under keys no course uses any more
+        root = Path(settings.RETRIEVAL_INDEX_ROOT)
+        for directory in ("courses", "vectors"):
+            shutil.rmtree(root / directory, ignore_errors=True)
+
+        files = UploadedFile.objects.filter(status="ready").only("id", "content_hash", "course_name")
+        for uploaded_file in files.iterator():
+            embed_file(uploaded_file)   # from the embedding cache when it has the file
+        courses = set(files.values_list("course_name", flat=True).order_by().distinct())
+        for course_name in courses:
+            build_course_index(course_name)
+        self.stdout.write(f"Rebuilt {len(courses)} course indexes from {files.count()} files")
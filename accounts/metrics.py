@@ -0,0 +1,396 @@
+"""Prometheus metrics for the backend, served at ``/metrics``.
+
+A small in-process registry of counters, gauges and histograms (no client
+library or external service). Updates take a per-metric lock, so views,
+ingestion workers and the async loop can record concurrently.
+
+A deployment usually runs several worker processes, and the scrape lands
+on just one of them. With ``METRICS_DIR`` set, every process writes a
+snapshot of its metrics to ``<METRICS_DIR>/<pid>.json`` every
+``METRICS_FLUSH_INTERVAL`` seconds (and at exit); ``/metrics`` sums the
+snapshots of all processes, so counters survive worker restarts. Gauges
+of processes that are no longer running are dropped. Use one directory
+per host and empty it when the service is (re)deployed.
+
+Gauges with a ``function`` (the ingestion queue depth) are computed by
+the scraping process when ``/metrics`` is requested.
+"""
+
+import atexit
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}    # label values -> value
+        if not self.labelnames and self.kind != "histogram":
+            self.values[()] = 0
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            return {key: self._copy(value) for key, value in self.values.items()}
+
+    @staticmethod
+    def _copy(value):
+        return value
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        REGISTRY.changed()
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        # ``function`` returns {label values: value}, evaluated at scrape time
+        self.function = function
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+        REGISTRY.changed()
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = value
+        REGISTRY.changed()
+
+    def samples(self):
+        if self.function is not None:
+            return {tuple(map(str, key)): value for key, value in self.function().items()}
+        return super().samples()
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            # per-bucket counts (not cumulative), then the sum
+            counts = self.values.get(key)
+            if counts is None:
+                counts = self.values[key] = [0] * len(self.buckets) + [0.0]
+            counts[next(n for n, bound in enumerate(self.buckets) if value <= bound)] += 1
+            counts[-1] += value
+        REGISTRY.changed()
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def _copy(value):
+        return list(value)
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.dirty = threading.Event()
+        self.flusher = None
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def changed(self):
+        self.dirty.set()
+
+    # -- multiprocess ----------------------------------------------------
+
+    def snapshot(self):
+        """This process's samples, in the form written to ``METRICS_DIR``"""
+        return {
+            name: [[list(key), value] for key, value in metric.samples().items()]
+            for name, metric in self.metrics.items()
+            if not getattr(metric, "function", None)
+        }
+
+    def flush(self):
+        if not settings.METRICS_DIR:
+            return
+        self.dirty.clear()
+        directory = Path(settings.METRICS_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{os.getpid()}.json"
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.snapshot()))
+        os.replace(tmp_path, path)
+
+    def start_flusher(self):
+        """Write this process's snapshot periodically while it changes"""
+        if not settings.METRICS_DIR or self.flusher is not None:
+            return
+        interval = settings.METRICS_FLUSH_INTERVAL
+
+        def loop():
+            while True:
+                self.dirty.wait()
+                self.flush()
+                time.sleep(interval)
+
+        self.flusher = threading.Thread(target=loop, name="metrics-flush", daemon=True)
+        self.flusher.start()
+        atexit.register(self.flush)
+
+    def _other_processes(self):
+        if not settings.METRICS_DIR:
+            return
+        for path in Path(settings.METRICS_DIR).glob("*.json"):
+            pid = int(path.stem)
+            if pid == os.getpid():
+                continue
+            try:
+                yield pid, json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue    # removed or being replaced; next scrape gets it
+
+    # -- exposition ------------------------------------------------------
+
+    def collect(self):
+        """``{name: {label values: value}}`` summed over every process"""
+        merged = {name: metric.samples() for name, metric in self.metrics.items()}
+        for pid, snapshot in self._other_processes():
+            alive = _is_alive(pid)
+            for name, samples in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None or (metric.kind == "gauge" and not alive):
+                    continue
+                values = merged[name]
+                for key, value in samples:
+                    key = tuple(key)
+                    if key not in values:
+                        values[key] = value
+                    elif metric.kind == "histogram":
+                        values[key] = [a + b for a, b in zip(values[key], value)]
+                    else:
+                        values[key] += value
+        return merged
+
+    def render(self):
+        """The Prometheus text exposition format"""
+        merged = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in sorted(merged[name].items()):
+                labels = dict(zip(metric.labelnames, key))
+                if metric.kind != "histogram":
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    le = "+Inf" if bound == math.inf else _number(bound)
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': le})} {_number(cumulative)}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+                lines.append(f"{name}_count{_labels(labels)} {_number(cumulative)}")
+        lines.extend(_hit_ratios(merged))
+        return "\n".join(lines) + "\n"
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value):
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+REGISTRY = Registry()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# -- metrics ---------------------------------------------------------------
+
+def _ingestion_queue_depth():
+    from django.db import DatabaseError
+    from django.db.models import Count
+
+    from .models import IngestionJob
+
+    depth = {("queued",): 0, ("running",): 0}
+    rows = (IngestionJob.objects.filter(status__in=["queued", "running"])
+            .values_list("status").annotate(count=Count("id")).order_by())
+    try:
+        for status, count in rows:
+            depth[(status,)] = count
+    except DatabaseError:
+        logger.warning("Could not count ingestion jobs", exc_info=True)
+        return {}   # the rest of /metrics is still worth serving
+    return depth
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, by route",
+    ["route", "method", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+REQUESTS_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served")
+LLM_DURATION = Histogram(
+    "llm_request_duration_seconds", "Duration of Ollama chat calls", ["model", "outcome"],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300),
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_generation_tokens_per_second", "Generation speed reported by Ollama", ["model"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200, 400),
+)
+INGESTION_QUEUE_DEPTH = Gauge(
+    "ingestion_jobs", "Ingestion jobs waiting or being processed", ["status"], function=_ingestion_queue_depth,
+)
+INGESTION_JOBS = Counter("ingestion_jobs_finished_total", "Ingestion job attempts by outcome", ["outcome"])
+EXTRACTION_DURATION = Histogram(
+    "extraction_duration_seconds", "Text extraction time per file", ["file_type"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+CACHE_LOOKUPS = Counter(
+    "chat_cache_lookups_total", "Answer cache lookups by result (exact hit, semantic hit or miss)", ["result"],
+)
+
+
+def _hit_ratios(merged):
+    """``chat_cache_hit_ratio``: hits / lookups over all processes, per cache tier"""
+    lookups = {key[0]: value for key, value in merged[CACHE_LOOKUPS.name].items()}
+    total = sum(lookups.values())
+    lines = [
+        "# HELP chat_cache_hit_ratio Share of chat questions answered from the cache, by tier",
+        "# TYPE chat_cache_hit_ratio gauge",
+    ]
+    for tier in ("exact", "semantic"):
+        ratio = lookups.get(tier, 0) / total if total else 0.0
+        lines.append(f'chat_cache_hit_ratio{{tier="{tier}"}} {_number(ratio)}')
+    return lines
+
+
+class MetricsMiddleware:
+    """Records latency per route and the number of requests in flight"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            REQUESTS_IN_FLIGHT.dec()
+            raise
+        return self._finish(request, response, start)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            response = await self.get_response(request)
+        except BaseException:
+            REQUESTS_IN_FLIGHT.dec()
+            raise
+        return self._finish(request, response, start)
+
+    def _finish(self, request, response, start):
+        match = request.resolver_match
+        labels = {
+            # the URL pattern, not the path, so ids don't explode the label set
+            "route": match.route if match else "<unmatched>",
+            "method": request.method,
+            "status": response.status_code,
+        }
+
+        def done():
+            REQUESTS_IN_FLIGHT.dec()
+            REQUEST_DURATION.observe(time.perf_counter() - start, **labels)
+
+        if not response.streaming:
+            done()
+        elif response.is_async:
+            response.streaming_content = _aafter(response.streaming_content, done)
+        else:
+            response.streaming_content = _after(response.streaming_content, done)
+        return response
+
+
+def _after(content, callback):
+    try:
+        yield from content
+    finally:
+        callback()
+
+
+async def _aafter(content, callback):
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        callback()
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:40
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def mark_existing_files_ready(apps, schema_editor):
+    # files uploaded before the queue existed were extracted inline
+    UploadedFile = apps.get_model('accounts', 'UploadedFile')
+    UploadedFile.objects.update(status='ready', progress=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_documentchunk'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='progress',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.RunPython(mark_existing_files_ready, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='jobs', to='accounts.uploadedfile')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='accounts_in_status_555adb_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.7 on 2026-10-18 11:45
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_files(apps, schema_editor):
+    # existing files stay where they are; hashing them lets new uploads of
+    # the same content reuse their extracted text
+    UploadedFile = apps.get_model('accounts', 'UploadedFile')
+    for uploaded in UploadedFile.objects.exclude(file=''):
+        digest = hashlib.sha256()
+        try:
+            with uploaded.file.open('rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(chunk)
+        except FileNotFoundError:
+            continue
+        uploaded.content_hash = digest.hexdigest()
+        uploaded.save(update_fields=['content_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_ingestion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedfile',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(hash_existing_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:16
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_conversation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('endpoint', models.CharField(max_length=10)),
+                ('model', models.CharField(blank=True, max_length=100)),
+                ('course_name', models.CharField(blank=True, max_length=100)),
+                ('cache', models.CharField(choices=[('miss', 'Miss'), ('exact', 'Exact hit'), ('semantic', 'Semantic hit')], default='miss', max_length=10)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('prompt_eval_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('eval_count', models.PositiveIntegerField(blank=True, null=True)),
+                ('total_duration', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('load_duration', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('prompt_eval_duration', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('eval_duration', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('file', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chat_logs', to='accounts.uploadedfile')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_chatlog'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['professor', 'course_name', '-uploaded_at'], name='accounts_up_profess_f61c2f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='uploadedfile',
+            index=models.Index(fields=['professor', '-uploaded_at'], name='accounts_up_profess_b5b46b_idx'),
+        ),
+    ]
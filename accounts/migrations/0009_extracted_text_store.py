@@ -0,0 +1,57 @@
+# Generated by Django 5.2.7 on 2026-10-18 12:54
+
+import zlib
+
+from django.db import migrations, models
+
+
+def move_text_to_store(apps, schema_editor):
+    # one compressed copy per content hash; rows from before hashing keep their own
+    UploadedFile = apps.get_model('accounts', 'UploadedFile')
+    ExtractedText = apps.get_model('accounts', 'ExtractedText')
+    batch, seen = [], set()
+    rows = UploadedFile.objects.exclude(extracted_text=None).values_list('id', 'content_hash', 'extracted_text')
+    for file_id, content_hash, text in rows.iterator(chunk_size=100):
+        key = content_hash or f'file-{file_id}'
+        if key in seen:
+            continue
+        seen.add(key)
+        batch.append(ExtractedText(key=key, data=zlib.compress(text.encode(), 6), length=len(text)))
+        if len(batch) == 100:
+            ExtractedText.objects.bulk_create(batch)
+            batch = []
+    ExtractedText.objects.bulk_create(batch)
+
+
+def move_text_back(apps, schema_editor):
+    UploadedFile = apps.get_model('accounts', 'UploadedFile')
+    ExtractedText = apps.get_model('accounts', 'ExtractedText')
+    for stored in ExtractedText.objects.iterator(chunk_size=100):
+        text = zlib.decompress(stored.data).decode()
+        if stored.key.startswith('file-'):
+            UploadedFile.objects.filter(id=int(stored.key[len('file-'):])).update(extracted_text=text)
+        else:
+            UploadedFile.objects.filter(content_hash=stored.key).update(extracted_text=text)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_uploadedfile_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExtractedText',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('length', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.RunPython(move_text_to_store, move_text_back),
+        migrations.RemoveField(
+            model_name='uploadedfile',
+            name='extracted_text',
+        ),
+    ]
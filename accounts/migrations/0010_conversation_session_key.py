@@ -0,0 +1,20 @@
+# Generated by Django 5.2.7 on 2026-10-18 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_extracted_text_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='session_key',
+            # existing conversations belong to no session and can't be resumed
+            field=models.CharField(db_index=True, default='', max_length=40),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+def queue_unindexed_files(apps, schema_editor):
+    # 0004 marked files uploaded before the queue ready, but they were never
+    # chunked, indexed or embedded; the ingestion workers do all of it
+    UploadedFile = apps.get_model('accounts', 'UploadedFile')
+    IngestionJob = apps.get_model('accounts', 'IngestionJob')
+    files = (UploadedFile.objects.filter(status='ready', chunks__isnull=True)
+             .exclude(jobs__status__in=('queued', 'running')))
+    ids = list(files.values_list('id', flat=True).distinct())
+    UploadedFile.objects.filter(id__in=ids).update(status='pending', progress=0)
+    IngestionJob.objects.bulk_create([IngestionJob(file_id=file_id) for file_id in ids])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_conversation_session_key'),
+    ]
+
+    operations = [
+        migrations.RunPython(queue_unindexed_files, migrations.RunPython.noop),
+    ]
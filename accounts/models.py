@@ -1,5 +1,9 @@
+import uuid
+import zlib
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.utils import timezone
 
 class UserProfile(models.Model):
     USER_TYPE_CHOICES = (
@@ -18,14 +22,196 @@ class UploadedFile(models.Model):
         ("pdf", "PDF"),
         ("docx", "Word Document"),
     )
+    STATUS_CHOICES = (
+        ("pending", "Pending"),
+        ("processing", "Processing"),
+        ("ready", "Ready"),
+        ("failed", "Failed"),
+    )
     
     professor = models.ForeignKey(User, on_delete=models.CASCADE, related_name="uploaded_files")
     file = models.FileField(upload_to="uploads/%Y/%m/%d/")
     file_type = models.CharField(max_length=10, choices=FILE_TYPE_CHOICES)
     original_filename = models.CharField(max_length=255)
-    extracted_text = models.TextField(blank=True, null=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the file
     uploaded_at = models.DateTimeField(auto_now_add=True)
     course_name = models.CharField(max_length=100, blank=True, null=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="pending")
+    progress = models.PositiveSmallIntegerField(default=0)  # percent of ingestion done
+    
+    class Meta:
+        indexes = [
+            # the file list: a professor's files (optionally one course), newest first
+            models.Index(fields=["professor", "course_name", "-uploaded_at"]),
+            models.Index(fields=["professor", "-uploaded_at"]),
+        ]
+    
+    def __str__(self):
+        return f"{self.original_filename} by {self.professor.username}"
+    
+    # The extracted text lives compressed in ExtractedText, loaded on first
+    # access; assigning it is written there when the file is saved.
+    
+    @property
+    def text_key(self):
+        return self.content_hash or f"file-{self.pk}"
+    
+    @property
+    def extracted_text(self):
+        if "_extracted_text" not in self.__dict__:
+            data = ExtractedText.objects.filter(key=self.text_key).values_list("data", flat=True).first()
+            self._extracted_text = ExtractedText.decompress(data) if data is not None else None
+        return self._extracted_text
+    
+    @extracted_text.setter
+    def extracted_text(self, text):
+        self._extracted_text = text
+        self._text_changed = True
+    
+    @property
+    def extracted_text_length(self):
+        """Characters of extracted text, without loading it"""
+        if "_extracted_text" in self.__dict__:
+            return len(self._extracted_text or "")
+        return ExtractedText.objects.filter(key=self.text_key).values_list("length", flat=True).first() or 0
+    
+    def save_extracted_text(self, text):
+        self.extracted_text = text
+        ExtractedText.store(self.text_key, text)
+        self._text_changed = False
+    
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        if self.__dict__.get("_text_changed"):
+            self.save_extracted_text(self._extracted_text)
     
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop("_extracted_text", None)
+
+class ExtractedText(models.Model):
+    """zlib-compressed text of an upload, shared by uploads with the same content"""
+    COMPRESSION_LEVEL = 6
+    
+    # the content hash, or "file-<id>" for files stored before hashing
+    key = models.CharField(primary_key=True, max_length=64)
+    data = models.BinaryField()
+    length = models.PositiveIntegerField()  # characters, uncompressed
+    
+    @classmethod
+    def compress(cls, text):
+        return zlib.compress(text.encode(), cls.COMPRESSION_LEVEL)
+    
+    @staticmethod
+    def decompress(data):
+        return zlib.decompress(data).decode()
+    
+    @classmethod
+    def store(cls, key, text):
+        if text is None:
+            cls.objects.filter(key=key).delete()
+        else:
+            cls.objects.update_or_create(key=key, defaults={"data": cls.compress(text), "length": len(text)})
+    
+    def __str__(self):
+        return f"Text {self.key} ({self.length} characters)"
+
+class DocumentChunk(models.Model):
+    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name="chunks")
+    position = models.PositiveIntegerField()
+    text = models.TextField()
+
+    class Meta:
+        ordering = ["file", "position"]
+        unique_together = ("file", "position")
+
+    def __str__(self):
+        return f"{self.file.original_filename} [{self.position}]"
+
+
+class IngestionJob(models.Model):
+    """Queued extraction/indexing work for an uploaded file"""
+    STATUS_CHOICES = (
+        ("queued", "Queued"),
+        ("running", "Running"),
+        ("done", "Done"),
+        ("failed", "Failed"),
+    )
+
+    file = models.ForeignKey(UploadedFile, on_delete=models.CASCADE, related_name="jobs")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_after"])]
+
+    def __str__(self):
+        return f"Job {self.id} for {self.file.original_filename} ({self.status})"
+
+
+class Conversation(models.Model):
+    """A student's chat session; the id is the client's handle on it"""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # the Django session that started it; only that session may read or extend it
+    session_key = models.CharField(max_length=40, db_index=True)
+    summary = models.TextField(blank=True)
+    # messages up to and including this id are folded into the summary
+    summarized_until = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Conversation {self.id}"
+
+
+class Message(models.Model):
+    ROLE_CHOICES = (
+        ("user", "User"),
+        ("assistant", "Assistant"),
+    )
+
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name="messages")
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    content = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"{self.role}: {self.content[:40]}"
+
+
+class ChatLog(models.Model):
+    """Ollama usage of one chat request, for capacity planning"""
+    CACHE_CHOICES = (
+        ("miss", "Miss"),
+        ("exact", "Exact hit"),
+        ("semantic", "Semantic hit"),
+    )
+
+    # when the request was answered; rows are written later, in batches
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    endpoint = models.CharField(max_length=10)
+    model = models.CharField(max_length=100, blank=True)
+    # no database constraint: logs outlive files and are inserted in bulk
+    file = models.ForeignKey(UploadedFile, on_delete=models.SET_NULL, null=True, blank=True,
+                             db_constraint=False, related_name="chat_logs")
+    course_name = models.CharField(max_length=100, blank=True)
+    cache = models.CharField(max_length=10, choices=CACHE_CHOICES, default="miss")
+    prompt_tokens = models.PositiveIntegerField(default=0)  # our estimate, before sending
+    # as reported by Ollama (durations in nanoseconds); empty for cache hits
+    prompt_eval_count = models.PositiveIntegerField(null=True, blank=True)
+    eval_count = models.PositiveIntegerField(null=True, blank=True)
+    total_duration = models.PositiveBigIntegerField(null=True, blank=True)
+    load_duration = models.PositiveBigIntegerField(null=True, blank=True)
+    prompt_eval_duration = models.PositiveBigIntegerField(null=True, blank=True)
+    eval_duration = models.PositiveBigIntegerField(null=True, blank=True)
+
     def __str__(self):
-        return f"{self.original_filename} by {self.professor.username}"
\ No newline at end of file
+        return f"{self.endpoint} at {self.created_at:%Y-%m-%d %H:%M:%S} ({self.cache})"
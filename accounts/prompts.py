@@ -0,0 +1,188 @@
+"""Prompt assembly shared by the chat endpoints.
+
+The layout is kept deterministic so Ollama can reuse its prompt (KV)
+cache across requests: the fixed instruction comes first, then the
+context blocks in document order rather than rank order, then the
+conversation. Follow-up questions about the same material then share a
+long prefix with the previous prompt and only the tail is re-evaluated.
+A document small enough (``PROMPT_PIN_DOCUMENT_TOKENS``) is pinned: it is
+sent whole, so every question about it starts with the same context.
+"""
+
+from collections import namedtuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import UploadedFile
+from .retrieval import rank_chunks, rank_course_chunks
+from .tokens import get_tokenizer, truncate
+
+SYSTEM_INSTRUCTION = "You are a helpful study assistant. Answer questions based on the course materials concisely."
+
+MESSAGE_OVERHEAD = 4        # role header and end-of-turn tokens of the chat template
+MIN_PARTIAL_TOKENS = 48     # don't bother keeping a shortened excerpt or turn below this
+
+# ``order`` places the excerpt in the prompt: chunk ids follow upload order
+# and position in the file, so sorting by them gives document order
+Excerpt = namedtuple("Excerpt", "filename text order")
+
+
+def is_pinned(file):
+    """Whether a file is small enough to send whole instead of retrieving from it"""
+    limit = settings.PROMPT_PIN_DOCUMENT_TOKENS
+    # nothing to send until ingestion has stored the text
+    if not limit or file.status != "ready" or not file.extracted_text_length:
+        return False
+    # a token is at least a character or two, so skip loading big documents
+    if file.extracted_text_length > 8 * limit:
+        return False
+    return get_tokenizer().count(file.extracted_text or "") <= limit
+
+
+def file_excerpts(file, question, query_vector=None):
+    if is_pinned(file):
+        return [Excerpt(file.original_filename, file.extracted_text, 0)]
+    return [
+        Excerpt(file.original_filename, text, chunk_id)
+        for chunk_id, text in rank_chunks(file, question, query_vector=query_vector)
+    ]
+
+
+def unready_file(file_id):
+    """The file asked about, if it exists but has not been ingested yet (or failed)"""
+    if not file_id:
+        return None
+    return UploadedFile.objects.filter(id=file_id).exclude(status="ready").first()
+
+
+def unready_error(file):
+    if file.status == "failed":
+        return f"{file.original_filename} could not be processed; ask your professor to upload it again"
+    return f"{file.original_filename} is still being processed; try again in a moment"
+
+
+def build_context(question, file_id=None, course_name=None, query_vector=None):
+    """Retrieved ``Excerpt``s for a question, best first, and the file asked about.
+
+    ``query_vector`` is the question's embedding if the answer cache already
+    computed it (``Lookup.vector``), so the question is embedded only once.
+    """
+    # Get the most relevant chunks of the file if file_id provided
+    if file_id:
+        try:
+            file = UploadedFile.objects.get(id=file_id)
+        except UploadedFile.DoesNotExist:
+            return [], None
+        return file_excerpts(file, question, query_vector), file
+
+    if course_name is not None:
+        # "All materials": best chunks from every file of the course ("" is
+        # the files uploaded without one)
+        return [
+            Excerpt(filename, text, chunk_id)
+            for chunk_id, filename, text in rank_course_chunks(course_name, question, query_vector=query_vector)
+        ], None
+
+    return [], None
+
+
+async def abuild_context(question, file_id=None, course_name=None, query_vector=None):
+    """Async variant of ``build_context`` for the ASGI chat view"""
+    if file_id:
+        try:
+            file = await UploadedFile.objects.aget(id=file_id)
+        except UploadedFile.DoesNotExist:
+            return [], None
+        return await sync_to_async(file_excerpts)(file, question, query_vector), file
+
+    if course_name is not None:
+        return await sync_to_async(build_context)(question, None, course_name, query_vector)
+
+    return [], None
+
+
+def prompt_budget():
+    """Tokens the prompt may use: the context window minus room for the answer"""
+    return settings.CHAT_CONTEXT_WINDOW - settings.CHAT_RESPONSE_TOKENS
+
+
+def build_messages(excerpts, chat_history, question, budget=None, tokenizer=None):
+    """Chat messages that fit in ``budget`` tokens, and the tokens they use.
+
+    The budget is filled in priority order: the system instruction and the
+    question always go in, then retrieved excerpts best first, then the
+    conversation newest turn first. The turn that no longer fits is
+    shortened if there is reasonable room left, and older ones are dropped.
+    Excerpts that made it in are laid out by ``order`` (plain
+    ``(filename, text)`` pairs keep their rank order).
+    """
+    budget = budget or prompt_budget()
+    tokenizer = tokenizer or get_tokenizer()
+
+    def cost(text):
+        return tokenizer.count(text) + MESSAGE_OVERHEAD
+
+    question_tokens = cost(question)
+    if question_tokens > budget // 2:
+        question = truncate(question, budget // 2 - MESSAGE_OVERHEAD, tokenizer)
+        question_tokens = cost(question)
+    system_tokens = cost(SYSTEM_INSTRUCTION)
+    remaining = budget - system_tokens - question_tokens
+
+    # Retrieved context
+    blocks = []
+    for rank, excerpt in enumerate(excerpts):
+        filename, text = excerpt[0], excerpt[1]
+        block = f"Context from {filename}:\n{text}\n\n"
+        tokens = tokenizer.count(block)
+        if tokens > remaining and remaining >= MIN_PARTIAL_TOKENS:
+            block = truncate(block.rstrip(), remaining - 2, tokenizer) + "\n\n"
+            tokens = tokenizer.count(block)
+        if tokens > remaining:
+            break
+        blocks.append((getattr(excerpt, "order", rank), block))
+        remaining -= tokens
+    context_tokens = budget - system_tokens - question_tokens - remaining
+
+    # Conversation, newest turn first
+    history = []
+    compressed = 0
+    for msg in reversed(chat_history):
+        content = msg['content']
+        tokens = cost(content)
+        if tokens > remaining and remaining - MESSAGE_OVERHEAD >= MIN_PARTIAL_TOKENS:
+            content = truncate(content, remaining - MESSAGE_OVERHEAD, tokenizer)
+            tokens = cost(content)
+            compressed += 1
+        if tokens > remaining:
+            break
+        history.insert(0, {'role': msg['role'], 'content': content})
+        remaining -= tokens
+
+    # stable instruction first, then context in canonical order: a shared prefix
+    context = "".join(block for _, block in sorted(blocks, key=lambda b: b[0]))
+    messages = [{
+        'role': 'system',
+        'content': f"{SYSTEM_INSTRUCTION}\n\n{context}".rstrip()
+    }]
+    messages.extend(history)
+    messages.append({
+        'role': 'user',
+        'content': question
+    })
+
+    usage = {
+        "budget": budget,
+        "used": budget - remaining,
+        "system": system_tokens,
+        "context": context_tokens,
+        "history": budget - system_tokens - question_tokens - context_tokens - remaining,
+        "question": question_tokens,
+        "excerpts_used": len(blocks),
+        "excerpts_dropped": len(excerpts) - len(blocks),
+        "turns_used": len(history),
+        "turns_compressed": compressed,
+        "turns_dropped": len(chat_history) - len(history),
+    }
+    return messages, usage
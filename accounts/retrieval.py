@@ -0,0 +1,394 @@
+"""Chunking and BM25 retrieval over extracted course material.
+
+Extracted text is split into overlapping word windows at ingest time and
+stored as ``DocumentChunk`` rows. Each file also gets an inverted index
+(terms -> postings) saved as a ``.npz`` next to the other retrieval
+artifacts, so answering a question only tokenizes the question and does a
+few NumPy gathers instead of re-reading the whole document.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import models
+from django.utils.text import slugify
+
+try:
+    import fcntl
+except ImportError:     # Windows: writers are only serialized within a process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def chunk_text(text, chunk_words=None, overlap=None):
+    """Split text into overlapping windows of roughly ``chunk_words`` words"""
+    chunk_words = chunk_words or settings.RETRIEVAL_CHUNK_WORDS
+    overlap = settings.RETRIEVAL_CHUNK_OVERLAP if overlap is None else overlap
+    step = max(chunk_words - overlap, 1)
+
+    words = (text or "").split()
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + chunk_words]))
+        if start + chunk_words >= len(words):
+            break
+    return chunks
+
+
+class BM25Index:
+    """Inverted index over a list of chunks, scored with Okapi BM25.
+
+    Postings are stored term-major (CSC style): the documents containing
+    term ``t`` are ``doc[indptr[t]:indptr[t + 1]]``. ``ids`` maps internal
+    document numbers back to whatever the caller indexed (chunk positions
+    for a single file, chunk primary keys for a course).
+    """
+
+    def __init__(self, terms, indptr, doc, tf, doc_len, ids):
+        self.terms = terms
+        self.indptr = indptr
+        self.doc = doc
+        self.tf = tf
+        self.doc_len = doc_len
+        self.ids = ids
+
+        n_docs = len(doc_len)
+        df = np.diff(indptr).astype(np.float32)
+        self.idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        avg_len = float(doc_len.mean()) if n_docs else 0.0
+        self.norm = (BM25_K1 * (1 - BM25_B + BM25_B * doc_len / (avg_len or 1.0))).astype(np.float32)
+
+    def __len__(self):
+        return len(self.doc_len)
+
+    @classmethod
+    def build(cls, texts, ids=None):
+        ids = np.arange(len(texts)) if ids is None else np.asarray(ids)
+
+        term_list, doc_list, tf_list = [], [], []
+        doc_len = np.zeros(len(texts), dtype=np.float32)
+        for n, text in enumerate(texts):
+            tokens = tokenize(text)
+            doc_len[n] = len(tokens)
+            for term, count in Counter(tokens).items():
+                term_list.append(term)
+                doc_list.append(n)
+                tf_list.append(count)
+
+        terms, term_idx = np.unique(np.array(term_list, dtype=str), return_inverse=True)
+        order = np.lexsort((np.array(doc_list, dtype=np.int64), term_idx))
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_idx, minlength=len(terms)), out=indptr[1:])
+
+        return cls(
+            terms=terms,
+            indptr=indptr,
+            doc=np.array(doc_list, dtype=np.int32)[order],
+            tf=np.array(tf_list, dtype=np.float32)[order],
+            doc_len=doc_len,
+            ids=ids.astype(np.int64),
+        )
+
+    @classmethod
+    def merge(cls, parts):
+        """Combine ``(index, ids)`` pairs into one index without re-tokenizing"""
+        parts = [(index, np.asarray(ids)) for index, ids in parts if len(index)]
+        if not parts:
+            return cls.build([])
+
+        terms = np.unique(np.concatenate([index.terms for index, _ in parts]))
+        term_idx, docs, tfs, doc_lens = [], [], [], []
+        offset = 0
+        for index, _ in parts:
+            remap = np.searchsorted(terms, index.terms)
+            term_idx.append(np.repeat(remap, np.diff(index.indptr)))
+            docs.append(index.doc.astype(np.int64) + offset)
+            tfs.append(index.tf)
+            doc_lens.append(index.doc_len)
+            offset += len(index)
+
+        term_idx = np.concatenate(term_idx)
+        docs = np.concatenate(docs)
+        order = np.lexsort((docs, term_idx))
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_idx, minlength=len(terms)), out=indptr[1:])
+
+        return cls(
+            terms=terms,
+            indptr=indptr,
+            doc=docs[order].astype(np.int32),
+            tf=np.concatenate(tfs)[order],
+            doc_len=np.concatenate(doc_lens),
+            ids=np.concatenate([ids for _, ids in parts]).astype(np.int64),
+        )
+
+    def search(self, query, k):
+        """Return up to ``k`` ``(id, score)`` pairs, best first"""
+        if not len(self) or not len(self.terms):
+            return []
+
+        query_terms = np.unique(np.array(tokenize(query), dtype=str))
+        slots = np.searchsorted(self.terms, query_terms)
+        in_range = slots < len(self.terms)
+        slots, query_terms = slots[in_range], query_terms[in_range]
+        term_ids = slots[self.terms[slots] == query_terms]
+        if not len(term_ids):
+            return []
+
+        spans = [np.arange(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        postings = np.concatenate(spans)
+        weights = np.repeat(self.idf[term_ids], [len(s) for s in spans])
+
+        docs = self.doc[postings]
+        tf = self.tf[postings]
+        contrib = weights * tf * (BM25_K1 + 1) / (tf + self.norm[docs])
+        scores = np.bincount(docs, weights=contrib, minlength=len(self))
+
+        k = min(k, len(self))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(self.ids[n]), float(scores[n])) for n in top if scores[n] > 0]
+
+    def save(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # a temp name of our own, so concurrent saves never share one
+        with tempfile.NamedTemporaryFile(dir=path.parent, suffix=".tmp.npz", delete=False) as tmp:
+            try:
+                np.savez(
+                    tmp,
+                    terms=self.terms,
+                    indptr=self.indptr,
+                    doc=self.doc,
+                    tf=self.tf,
+                    doc_len=self.doc_len,
+                    ids=self.ids,
+                )
+            except BaseException:
+                os.unlink(tmp.name)
+                raise
+        os.replace(tmp.name, path)
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        return _load_cached(str(path), path.stat().st_mtime_ns)
+
+
+@lru_cache(maxsize=256)
+def _load_cached(path, mtime_ns):
+    with np.load(path) as data:
+        return BM25Index(**{name: data[name] for name in data.files})
+
+
+_local_locks = {}
+
+
+@contextmanager
+def index_lock(path):
+    """Serialize writers of an index file, across threads and processes"""
+    lock_path = Path(f"{path}.lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+    with _local_locks.setdefault(str(lock_path), threading.Lock()):
+        if fcntl is None:
+            yield
+            return
+        with open(lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def course_key(course_name):
+    """File name for a course's indexes: readable, but distinct for every exact course name"""
+    if not course_name:
+        return "_uncategorized"
+    # slugs collide ('CS 101', 'cs 101', 'CS-101'; every non-ASCII name is empty)
+    digest = hashlib.sha256(course_name.encode()).hexdigest()[:16]
+    return f"{slugify(course_name) or 'course'}-{digest}"
+
+
+def file_index_path(uploaded_file):
+    # keyed by content so identical uploads share one index
+    key = uploaded_file.content_hash or uploaded_file.id
+    return Path(settings.RETRIEVAL_INDEX_ROOT) / "files" / f"{key}.npz"
+
+
+def index_file(uploaded_file):
+    """(Re)build the chunks and BM25 index for one uploaded file"""
+    from .models import DocumentChunk
+
+    texts = chunk_text(uploaded_file.extracted_text)
+    uploaded_file.chunks.all().delete()
+    DocumentChunk.objects.bulk_create([
+        DocumentChunk(file=uploaded_file, position=n, text=text)
+        for n, text in enumerate(texts)
+    ])
+    index = BM25Index.build(texts)
+    index.save(file_index_path(uploaded_file))
+    return index
+
+
+def copy_chunks(source, uploaded_file):
+    """Give a file the chunks of an identical, already indexed file"""
+    from .models import DocumentChunk
+
+    uploaded_file.chunks.all().delete()
+    DocumentChunk.objects.bulk_create([
+        DocumentChunk(file=uploaded_file, position=position, text=text)
+        for position, text in source.chunks.values_list("position", "text")
+    ])
+
+
+def get_file_index(uploaded_file):
+    """The file's index, or None until its ingestion job has built it"""
+    path = file_index_path(uploaded_file)
+    if not path.exists():
+        return None
+    return BM25Index.load(path)
+
+
+def delete_file_index(uploaded_file):
+    file_index_path(uploaded_file).unlink(missing_ok=True)
+
+
+def course_index_path(course_name):
+    return Path(settings.RETRIEVAL_INDEX_ROOT) / "courses" / f"{course_key(course_name)}.npz"
+
+
+def course_files(course_name):
+    from .models import UploadedFile
+
+    if course_name:
+        return UploadedFile.objects.filter(course_name=course_name)
+    return UploadedFile.objects.filter(models.Q(course_name="") | models.Q(course_name__isnull=True))
+
+
+def build_course_index(course_name):
+    """Merge the per-file indexes of a course into one combined index.
+
+    Documents of the combined index are chunk primary keys, so a single
+    search ranks chunks across every file of the course. Only ready files
+    are included; a file still being ingested is added by the rebuild at
+    the end of its own job.
+    """
+    from .models import DocumentChunk
+
+    path = course_index_path(course_name)
+    with index_lock(path):
+        files = course_files(course_name).filter(status="ready")
+        chunk_ids = {}
+        rows = DocumentChunk.objects.filter(file__in=files)
+        for chunk_id, file_id, position in rows.values_list("id", "file_id", "position"):
+            chunk_ids[file_id, position] = chunk_id
+
+        parts = []
+        for uploaded_file in files.only("id", "content_hash"):
+            file_path = file_index_path(uploaded_file)
+            if not file_path.exists():
+                # never re-index here: that is the ingestion job's work
+                logger.warning("File %s has no index; left out of the course index", uploaded_file.id)
+                continue
+            index = BM25Index.load(file_path)
+            ids = [chunk_ids.get((uploaded_file.id, int(p)), -1) for p in index.ids]
+            parts.append((index, ids))
+
+        index = BM25Index.merge(parts)
+        index.save(path)
+    return index
+
+
+def get_course_index(course_name):
+    path = course_index_path(course_name)
+    if not path.exists():
+        return build_course_index(course_name)
+    return BM25Index.load(path)
+
+
+def reciprocal_rank_fusion(*rankings, k=60):
+    """Merge ranked lists of keys; keys ranked high in several lists win"""
+    scores = Counter()
+    for ranking in rankings:
+        for rank, key in enumerate(ranking):
+            scores[key] += 1.0 / (k + rank + 1)
+    return [key for key, _ in scores.most_common()]
+
+
+def retrieve_chunks(uploaded_file, question, k=None):
+    """Top-k chunk texts of a file for a question, best match first"""
+    return [text for _, text in rank_chunks(uploaded_file, question, k)]
+
+
+def rank_chunks(uploaded_file, question, k=None, query_vector=None):
+    """Top-k ``(chunk id, text)`` pairs of a file for a question, best match first.
+
+    Lexical (BM25) and semantic (embedding) hits are merged with reciprocal
+    rank fusion; either tier may be empty.
+    """
+    from .vector_index import semantic_search
+
+    k = k or settings.RETRIEVAL_TOP_K
+    index = get_file_index(uploaded_file)
+    positions = [position for position, _ in index.search(question, k)] if index is not None else []
+
+    chunk_ids = uploaded_file.chunks.values_list("id", flat=True)
+    semantic_ids = [
+        chunk_id for chunk_id, _ in
+        semantic_search(uploaded_file.course_name, question, k, chunk_ids=chunk_ids, query_vector=query_vector)
+    ]
+    if not positions and not semantic_ids:
+        positions = list(range(k))
+
+    rows = uploaded_file.chunks.filter(
+        models.Q(position__in=positions) | models.Q(id__in=semantic_ids)
+    ).values_list("id", "position", "text")
+    by_position = {position: (chunk_id, text) for chunk_id, position, text in rows}
+    by_id = {chunk_id: text for chunk_id, text in by_position.values()}
+
+    lexical_ids = [by_position[p][0] for p in positions if p in by_position]
+    ranked = reciprocal_rank_fusion(lexical_ids, semantic_ids)
+    return [(chunk_id, by_id[chunk_id]) for chunk_id in ranked[:k] if chunk_id in by_id]
+
+
+def retrieve_course_chunks(course_name, question, k=None):
+    """Top-k ``(filename, chunk text)`` pairs across every file of a course"""
+    return [(filename, text) for _, filename, text in rank_course_chunks(course_name, question, k)]
+
+
+def rank_course_chunks(course_name, question, k=None, query_vector=None):
+    """Top-k ``(chunk id, filename, chunk text)`` across every file of a course, best first"""
+    from .models import DocumentChunk
+    from .vector_index import semantic_search
+
+    k = k or settings.RETRIEVAL_TOP_K
+    lexical_ids = [chunk_id for chunk_id, _ in get_course_index(course_name).search(question, k)]
+    semantic_ids = [chunk_id for chunk_id, _ in semantic_search(course_name, question, k, query_vector=query_vector)]
+    ranked = reciprocal_rank_fusion(lexical_ids, semantic_ids)[:k]
+
+    rows = DocumentChunk.objects.filter(id__in=ranked).values_list(
+        "id", "file__original_filename", "text"
+    )
+    by_id = {chunk_id: (filename, text) for chunk_id, filename, text in rows}
+    return [(chunk_id, *by_id[chunk_id]) for chunk_id in ranked if chunk_id in by_id]
@@ -0,0 +1,210 @@
+"""Admission control for LLM generations.
+
+Ollama runs a handful of generations at a time and queues the rest
+internally, so a burst of chats just makes everyone time out together.
+``Scheduler`` caps concurrent generations at ``LLM_MAX_CONCURRENT``;
+further requests wait in a bounded queue and are admitted round-robin
+across keys (courses, or files/clients when no course is given) so one
+busy course can't starve the others. When ``LLM_MAX_QUEUED`` requests are
+already waiting, or a request has waited ``LLM_MAX_WAIT`` seconds, it is
+rejected with ``Busy`` and an estimate of when to retry.
+
+Waiters are ``concurrent.futures.Future`` objects, so threads (WSGI
+views) block on ``result()`` and coroutines (the ASGI view) await them
+without holding a thread. The limits apply per process.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import asynccontextmanager, contextmanager
+
+from django.conf import settings
+
+from .timing import span
+
+
+class Busy(Exception):
+    """No generation slot is available; retry after ``retry_after`` seconds"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"The assistant is busy, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    def __init__(self, key):
+        self.key = key
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        self.granted_at = None
+
+
+class Scheduler:
+    def __init__(self, max_active, max_queued, max_wait):
+        self.max_active = max_active
+        self.max_queued = max_queued
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.active = 0
+        self.queues = OrderedDict()     # key -> deque of waiting tickets, in round-robin order
+        self.queued = 0
+        self.avg_service = 5.0          # seconds a generation holds a slot (moving average)
+        self.waits = deque(maxlen=1000)
+        self.admitted = 0
+        self.rejected = 0
+
+    # -- admission -------------------------------------------------------
+
+    def is_full(self):
+        with self.lock:
+            return self.active >= self.max_active and self.queued >= self.max_queued
+
+    def retry_after(self):
+        """Rough seconds until a new request would get a slot"""
+        backlog = (self.queued + 1) / self.max_active
+        return max(1, math.ceil(backlog * self.avg_service))
+
+    def _submit(self, key):
+        ticket = Ticket(key)
+        with self.lock:
+            if self.active < self.max_active and not self.queued:
+                self._grant(ticket)
+                return ticket
+            if self.queued >= self.max_queued:
+                self.rejected += 1
+                raise Busy(self.retry_after())
+            self.queues.setdefault(key, deque()).append(ticket)
+            self.queued += 1
+        return ticket
+
+    def _grant(self, ticket):
+        # caller holds the lock
+        self.active += 1
+        self.admitted += 1
+        ticket.granted_at = time.monotonic()
+        self.waits.append(ticket.granted_at - ticket.enqueued_at)
+        ticket.future.set_result(ticket)
+
+    def _next_waiter(self):
+        # caller holds the lock; take the oldest ticket of the next key in turn
+        while self.queues:
+            key, waiting = next(iter(self.queues.items()))
+            ticket = waiting.popleft()
+            self.queued -= 1
+            if waiting:
+                self.queues.move_to_end(key)
+            else:
+                del self.queues[key]
+            if ticket.future.set_running_or_notify_cancel():
+                return ticket
+        return None
+
+    def release(self, ticket):
+        with self.lock:
+            held = time.monotonic() - ticket.granted_at
+            self.avg_service = 0.9 * self.avg_service + 0.1 * held
+            self.active -= 1
+            waiter = self._next_waiter()
+            if waiter is not None:
+                self._grant(waiter)
+
+    def _abandon(self, ticket):
+        """Withdraw a ticket whose caller gave up waiting"""
+        with self.lock:
+            waiting = self.queues.get(ticket.key)
+            if waiting is not None and ticket in waiting:
+                waiting.remove(ticket)
+                self.queued -= 1
+                if not waiting:
+                    del self.queues[ticket.key]
+                self.rejected += 1
+                return
+        if ticket.granted_at is not None:
+            # the slot arrived just as we gave up: pass it on
+            self.release(ticket)
+
+    def acquire(self, key):
+        """Block until a slot is free; raises ``Busy``"""
+        ticket = self._submit(key)
+        try:
+            return ticket.future.result(timeout=self.max_wait)
+        except FutureTimeout:
+            self._abandon(ticket)
+            raise Busy(self.retry_after())
+
+    async def aacquire(self, key):
+        """Wait for a slot without blocking the event loop; raises ``Busy``"""
+        ticket = self._submit(key)
+        try:
+            return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(ticket.future)), self.max_wait)
+        except asyncio.TimeoutError:
+            self._abandon(ticket)
+            raise Busy(self.retry_after())
+        except asyncio.CancelledError:
+            self._abandon(ticket)
+            raise
+
+    @contextmanager
+    def slot(self, key):
+        with span("queue"):
+            ticket = self.acquire(key)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, key):
+        with span("queue"):
+            ticket = await self.aacquire(key)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    # -- metrics ---------------------------------------------------------
+
+    def stats(self):
+        with self.lock:
+            waits = sorted(self.waits)
+            return {
+                "active": self.active,
+                "max_active": self.max_active,
+                "queued": self.queued,
+                "max_queued": self.max_queued,
+                "queued_by_key": {key: len(waiting) for key, waiting in self.queues.items()},
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "avg_wait_s": sum(waits) / len(waits) if waits else 0.0,
+                "p95_wait_s": waits[min(int(len(waits) * 0.95), len(waits) - 1)] if waits else 0.0,
+                "avg_generation_s": self.avg_service,
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = Scheduler(settings.LLM_MAX_CONCURRENT, settings.LLM_MAX_QUEUED, settings.LLM_MAX_WAIT)
+    return _scheduler
+
+
+def fairness_key(request, file_id=None, course_name=None):
+    """What requests take turns by: the course, else the file, else the client.
+
+    Also used to route requests to an Ollama server (see ``llm.pick_host``).
+    """
+    if course_name is not None:
+        return f"course:{course_name}"
+    if file_id:
+        return f"file:{file_id}"
+    return f"client:{request.META.get('REMOTE_ADDR', '')}"
@@ -0,0 +1,86 @@
+"""In-process cache of answers to paraphrased questions.
+
+Answered questions are embedded and kept in a fixed-size float32 matrix.
+A new question is compared against the rows recorded for the same
+context (file/course, document version and chat history) with one
+vectorized dot product; the closest one is reused if its cosine
+similarity reaches ``SEMANTIC_CACHE_THRESHOLD``. When the matrix is full
+the least recently used row is overwritten.
+"""
+
+import hashlib
+import threading
+
+import numpy as np
+
+
+def context_id(context):
+    """A 63-bit integer id for a context string, so rows can be filtered with NumPy"""
+    return int.from_bytes(hashlib.sha256(context.encode()).digest()[:8], "big") >> 1
+
+
+class SemanticCache:
+    def __init__(self, capacity, threshold):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.lock = threading.Lock()
+        self.vectors = None
+        self.contexts = np.zeros(capacity, dtype=np.int64)
+        self.entries = [None] * capacity
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.clock = 0
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _tick(self, row):
+        self.clock += 1
+        self.last_used[row] = self.clock
+
+    def get(self, context, vector):
+        with self.lock:
+            rows = np.flatnonzero(self.contexts[:self.size] == context_id(context))
+            if self.vectors is None or not len(rows) or self.vectors.shape[1] != len(vector):
+                self.misses += 1
+                return None
+
+            scores = self.vectors[rows] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._tick(rows[best])
+            return self.entries[rows[best]]
+
+    def put(self, context, vector, entry):
+        with self.lock:
+            if self.vectors is None or self.vectors.shape[1] != len(vector):
+                self.vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+                self.size = 0
+            if self.size < self.capacity:
+                row = self.size
+                self.size += 1
+            else:
+                row = int(np.argmin(self.last_used))
+            self.vectors[row] = vector
+            self.contexts[row] = context_id(context)
+            self.entries[row] = entry
+            self._tick(row)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "semantic_hits": self.hits,
+                "semantic_misses": self.misses,
+                "semantic_entries": self.size,
+            }
+
+    def clear(self):
+        with self.lock:
+            self.vectors = None
+            self.contexts[:] = 0
+            self.entries = [None] * self.capacity
+            self.last_used[:] = 0
+            self.size = self.hits = self.misses = 0
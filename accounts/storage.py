@@ -0,0 +1,90 @@
+"""Content-addressed storage for uploaded course files.
+
+Uploads are hashed (SHA-256) while they are written, and stored once under
+``blobs/<aa>/<sha256>.<ext>`` no matter how many ``UploadedFile`` rows
+point at them. A blob, and the extraction/index artifacts derived from
+it, is removed only when the last row referencing its hash is deleted.
+
+Publishing a blob and committing the row that references it happen under
+the hash's ``blob_lock``, as do the last-reference check and the unlink in
+``delete_file``, so a delete can't remove a blob an upload just published.
+"""
+
+import hashlib
+import os
+import tempfile
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+from django.core.files.storage import default_storage
+
+from .models import UploadedFile
+from .retrieval import index_lock
+
+
+def blob_name(content_hash, file_type):
+    return f"blobs/{content_hash[:2]}/{content_hash}.{file_type}"
+
+
+def blob_tempfile(**kwargs):
+    """A temporary file in the blob directory, so it can be renamed into place"""
+    blob_dir = Path(default_storage.path("blobs"))
+    blob_dir.mkdir(parents=True, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=blob_dir, delete=False, **kwargs)
+
+
+@contextmanager
+def blob_lock(*content_hashes):
+    """Hold the locks of some content hashes (across threads and processes)"""
+    with ExitStack() as stack:
+        # always in the same order, so two batches can't deadlock
+        for content_hash in sorted(set(filter(None, content_hashes))):
+            # kept out of blobs/, which should hold nothing but blobs
+            stack.enter_context(index_lock(default_storage.path(f"locks/blobs/{content_hash}")))
+        yield
+
+
+def stage_upload(upload):
+    """Write an upload next to the blobs; returns ``(temporary path, content_hash)``"""
+    if getattr(upload, "content_hash", None):
+        # already written and hashed while the request was parsed
+        # (``uploads.BlobUploadHandler``)
+        upload.file.close()
+        return upload.temporary_file_path(), upload.content_hash
+    digest = hashlib.sha256()
+    with blob_tempfile() as tmp:
+        for chunk in upload.chunks():
+            digest.update(chunk)
+            tmp.write(chunk)
+    return tmp.name, digest.hexdigest()
+
+
+def publish_blob(tmp_name, content_hash, file_type):
+    """Rename a staged upload into the blob store (under its ``blob_lock``); returns its name"""
+    name = blob_name(content_hash, file_type)
+    path = Path(default_storage.path(name))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # replacing an existing blob is harmless: same bytes
+    os.replace(tmp_name, path)
+    return name
+
+
+def find_processed_copy(uploaded_file):
+    """Another, already ingested file with the same content, if any"""
+    if not uploaded_file.content_hash:
+        return None
+    return (
+        UploadedFile.objects.filter(content_hash=uploaded_file.content_hash, status="ready")
+        .exclude(id=uploaded_file.id)
+        .first()
+    )
+
+
+def is_last_reference(uploaded_file):
+    if not uploaded_file.content_hash:
+        return True
+    return not (
+        UploadedFile.objects.filter(content_hash=uploaded_file.content_hash)
+        .exclude(id=uploaded_file.id)
+        .exists()
+    )
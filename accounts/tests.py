@@ -2,9 +2,54 @@ from django.test import TestCase, Client
 from django.contrib.auth.models import User
 from rest_framework.test import APITestCase, APIClient
 from rest_framework import status
-from .models import UserProfile, UploadedFile
+from .models import UserProfile, UploadedFile, IngestionJob, Conversation, ChatLog, ExtractedText
+from .conversations import SUMMARY_INSTRUCTION, refresh_summary
+from .ingestion import process_file, run_pending
+from . import utils
+from . import answer_cache, chat_log, llm, metrics
+from benchmarks.corpus import make_pdf
+from benchmarks.fake_ollama import ANSWER, FakeOllamaServer
+from .retrieval import (
+    BM25Index, chunk_text, index_file, retrieve_chunks,
+    build_course_index, retrieve_course_chunks, course_index_path, file_index_path, get_file_index,
+)
+from .embeddings import HashingEmbedder
+from .semantic_cache import SemanticCache
+from .storage import blob_lock, publish_blob
+from .prompts import SYSTEM_INSTRUCTION, Excerpt, build_context, build_messages, is_pinned
+from .tokens import ApproximateTokenizer
+from .scheduler import Busy, Scheduler
+from .vector_index import embed_file, unembed_file, load_course_vectors, semantic_search
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from django.conf import settings
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
+from django.core.management import call_command
+from django.utils import timezone
+from unittest.mock import AsyncMock, patch
+import asyncio
+import hashlib
+import io
 import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from docx import Document
+import numpy as np
+
+
+def make_docx(*paragraphs):
+    """Build a real DOCX file in memory"""
+    document = Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
 
 
 # Test credential constants (NOT production credentials)
@@ -119,6 +164,7 @@ class UserAuthenticationTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), MEDIA_ROOT=tempfile.mkdtemp())
 class FileUploadTests(APITestCase):
     """Test suite for file upload endpoints"""
 
@@ -192,6 +238,61 @@ class FileUploadTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertEqual(response.data['error'], 'Unsupported file type')
 
+    def test_upload_is_hashed_while_streaming(self):
+        """Test the upload handler stores the blob under the hash it computed, leaving no temp files"""
+        content = b'%PDF-1.4\nstreamed content'
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp()):
+            response = self.client.post(self.upload_url, {
+                'file': SimpleUploadedFile('notes.pdf', content), 'course_name': 'CS 222'
+            }, format='multipart')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            uploaded = UploadedFile.objects.get(id=response.data['file_id'])
+            self.assertEqual(uploaded.content_hash, hashlib.sha256(content).hexdigest())
+            blobs = [p.name for p in Path(settings.MEDIA_ROOT, 'blobs').rglob('*') if p.is_file()]
+            self.assertEqual(blobs, [f'{uploaded.content_hash}.pdf'])
+
+    def test_upload_content_must_match_extension(self):
+        """Test a file whose bytes are not what its name claims is rejected"""
+        response = self.client.post(self.upload_url, {
+            'file': SimpleUploadedFile('notes.pdf', make_docx('Not a PDF')), 'course_name': 'CS 222'
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'File content does not match its type')
+
+    @override_settings(UPLOAD_MAX_MB=1, UPLOAD_COURSE_MAX_MB={'CS 101': 0.001})
+    def test_upload_size_limit_per_course(self):
+        """Test uploads over the course's limit get 413, in the query string or the form"""
+        content = b'%PDF-1.4\n' + b'x' * 2048
+        for url, data in ((self.upload_url + '?course_name=CS%20101', {}), (self.upload_url, {'course_name': 'CS 101'})):
+            response = self.client.post(url, {'file': SimpleUploadedFile('big.pdf', content), **data}, format='multipart')
+            self.assertEqual(response.status_code, 413)
+            self.assertIn('CS 101', response.data['error'])
+        response = self.client.post(self.upload_url, {
+            'file': SimpleUploadedFile('big.pdf', content), 'course_name': 'CS 222'
+        }, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertFalse(UploadedFile.objects.filter(course_name='CS 101').exists())
+
+    def test_batch_upload(self):
+        """Test several files are created with one insert and get a result each"""
+        files = [
+            SimpleUploadedFile('week1.pdf', b'%PDF-1.4\nweek one'),
+            SimpleUploadedFile('notes.txt', b'plain text content'),
+            SimpleUploadedFile('week2.docx', make_docx('Week two')),
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/auth/upload/batch/', {'files': files, 'course_name': 'CS 222'},
+                                        format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['uploaded'], 2)
+        week1, notes, week2 = response.data['files']
+        self.assertEqual((week1['filename'], week1['file_type'], week1['status']), ('week1.pdf', 'pdf', 'pending'))
+        self.assertEqual(notes['error'], 'Unsupported file type')
+        self.assertEqual(IngestionJob.objects.get(id=week2['job_id']).file_id, week2['file_id'])
+        self.assertEqual(UploadedFile.objects.filter(course_name='CS 222').count(), 2)
+        inserts = [q['sql'] for q in queries.captured_queries if q['sql'].startswith('INSERT INTO "accounts_uploadedfile"')]
+        self.assertEqual(len(inserts), 1)
+
     def test_upload_no_file(self):
         """Test upload fails when no file is provided"""
         data = {'course_name': 'CS 222'}
@@ -228,6 +329,27 @@ class FileUploadTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['files'], [])
 
+    def test_list_files_is_paginated(self):
+        """Test the file list is served newest first in keyset pages without the extracted text"""
+        for i in range(5):
+            UploadedFile.objects.create(professor=self.professor, file_type='pdf', original_filename=f'doc_{i}.pdf',
+                                        course_name='CS 222' if i % 2 else 'CS 225', extracted_text='x' * 10000)
+        pages, cursor = [], None
+        while True:
+            params = {'limit': 2, **({'cursor': cursor} if cursor else {})}
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.list_files_url, params)
+            self.assertFalse(any('extracted_text' in q['sql'] for q in queries))
+            pages.append([f['filename'] for f in response.data['files']])
+            cursor = response.data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(pages, [['doc_4.pdf', 'doc_3.pdf'], ['doc_2.pdf', 'doc_1.pdf'], ['doc_0.pdf']])
+
+        course = self.client.get(self.list_files_url, {'course_name': 'CS 222'}).data['files']
+        self.assertEqual([f['filename'] for f in course], ['doc_3.pdf', 'doc_1.pdf'])
+        self.assertEqual(self.client.get(self.list_files_url, {'cursor': 'bogus'}).status_code, 400)
+
     def test_list_files_multiple(self):
         """Test listing multiple uploaded files"""
         # Upload multiple files
@@ -246,6 +368,7 @@ class FileUploadTests(APITestCase):
         self.assertEqual(len(response.data['files']), 3)
 
 
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), MEDIA_ROOT=tempfile.mkdtemp())
 class FileDeleteTests(APITestCase):
     """Test suite for file deletion endpoint"""
 
@@ -292,6 +415,7 @@ class FileDeleteTests(APITestCase):
         self.assertEqual(response.data['error'], 'File not found')
 
 
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), MEDIA_ROOT=tempfile.mkdtemp(), EMBEDDING_BACKEND='hashing')
 class ChatAPITests(APITestCase):
     """Test suite for chat endpoint"""
 
@@ -353,11 +477,10 @@ class ChatAPITests(APITestCase):
             'chat_history': []
         }
         response = self.client.post(self.chat_url, chat_data, format='json')
-        # Response depends on Ollama availability
-        self.assertIn(response.status_code, [status.HTTP_200_OK, status.HTTP_500_INTERNAL_SERVER_ERROR])
-        if response.status_code == status.HTTP_200_OK:
-            self.assertEqual(response.data['question'], 'What is this course about?')
-            self.assertIn('answer', response.data)
+        # the upload is queued for ingestion; nothing is indexed on the request path
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.data['status'], 'pending')
+        self.assertIn('still being processed', response.data['error'])
 
     def test_chat_with_history(self):
         """Test chat endpoint with conversation history"""
@@ -383,6 +506,7 @@ class ChatAPITests(APITestCase):
         self.assertIn(response.status_code, [status.HTTP_200_OK, status.HTTP_500_INTERNAL_SERVER_ERROR])
 
 
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), MEDIA_ROOT=tempfile.mkdtemp(), EMBEDDING_BACKEND='hashing')
 class IntegrationTests(APITestCase):
     """Integration tests for complete workflows"""
 
@@ -468,3 +592,1081 @@ class IntegrationTests(APITestCase):
         professor_profile = UserProfile.objects.get(user__username='test_prof_reg')
         self.assertEqual(student_profile.user_type, 'student')
         self.assertEqual(professor_profile.user_type, 'professor')
+
+
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), EMBEDDING_BACKEND='hashing')
+class RetrievalTests(APITestCase):
+    """Test suite for chunking and BM25 retrieval"""
+
+    def setUp(self):
+        """Create a professor and a file with distinct topics"""
+        answer_cache.reset()
+        self.professor = User.objects.create_user(username=PROF_USERNAME, password=PROF_PASSWORD)
+        UserProfile.objects.create(user=self.professor, user_type='professor')
+        self.file = UploadedFile.objects.create(
+            professor=self.professor,
+            file_type='pdf',
+            original_filename='lecture.pdf',
+            course_name='CS 222',
+            status='ready',
+            extracted_text=(
+                "Sorting algorithms arrange items in order. " * 100
+                + "Big-O notation describes asymptotic runtime growth. " * 100
+                + "Git branches let teams work in parallel. " * 100
+            ),
+        )
+
+    def test_chunk_text_overlaps(self):
+        """Test chunks have the configured size and overlap"""
+        words = [f"w{i}" for i in range(25)]
+        chunks = chunk_text(" ".join(words), chunk_words=10, overlap=2)
+        self.assertEqual(chunks[0].split(), words[:10])
+        self.assertEqual(chunks[1].split()[:2], words[8:10])
+        self.assertEqual(chunks[-1].split()[-1], 'w24')
+
+    def test_bm25_ranks_matching_chunk_first(self):
+        """Test BM25 returns the chunk that matches the query"""
+        index = BM25Index.build(["the cat sat", "dogs bark loudly", "a cat and a dog"])
+        hits = index.search("dogs bark", 2)
+        self.assertEqual(hits[0][0], 1)
+        self.assertEqual(index.search("unknown words", 2), [])
+
+    def test_index_file_creates_chunks(self):
+        """Test indexing stores chunks and answers from the right region"""
+        index_file(self.file)
+        self.assertGreater(self.file.chunks.count(), 1)
+        top = retrieve_chunks(self.file, "what is big-o notation", k=1)
+        self.assertIn("Big-O notation", top[0])
+
+    @patch('accounts.llm.chat')
+    def test_chat_sends_only_top_chunks(self, mock_chat):
+        """Test chat prompt contains retrieved chunks instead of the whole document"""
+        mock_chat.return_value = {'message': {'content': 'It describes growth.'}}
+        index_file(self.file)
+        response = self.client.post('/api/auth/chat/', {
+            'question': 'Explain Big-O notation',
+            'file_id': self.file.id,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        system_prompt = mock_chat.call_args.kwargs['messages'][0]['content']
+        self.assertIn('Big-O notation', system_prompt)
+        self.assertLess(len(system_prompt), len(self.file.extracted_text))
+
+    @patch('accounts.llm.chat')
+    def test_chat_about_unprocessed_file_is_refused(self, mock_chat):
+        """Test chat never indexes a file on the request path"""
+        for file_status, message in (('processing', 'still being processed'), ('failed', 'could not be processed')):
+            UploadedFile.objects.filter(id=self.file.id).update(status=file_status)
+            response = self.client.post('/api/auth/chat/', {
+                'question': 'Explain Big-O notation',
+                'file_id': self.file.id,
+            }, format='json')
+            self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+            self.assertIn(message, response.data['error'])
+        mock_chat.assert_not_called()
+        self.assertIsNone(get_file_index(self.file))
+        self.assertFalse(self.file.chunks.exists())
+
+
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), EMBEDDING_BACKEND='hashing')
+class VectorIndexTests(APITestCase):
+    """Test suite for the per-course embedding index"""
+
+    def setUp(self):
+        """Create an indexed file"""
+        self.professor = User.objects.create_user(username=PROF_USERNAME, password=PROF_PASSWORD)
+        self.file = UploadedFile.objects.create(
+            professor=self.professor,
+            file_type='pdf',
+            original_filename='lecture.pdf',
+            course_name='CS 225',
+            extracted_text=(
+                "Hash tables map keys to buckets. " * 60
+                + "Binary search trees keep keys sorted. " * 60
+            ),
+        )
+        index_file(self.file)
+
+    def test_hashing_embedder_is_deterministic(self):
+        """Test hashing embeddings are stable and normalized"""
+        embedder = HashingEmbedder(dim=64)
+        first = embedder.embed(["binary search trees"])
+        second = embedder.embed(["binary search trees"])
+        self.assertTrue((first == second).all())
+        self.assertAlmostEqual(float((first[0] ** 2).sum()), 1.0, places=5)
+
+    def test_embed_file_writes_memmap(self):
+        """Test chunk vectors are stored in a memory-mapped course matrix"""
+        embed_file(self.file)
+        vectors, ids = load_course_vectors('CS 225')
+        self.assertIsInstance(vectors, np.memmap)
+        self.assertEqual(len(ids), self.file.chunks.count())
+
+        hits = semantic_search('CS 225', 'hash tables and buckets', 1)
+        top_chunk = self.file.chunks.get(id=hits[0][0])
+        self.assertIn('Hash tables', top_chunk.text)
+
+    def test_embed_file_again_replaces_rows(self):
+        """Test embedding a file twice (a retried job) doesn't duplicate its rows"""
+        embed_file(self.file)
+        embed_file(self.file)
+        vectors, ids = load_course_vectors('CS 225')
+        self.assertEqual(sorted(ids), sorted(self.file.chunks.values_list('id', flat=True)))
+
+    def test_reingest_drops_old_chunk_vectors(self):
+        """Test re-processing a file leaves no vectors of its old chunks behind"""
+        self.file.file_type = 'docx'
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp()):
+            embed_file(self.file)
+            self.file.file.save('lecture.docx', SimpleUploadedFile('lecture.docx', make_docx('Graphs have edges.')))
+            process_file(self.file)
+            vectors, ids = load_course_vectors('CS 225')
+        self.assertEqual(sorted(ids), sorted(self.file.chunks.values_list('id', flat=True)))
+
+    @patch('accounts.llm.chat')
+    def test_chat_embeds_the_question_once(self, mock_chat):
+        """Test the answer cache and retrieval share one embedding of the question"""
+        mock_chat.return_value = {'message': {'content': 'Buckets.'}}
+        answer_cache.reset()
+        UploadedFile.objects.filter(id=self.file.id).update(status='ready')
+        embed_file(self.file)
+        with patch.object(HashingEmbedder, 'embed', autospec=True, side_effect=HashingEmbedder.embed) as embed:
+            response = self.client.post('/api/auth/chat/', {
+                'question': 'How do hash tables use buckets?',
+                'file_id': self.file.id,
+            }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('Hash tables', mock_chat.call_args.kwargs['messages'][0]['content'])
+        self.assertEqual(embed.call_count, 1)
+
+    def test_unembed_file_removes_rows(self):
+        """Test deleting a file removes its vectors"""
+        embed_file(self.file)
+        unembed_file(self.file)
+        vectors, ids = load_course_vectors('CS 225')
+        self.assertEqual(len(ids), 0)
+
+
+@override_settings(EMBEDDING_BACKEND='hashing')
+class CourseRetrievalTests(APITestCase):
+    """Test suite for retrieval across all materials of a course"""
+
+    def setUp(self):
+        """Create two indexed files in one course and one elsewhere"""
+        answer_cache.reset()
+        # per test: file ids are reused after each rollback, and so would their indexes
+        self.enterContext(override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp()))
+        self.professor = User.objects.create_user(username=PROF_USERNAME, password=PROF_PASSWORD)
+        texts = {
+            ('graphs.pdf', 'CS 374'): "Dijkstra finds shortest paths in weighted graphs. " * 50,
+            ('dp.pdf', 'CS 374'): "Dynamic programming memoizes overlapping subproblems. " * 50,
+            ('other.pdf', 'CS 100'): "Dijkstra also appears in an unrelated course. " * 50,
+        }
+        for (filename, course), text in texts.items():
+            uploaded = UploadedFile.objects.create(
+                professor=self.professor,
+                file_type='pdf',
+                original_filename=filename,
+                course_name=course,
+                extracted_text=text,
+                status='ready',
+            )
+            index_file(uploaded)
+
+    def test_merge_matches_single_build(self):
+        """Test merging per-file indexes scores like building one index"""
+        a, b = ["red apples", "green pears"], ["red cars", "blue apples"]
+        merged = BM25Index.merge([(BM25Index.build(a), [1, 2]), (BM25Index.build(b), [3, 4])])
+        built = BM25Index.build(a + b, ids=[1, 2, 3, 4])
+        self.assertEqual(merged.search("red apples", 4), built.search("red apples", 4))
+
+    def test_course_search_spans_files(self):
+        """Test course retrieval picks the best chunks from any file in the course"""
+        build_course_index('CS 374')
+        hits = retrieve_course_chunks('CS 374', 'memoizes overlapping subproblems', k=1)
+        self.assertEqual(hits[0][0], 'dp.pdf')
+        hits = retrieve_course_chunks('CS 374', 'shortest paths dijkstra', k=10)
+        self.assertNotIn('other.pdf', {filename for filename, _ in hits})
+
+    def test_courses_differing_in_case_are_kept_apart(self):
+        """Test course names that slugify alike get their own indexes"""
+        secret = UploadedFile.objects.create(
+            professor=self.professor, file_type='pdf', original_filename='secret.pdf', course_name='cs 374',
+            extracted_text='The midterm answer key. ' * 20, status='ready',
+        )
+        index_file(secret)
+        build_course_index('cs 374')
+        build_course_index('CS 374')
+        hits = retrieve_course_chunks('CS 374', 'midterm answer key', k=10)
+        self.assertNotIn('secret.pdf', {filename for filename, _ in hits})
+        self.assertEqual(retrieve_course_chunks('cs 374', 'midterm answer key', k=1)[0][0], 'secret.pdf')
+        self.assertNotEqual(course_index_path('数据结构'), course_index_path('Физика'))
+
+    def test_course_index_skips_files_not_ready(self):
+        """Test building the course index never indexes a file still being ingested"""
+        pending = UploadedFile.objects.create(
+            professor=self.professor, file_type='pdf', original_filename='pending.pdf',
+            course_name='CS 374', extracted_text='Pending material about heaps.', status='processing',
+        )
+        build_course_index('CS 374')
+        self.assertFalse(pending.chunks.exists())
+        self.assertFalse(file_index_path(pending).exists())
+        hits = retrieve_course_chunks('CS 374', 'heaps', k=10)
+        self.assertNotIn('pending.pdf', {filename for filename, _ in hits})
+
+    def test_concurrent_saves_of_one_index(self):
+        """Test saving one index from several threads at once doesn't fail"""
+        index, path = BM25Index.build(["red apples", "green pears"]), course_index_path('CS 374')
+        errors = []
+
+        def save():
+            try:
+                for _ in range(20):
+                    index.save(path)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=save) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(list(path.parent.glob('*.tmp.npz')), [])
+
+    @patch('accounts.llm.chat')
+    def test_chat_all_materials_uses_course_context(self, mock_chat):
+        """Test chat without file_id but with a course sends course context"""
+        mock_chat.return_value = {'message': {'content': 'Use Dijkstra.'}}
+        response = self.client.post('/api/auth/chat/', {
+            'question': 'How do I find shortest paths?',
+            'course_name': 'CS 374',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        system_prompt = mock_chat.call_args.kwargs['messages'][0]['content']
+        self.assertIn('Context from graphs.pdf', system_prompt)
+
+    @patch('accounts.llm.chat')
+    def test_chat_uncategorized_uses_files_without_course(self, mock_chat):
+        """Test an empty course name means the files uploaded without a course"""
+        mock_chat.return_value = {'message': {'content': 'A trie.'}}
+        loose = UploadedFile.objects.create(
+            professor=self.professor, file_type='pdf', original_filename='loose.pdf', course_name='',
+            extracted_text='A trie stores strings by shared prefixes. ' * 20, status='ready',
+        )
+        index_file(loose)
+        response = self.client.post('/api/auth/chat/', {
+            'question': 'What stores strings by prefix?',
+            'course_name': '',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        system_prompt = mock_chat.call_args.kwargs['messages'][0]['content']
+        self.assertIn('Context from loose.pdf', system_prompt)
+        self.assertNotIn('graphs.pdf', system_prompt)
+
+
+@override_settings(EMBEDDING_BACKEND='hashing')
+class ChatStreamTests(APITestCase):
+    """Test suite for the server-sent events chat endpoint"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.stream_url = '/api/auth/chat/stream/'
+        answer_cache.reset()
+
+    def read_events(self, response):
+        body = b"".join(response.streaming_content).decode()
+        return [json.loads(line[len('data: '):]) for line in body.split('\n\n') if line]
+
+    @patch('accounts.llm.chat')
+    def test_stream_relays_tokens(self, mock_chat):
+        """Test each Ollama chunk becomes one event, followed by a done event"""
+        mock_chat.return_value = iter([
+            {'message': {'content': 'Big'}},
+            {'message': {'content': '-O'}},
+            {'message': {'content': ''}},
+        ])
+        response = self.client.post(self.stream_url, {'question': 'What is Big-O?'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = self.read_events(response)
+        self.assertEqual([e['token'] for e in events if 'token' in e], ['Big', '-O'])
+        self.assertTrue(events[-1]['done'])
+        self.assertTrue(mock_chat.call_args.kwargs['stream'])
+
+    @patch('accounts.llm.chat', side_effect=ConnectionError('Ollama down'))
+    def test_stream_reports_errors(self, mock_chat):
+        """Test model errors are sent as an error event"""
+        response = self.client.post(self.stream_url, {'question': 'Hi'}, format='json')
+        self.assertEqual(self.read_events(response), [{'error': 'Ollama down'}])
+
+    def test_stream_missing_question(self):
+        """Test streaming fails when question is missing"""
+        response = self.client.post(self.stream_url, {}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), EMBEDDING_BACKEND='hashing')
+class AsyncChatTests(APITestCase):
+    """Test suite for the async (ASGI) chat endpoint"""
+
+    def setUp(self):
+        self.async_url = '/api/auth/chat/async/'
+        answer_cache.reset()
+
+    @patch('accounts.llm.get_async_client')
+    def test_async_chat_awaits_ollama(self, mock_get_client):
+        """Test the async view awaits AsyncClient.chat and returns the answer"""
+        mock_get_client.return_value.chat = AsyncMock(
+            return_value={'message': {'content': 'Paris'}}
+        )
+        response = self.client.post(
+            self.async_url, {'question': 'Capital of France?'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['answer'], 'Paris')
+        self.assertIsNone(response.json()['file_used'])
+
+    @patch('accounts.llm.get_async_client')
+    def test_async_chat_with_file(self, mock_get_client):
+        """Test the async view loads the file with the async ORM"""
+        mock_get_client.return_value.chat = AsyncMock(
+            return_value={'message': {'content': 'Testing.'}}
+        )
+        professor = User.objects.create_user(username=PROF_USERNAME, password=PROF_PASSWORD)
+        uploaded = UploadedFile.objects.create(
+            professor=professor, file_type='pdf', original_filename='notes.pdf',
+            extracted_text='CS 222 covers software testing.', status='ready',
+        )
+        response = self.client.post(
+            self.async_url, {'question': 'What is covered?', 'file_id': uploaded.id},
+            content_type='application/json'
+        )
+        self.assertEqual(response.json()['file_used'], 'notes.pdf')
+
+    def test_async_chat_missing_question(self):
+        """Test the async view validates the question"""
+        response = self.client.post(self.async_url, {}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['error'], 'No question provided')
+
+    def test_async_chat_rejects_get(self):
+        """Test the async view only accepts POST"""
+        response = self.client.get(self.async_url)
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+@override_settings(
+    RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), MEDIA_ROOT=tempfile.mkdtemp(),
+    EMBEDDING_BACKEND='hashing', INGESTION_RETRY_BACKOFF=5,
+)
+class IngestionTests(APITestCase):
+    """Test suite for background ingestion of uploads"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.post('/api/auth/register/', {
+            'username': PROF_USERNAME,
+            'password': PROF_PASSWORD,
+            'email': PROF_EMAIL,
+            'user_type': 'professor'
+        }, format='json')
+
+    def upload(self, name, content):
+        upload_file = SimpleUploadedFile(name, content)
+        return self.client.post('/api/auth/upload/', {'file': upload_file, 'course_name': 'CS 222'}, format='multipart')
+
+    def test_upload_returns_before_extraction(self):
+        """Test upload queues a job instead of extracting inline"""
+        response = self.upload('notes.docx', make_docx('Unit tests catch regressions.'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'pending')
+        uploaded = UploadedFile.objects.get(id=response.data['file_id'])
+        self.assertIsNone(uploaded.extracted_text)
+        self.assertTrue(IngestionJob.objects.filter(id=response.data['job_id'], status='queued').exists())
+
+    def test_worker_extracts_and_indexes(self):
+        """Test running the queue extracts text, chunks it and marks the file ready"""
+        response = self.upload('notes.docx', make_docx('Unit tests catch regressions.'))
+        self.assertEqual(run_pending(), 1)
+
+        uploaded = UploadedFile.objects.get(id=response.data['file_id'])
+        self.assertEqual(uploaded.status, 'ready')
+        self.assertEqual(uploaded.progress, 100)
+        self.assertIn('Unit tests', uploaded.extracted_text)
+        self.assertTrue(uploaded.chunks.exists())
+
+        files = self.client.get('/api/auth/files/').data['files']
+        self.assertEqual((files[0]['status'], files[0]['progress']), ('ready', 100))
+        job = self.client.get(f"/api/auth/jobs/{response.data['job_id']}/").data
+        self.assertEqual(job['status'], 'done')
+
+    def test_batch_rebuilds_course_index_once(self):
+        """Test the course index is rebuilt once the queue is drained, not after every file"""
+        files = [SimpleUploadedFile(f'notes{n}.docx', make_docx(f'Lecture {n} covers recursion.')) for n in range(3)]
+        self.client.post('/api/auth/upload/batch/', {'files': files, 'course_name': 'CS 222'}, format='multipart')
+        with patch('accounts.ingestion.build_course_index') as rebuild:
+            self.assertEqual(run_pending(), 3)
+        rebuild.assert_called_once_with('CS 222')
+
+    def test_failed_job_is_retried_with_backoff(self):
+        """Test a failing job is requeued with a delay, then marked failed"""
+        response = self.upload('broken.pdf', b'%PDF-1.4 not really a pdf')
+        run_pending()
+        job = IngestionJob.objects.get(id=response.data['job_id'])
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_after, job.started_at)
+        self.assertEqual(run_pending(), 0)  # not due yet
+
+        IngestionJob.objects.update(run_after=timezone.now())
+        with override_settings(INGESTION_RETRY_BACKOFF=0):
+            run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 3))
+        self.assertEqual(UploadedFile.objects.get(id=job.file_id).status, 'failed')
+
+    def test_migration_queues_files_marked_ready_without_chunks(self):
+        """Test files from before the queue are ingested instead of staying unindexed"""
+        from importlib import import_module
+        from django.apps import apps
+        migration = import_module('accounts.migrations.0011_queue_unindexed_files')
+        professor = User.objects.get(username=PROF_USERNAME)
+        legacy = UploadedFile.objects.create(professor=professor, file_type='pdf', original_filename='old.pdf',
+                                             status='ready', progress=100)
+        response = self.upload('notes.docx', make_docx('Unit tests catch regressions.'))
+        run_pending()
+
+        migration.queue_unindexed_files(apps, None)
+        legacy.refresh_from_db()
+        self.assertEqual((legacy.status, legacy.progress), ('pending', 0))
+        self.assertTrue(legacy.jobs.filter(status='queued').exists())
+        # already indexed: left alone
+        self.assertEqual(IngestionJob.objects.filter(file_id=response.data['file_id']).count(), 1)
+
+
+class PdfExtractionTests(TestCase):
+    """Test suite for single-process and parallel PDF extraction"""
+
+    def setUp(self):
+        with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as f:
+            f.write(make_pdf(pages=6, words_per_page=20))
+        self.path = f.name
+        self.addCleanup(os.remove, self.path)
+
+    def test_small_pdf_is_extracted_in_page_order(self):
+        """Test serial extraction returns every page in order"""
+        text = utils.extract_text_from_pdf(self.path)
+        positions = [text.index(f"Page {n}") for n in range(1, 7)]
+        self.assertEqual(positions, sorted(positions))
+
+    @patch.multiple(utils, PDF_PARALLEL_MIN_PAGES=2, PDF_PAGES_PER_TASK=4, PDF_MAX_PROCESSES=2)
+    def test_parallel_extraction_matches_serial(self):
+        """Test the process pool path joins page ranges in order"""
+        progress = []
+        parallel = utils.extract_text_from_pdf(self.path, progress=lambda done, total: progress.append(done))
+        with patch.object(utils, 'PDF_PARALLEL_MIN_PAGES', 100):
+            serial = utils.extract_text_from_pdf(self.path)
+        self.assertEqual(parallel, serial)
+        self.assertEqual(progress, [4, 6])
+
+
+@override_settings(
+    MEDIA_ROOT=tempfile.mkdtemp(),
+    RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(),
+    EMBEDDING_BACKEND='hashing',
+)
+class DeduplicationTests(APITestCase):
+    """Test suite for content-addressed storage of uploads"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.post('/api/auth/register/', {
+            'username': PROF_USERNAME,
+            'password': PROF_PASSWORD,
+            'email': PROF_EMAIL,
+            'user_type': 'professor'
+        }, format='json')
+        self.content = make_docx('The syllabus lists the midterm date.')
+
+    def upload(self, name, course_name):
+        upload_file = SimpleUploadedFile(name, self.content)
+        response = self.client.post('/api/auth/upload/', {'file': upload_file, 'course_name': course_name}, format='multipart')
+        return UploadedFile.objects.get(id=response.data['file_id'])
+
+    def test_identical_uploads_share_one_blob(self):
+        """Test re-uploading the same bytes stores them once"""
+        first = self.upload('syllabus.docx', 'CS 222 Fall')
+        second = self.upload('syllabus-copy.docx', 'CS 222 Spring')
+        self.assertEqual(len(first.content_hash), 64)
+        self.assertEqual(first.content_hash, second.content_hash)
+        self.assertEqual(first.file.name, second.file.name)
+
+    def test_reupload_reuses_extraction(self):
+        """Test the second copy is ingested without extracting again"""
+        self.upload('syllabus.docx', 'CS 222 Fall')
+        run_pending()
+        second = self.upload('syllabus.docx', 'CS 222 Spring')
+        with patch('accounts.ingestion.extract_text') as mock_extract:
+            run_pending()
+        mock_extract.assert_not_called()
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'ready')
+        self.assertIn('midterm', second.extracted_text)
+        self.assertEqual(second.chunks.count(), 1)
+        # one compressed copy of the text serves both
+        stored = ExtractedText.objects.get()
+        self.assertEqual(stored.key, second.content_hash)
+        self.assertEqual(stored.length, len(second.extracted_text))
+
+    def test_blob_deleted_with_last_reference(self):
+        """Test deleting one copy keeps the blob until the last copy goes"""
+        first = self.upload('syllabus.docx', 'CS 222 Fall')
+        second = self.upload('syllabus.docx', 'CS 222 Spring')
+        run_pending()
+        blob_path = first.file.path
+
+        self.client.delete(f'/api/auth/files/{first.id}/delete/')
+        self.assertTrue(os.path.exists(blob_path))
+        self.assertTrue(ExtractedText.objects.filter(key=second.content_hash).exists())
+        self.client.delete(f'/api/auth/files/{second.id}/delete/')
+        self.assertFalse(os.path.exists(blob_path))
+        self.assertFalse(ExtractedText.objects.exists())
+
+    def test_delete_waits_for_upload_of_same_content(self):
+        """Test a blob is published and its row created under the content hash's lock"""
+        first = self.upload('syllabus.docx', 'CS 222 Fall')
+        acquired, blocked = threading.Event(), []
+
+        def delete_in_progress():
+            with blob_lock(first.content_hash):
+                acquired.set()
+
+        def publish(*args):
+            thread = threading.Thread(target=delete_in_progress)
+            thread.start()
+            blocked.append((thread, not acquired.wait(0.2)))
+            return publish_blob(*args)
+
+        with patch('accounts.views.publish_blob', side_effect=publish):
+            second = self.upload('syllabus.docx', 'CS 222 Spring')
+        thread, was_blocked = blocked[0]
+        thread.join()
+        self.assertTrue(was_blocked)
+        self.assertTrue(acquired.is_set())
+        self.assertTrue(os.path.exists(second.file.path))
+
+
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), MEDIA_ROOT=tempfile.mkdtemp(), EMBEDDING_BACKEND='hashing')
+class AnswerCacheTests(APITestCase):
+    """Test suite for caching answers to repeated questions"""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.chat_url = '/api/auth/chat/'
+        answer_cache.reset()
+        professor = User.objects.create_user(username=PROF_USERNAME, password=PROF_PASSWORD)
+        self.file = UploadedFile.objects.create(
+            professor=professor, file_type='pdf', original_filename='syllabus.pdf',
+            course_name='CS 222', status='ready', extracted_text='The midterm is on October 10.',
+        )
+
+    def ask(self, question, **extra):
+        return self.client.post(self.chat_url, {'question': question, 'file_id': self.file.id, **extra}, format='json')
+
+    @patch('accounts.llm.chat')
+    def test_repeated_question_is_served_from_cache(self, mock_chat):
+        """Test the same normalized question about the same file calls the model once"""
+        mock_chat.return_value = {'message': {'content': 'October 10.'}}
+        first = self.ask('When is the midterm?')
+        second = self.ask('  when is the   MIDTERM ')
+        self.assertFalse(first.data['cached'])
+        self.assertTrue(second.data['cached'])
+        self.assertEqual(second.data['answer'], 'October 10.')
+        self.assertEqual(second.data['file_used'], 'syllabus.pdf')
+        self.assertEqual(mock_chat.call_count, 1)
+
+        stats = self.client.get('/api/auth/cache/stats/').data
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    @patch('accounts.llm.chat')
+    def test_history_is_part_of_the_key(self, mock_chat):
+        """Test a different conversation so far is a cache miss"""
+        mock_chat.return_value = {'message': {'content': 'October 10.'}}
+        self.ask('When is the midterm?')
+        self.ask('When is the midterm?', chat_history=[{'role': 'user', 'content': 'Hi'}])
+        self.assertEqual(mock_chat.call_count, 2)
+
+    @patch('accounts.llm.chat')
+    def test_document_change_invalidates(self, mock_chat):
+        """Test re-processing or deleting the file changes the key"""
+        mock_chat.return_value = {'message': {'content': 'October 10.'}}
+        self.ask('When is the midterm?')
+        UploadedFile.objects.filter(id=self.file.id).update(content_hash='0' * 64)
+        self.assertFalse(self.ask('When is the midterm?').data['cached'])
+
+        course_key = answer_cache.make_key('When is the midterm?', course_name='CS 222')
+        self.client.delete(f'/api/auth/files/{self.file.id}/delete/')
+        self.assertNotEqual(course_key, answer_cache.make_key('When is the midterm?', course_name='CS 222'))
+
+
+class SemanticCacheTests(TestCase):
+    """Test suite for the near-duplicate question cache"""
+
+    def setUp(self):
+        self.embedder = HashingEmbedder(dim=256)
+
+    def vector(self, text):
+        return self.embedder.embed([text])[0]
+
+    def test_similar_question_in_same_context_hits(self):
+        """Test a paraphrase above the threshold reuses the answer"""
+        cache = SemanticCache(capacity=8, threshold=0.5)
+        cache.put('file:1', self.vector('explain big o notation'), {'answer': 'Growth rate.'})
+        self.assertEqual(cache.get('file:1', self.vector('what does big o notation mean')), {'answer': 'Growth rate.'})
+        self.assertIsNone(cache.get('file:2', self.vector('what does big o notation mean')))
+        self.assertIsNone(cache.get('file:1', self.vector('when is the midterm')))
+        self.assertEqual(cache.stats()['semantic_hits'], 1)
+
+    def test_least_recently_used_row_is_evicted(self):
+        """Test a full cache overwrites the least recently used question"""
+        cache = SemanticCache(capacity=2, threshold=0.99)
+        cache.put('c', self.vector('first question'), 'first')
+        cache.put('c', self.vector('second question'), 'second')
+        cache.get('c', self.vector('first question'))
+        cache.put('c', self.vector('third question'), 'third')
+        self.assertEqual(cache.get('c', self.vector('first question')), 'first')
+        self.assertIsNone(cache.get('c', self.vector('second question')))
+
+
+@override_settings(
+    RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(),
+    EMBEDDING_BACKEND='hashing',
+    SEMANTIC_CACHE_THRESHOLD=0.5,
+)
+class SemanticAnswerCacheTests(APITestCase):
+    """Test suite for serving paraphrased questions from the cache"""
+
+    def setUp(self):
+        self.client = APIClient()
+        answer_cache._semantic_cache = None  # pick up the overridden threshold
+        answer_cache.reset()
+
+    @patch('accounts.llm.chat')
+    def test_paraphrase_saves_a_generation(self, mock_chat):
+        """Test a paraphrased question is answered without calling the model"""
+        mock_chat.return_value = {'message': {'content': 'It bounds growth.'}}
+        self.client.post('/api/auth/chat/', {'question': 'Explain Big O notation'}, format='json')
+        response = self.client.post('/api/auth/chat/', {'question': 'What does Big-O notation mean?'}, format='json')
+        self.assertTrue(response.data['cached'])
+        self.assertEqual(mock_chat.call_count, 1)
+        self.assertEqual(self.client.get('/api/auth/cache/stats/').data['llm_calls_saved'], 1)
+
+
+class PromptBudgetTests(TestCase):
+    """Test suite for the token-budgeted prompt builder"""
+
+    def setUp(self):
+        self.tokenizer = ApproximateTokenizer()
+        self.excerpts = [('notes.pdf', 'graph search ' * 100), ('notes.pdf', 'heap sort ' * 100)]
+        self.history = [
+            {'role': 'user' if n % 2 == 0 else 'assistant', 'content': f'turn {n} ' + 'words ' * 80}
+            for n in range(10)
+        ]
+
+    def test_prompt_stays_within_budget(self):
+        """Test a long conversation and context are cut to fit the budget"""
+        messages, usage = build_messages(self.excerpts, self.history, 'What is BFS?', budget=600)
+        counted = sum(self.tokenizer.count(m['content']) + 4 for m in messages)
+        self.assertLessEqual(counted, usage['used'])
+        self.assertLessEqual(usage['used'], 600)
+        self.assertEqual(messages[-1], {'role': 'user', 'content': 'What is BFS?'})
+        self.assertGreater(usage['turns_dropped'], 0)
+
+    def test_context_comes_before_older_turns(self):
+        """Test retrieved context is kept first and the newest turns are the ones kept"""
+        messages, usage = build_messages(self.excerpts, self.history, 'What is BFS?', budget=1000)
+        self.assertEqual(usage['excerpts_used'], 2)
+        self.assertIn('graph search', messages[0]['content'])
+        self.assertTrue(messages[-2]['content'].startswith('turn 9'))
+        self.assertNotIn('turn 0 ', [m['content'][:7] for m in messages])
+
+    def test_layout_is_stable_across_follow_ups(self):
+        """Test the system message starts with the instruction and keeps excerpts in document order"""
+        early = Excerpt('notes.pdf', 'Graphs have vertices.', 2)
+        late = Excerpt('notes.pdf', 'Heaps are trees.', 5)
+        first, _ = build_messages([late, early], [], 'What is a heap?', budget=3000)
+        follow_up, _ = build_messages([early, late], [], 'And a graph?', budget=3000)
+        self.assertEqual(first[0], follow_up[0])
+        self.assertTrue(first[0]['content'].startswith(SYSTEM_INSTRUCTION))
+        self.assertLess(first[0]['content'].index('Graphs'), first[0]['content'].index('Heaps'))
+
+    def test_small_document_is_pinned(self):
+        """Test a short file is sent whole whatever the question"""
+        professor = User.objects.create_user(username=PROF_USERNAME, password=PROF_PASSWORD)
+        uploaded = UploadedFile.objects.create(
+            professor=professor, file_type='pdf', original_filename='syllabus.pdf',
+            extracted_text='Office hours are on Tuesdays. The midterm is in October.', status='ready',
+        )
+        excerpts, file = build_context('When is the midterm?', uploaded.id)
+        self.assertEqual(excerpts, [Excerpt('syllabus.pdf', uploaded.extracted_text, 0)])
+        self.assertEqual(build_context('Office hours?', uploaded.id)[0], excerpts)
+
+    def test_file_without_text_is_not_pinned(self):
+        """Test a file still being ingested (no text yet, length 0) is never sent whole"""
+        professor = User.objects.create_user(username=PROF_USERNAME, password=PROF_PASSWORD)
+        for status_, text in (('pending', None), ('processing', None), ('failed', None), ('ready', '')):
+            uploaded = UploadedFile.objects.create(
+                professor=professor, file_type='pdf', original_filename='a.pdf', status=status_, extracted_text=text,
+            )
+            self.assertFalse(is_pinned(uploaded))
+
+    def test_small_prompt_is_untouched(self):
+        """Test nothing is dropped when everything fits"""
+        history = [{'role': 'user', 'content': 'Hi'}, {'role': 'assistant', 'content': 'Hello!'}]
+        messages, usage = build_messages([('a.pdf', 'short excerpt')], history, 'Thanks', budget=3000)
+        self.assertEqual(len(messages), 4)
+        self.assertEqual(usage['turns_dropped'] + usage['turns_compressed'] + usage['excerpts_dropped'], 0)
+
+
+@override_settings(
+    RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), EMBEDDING_BACKEND='hashing',
+    CONVERSATION_SUMMARY_EVERY=2, CONVERSATION_KEEP_TURNS=1,
+)
+class ConversationTests(APITestCase):
+    """Test suite for server-side conversations"""
+
+    def setUp(self):
+        self.client = APIClient()
+        answer_cache.reset()
+
+    def ask(self, question, conversation_id=None):
+        data = {'question': question}
+        if conversation_id:
+            data['conversation_id'] = conversation_id
+        return self.client.post('/api/auth/chat/', data, format='json')
+
+    @patch('accounts.llm.chat')
+    def test_history_is_kept_on_the_server(self, mock_chat):
+        """Test follow-up questions only need the conversation id"""
+        mock_chat.return_value = {'message': {'content': 'A language.'}}
+        conversation_id = self.ask('What is Python?').data['conversation_id']
+        response = self.ask('Who created it?', conversation_id)
+        self.assertEqual(response.data['conversation_id'], conversation_id)
+        sent = [m['content'] for m in mock_chat.call_args.kwargs['messages']]
+        self.assertEqual(sent[1:], ['What is Python?', 'A language.', 'Who created it?'])
+        self.assertEqual(Conversation.objects.get(id=conversation_id).messages.count(), 4)
+
+    def test_unknown_conversation(self):
+        """Test an unknown or malformed conversation id is rejected"""
+        self.assertEqual(self.ask('Hi', '00000000-0000-0000-0000-000000000000').status_code, 404)
+        self.assertEqual(self.ask('Hi', 'not-a-uuid').status_code, 404)
+
+    @patch('accounts.llm.chat')
+    def test_conversation_belongs_to_its_session(self, mock_chat):
+        """Test another session can't read or extend a conversation by its id"""
+        mock_chat.return_value = {'message': {'content': 'A language.'}}
+        conversation_id = self.ask('What is Python?').data['conversation_id']
+        self.client = APIClient()
+        self.assertEqual(self.ask('Who created it?', conversation_id).status_code, 404)
+        self.assertEqual(Conversation.objects.get(id=conversation_id).messages.count(), 2)
+
+    @patch('accounts.llm.chat')
+    def test_failed_chat_leaves_no_conversation(self, mock_chat):
+        """Test a conversation is only saved with its first answered turn"""
+        mock_chat.side_effect = ConnectionError('Ollama is down')
+        self.assertEqual(self.ask('What is Python?').status_code, status.HTTP_500_INTERNAL_SERVER_ERROR)
+        self.assertFalse(Conversation.objects.exists())
+
+    @patch('accounts.llm.chat')
+    def test_legacy_history_is_not_stored(self, mock_chat):
+        """Test clients that send chat_history get no conversation and leave no rows"""
+        mock_chat.return_value = {'message': {'content': 'Guido.'}}
+        response = self.client.post('/api/auth/chat/', {
+            'question': 'Who created it?',
+            'chat_history': [{'role': 'user', 'content': 'What is Python?'}, {'role': 'assistant', 'content': 'A language.'}],
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(response.data['conversation_id'])
+        self.assertIn('What is Python?', [m['content'] for m in mock_chat.call_args.kwargs['messages']])
+        self.assertFalse(Conversation.objects.exists())
+
+    @patch('accounts.llm.chat')
+    def test_old_turns_are_folded_into_the_summary(self, mock_chat):
+        """Test the prompt holds the summary plus recent turns as the conversation grows"""
+        def reply(messages, **kwargs):
+            summarizing = messages[0]['content'] == SUMMARY_INSTRUCTION
+            return {'message': {'content': 'They discussed sorting.' if summarizing else 'An answer.'}}
+
+        mock_chat.side_effect = reply
+        conversation_id = self.ask('Question 0').data['conversation_id']
+        for n in range(1, 3):
+            self.ask(f'Question {n}', conversation_id)
+
+        # on_commit doesn't fire inside TestCase; run the refresh it would schedule
+        self.assertTrue(refresh_summary(conversation_id))
+        self.assertIn('Question 0', mock_chat.call_args.kwargs['messages'][1]['content'])
+        self.ask('Question 3', conversation_id)
+
+        sent = [m['content'] for m in mock_chat.call_args.kwargs['messages']]
+        self.assertIn('They discussed sorting.', sent[1])
+        self.assertEqual(sent[2:], ['Question 2', 'An answer.', 'Question 3'])
+
+
+class OllamaClientTests(TestCase):
+    """Test suite for the shared Ollama client"""
+
+    def test_client_is_shared(self):
+        """Test every caller gets the same pooled client"""
+        self.assertIs(llm.get_client(), llm.get_client())
+
+    @override_settings(CHAT_MODEL='tiny-model', OLLAMA_KEEP_ALIVE='1h')
+    @patch('accounts.llm._client_for')
+    def test_chat_defaults_model_and_keep_alive(self, mock_client_for):
+        """Test requests name the configured model and keep it loaded"""
+        mock_client_for.return_value.chat.return_value = {'message': {'content': ''}}
+        llm.chat(messages=[])
+        llm.warm_up()
+        for call in mock_client_for.return_value.chat.call_args_list:
+            self.assertEqual(call.kwargs['model'], 'tiny-model')
+            self.assertEqual(call.kwargs['keep_alive'], '1h')
+        self.assertEqual(mock_client_for.return_value.chat.call_count, 2)
+
+    def test_chat_against_fake_server(self):
+        """Test the shared client speaks to an Ollama-compatible server"""
+        server = FakeOllamaServer(('127.0.0.1', 0), ttft=0).start()
+        self.addCleanup(server.shutdown)
+        with override_settings(OLLAMA_HOSTS=[server.url]):
+            response = llm.chat(messages=[{'role': 'user', 'content': 'Hi'}])
+            streamed = ''.join(c['message']['content'] for c in llm.chat(messages=[], stream=True))
+        self.assertEqual(response['message']['content'], ANSWER)
+        self.assertEqual(streamed, ANSWER)
+        self.assertIn('Hi', server.model_seconds)
+
+    @override_settings(OLLAMA_HOSTS=['http://a:11434', 'http://b:11434', 'http://c:11434'])
+    def test_routes_stick_to_one_server(self):
+        """Test requests about the same document always go to the same server"""
+        hosts = {llm.pick_host(f'file:{n}') for n in range(50)}
+        self.assertEqual(len(hosts), 3)
+        self.assertEqual(llm.pick_host('file:7'), llm.pick_host('file:7'))
+        self.assertIs(llm.get_client('file:7'), llm.get_client('file:7'))
+
+
+class SchedulerTests(TestCase):
+    """Test suite for the LLM request scheduler"""
+
+    def test_waiters_take_turns_across_courses(self):
+        """Test freed slots go round-robin across keys rather than first come first served"""
+        scheduler = Scheduler(max_active=1, max_queued=10, max_wait=1)
+        running = scheduler.acquire('course:a')
+        waiting = [scheduler._submit(key) for key in ('course:a', 'course:a', 'course:b')]
+        self.assertEqual(scheduler.stats()['queued_by_key'], {'course:a': 2, 'course:b': 1})
+
+        order = []
+        for _ in waiting:
+            scheduler.release(running)
+            running = next(t for t in waiting if t.future.done() and t not in order)
+            order.append(running)
+        self.assertEqual([t.key for t in order], ['course:a', 'course:b', 'course:a'])
+        self.assertIs(order[0], waiting[0])
+
+    def test_full_queue_is_rejected(self):
+        """Test requests beyond the queue bound are turned away with a retry hint"""
+        scheduler = Scheduler(max_active=1, max_queued=1, max_wait=1)
+        scheduler.acquire('a')
+        scheduler._submit('b')
+        with self.assertRaises(Busy) as raised:
+            scheduler.acquire('c')
+        self.assertGreaterEqual(raised.exception.retry_after, 1)
+        self.assertEqual(scheduler.stats()['rejected'], 1)
+
+    def test_waiting_too_long_gives_up(self):
+        """Test a timed out waiter leaves the queue"""
+        scheduler = Scheduler(max_active=1, max_queued=5, max_wait=0.01)
+        scheduler.acquire('a')
+        with self.assertRaises(Busy):
+            scheduler.acquire('b')
+        self.assertEqual(scheduler.stats()['queued'], 0)
+
+    def test_async_waiter_gets_released_slot(self):
+        """Test a coroutine waits for a slot without blocking the loop"""
+        scheduler = Scheduler(max_active=1, max_queued=5, max_wait=1)
+
+        async def scenario():
+            running = await scheduler.aacquire('a')
+            waiter = asyncio.ensure_future(scheduler.aacquire('b'))
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            scheduler.release(running)
+            return await waiter
+
+        self.assertEqual(asyncio.run(scenario()).key, 'b')
+        self.assertEqual(scheduler.stats()['active'], 1)
+
+    @patch('accounts.llm.chat')
+    @override_settings(EMBEDDING_BACKEND='hashing')
+    def test_chat_returns_429_when_busy(self, mock_chat):
+        """Test the chat endpoint sheds load with 429 and Retry-After"""
+        answer_cache.reset()
+        scheduler = Scheduler(max_active=1, max_queued=0, max_wait=1)
+        scheduler.acquire('someone else')
+        with patch('accounts.views.get_scheduler', return_value=scheduler):
+            response = self.client.post('/api/auth/chat/', {'question': 'Busy?'}, content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(int(response['Retry-After']) >= 1)
+        mock_chat.assert_not_called()
+
+
+@override_settings(EMBEDDING_BACKEND='hashing')
+class TimingTests(APITestCase):
+    """Test suite for per-request timing"""
+
+    def setUp(self):
+        answer_cache.reset()
+
+    @patch('accounts.llm.chat')
+    def test_chat_reports_server_timing(self, mock_chat):
+        """Test the chat response breaks its time down by stage"""
+        mock_chat.return_value = {'message': {'content': 'An answer.'}}
+        with self.assertLogs('accounts.timing', 'INFO') as logs:
+            response = self.client.post('/api/auth/chat/', {'question': 'Timed?'}, format='json')
+
+        header = response['Server-Timing']
+        for name in ('retrieval', 'prompt', 'queue', 'llm', 'db', 'total'):
+            self.assertIn(f'{name};dur=', header)
+        line = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(line['path'], '/api/auth/chat/')
+        self.assertEqual(line['status'], 200)
+        self.assertGreater(line['db_queries'], 0)
+        self.assertIn('llm', line['spans'])
+
+    def test_ingestion_job_is_timed(self):
+        """Test background ingestion logs its extraction and indexing stages"""
+        professor = User.objects.create_user(username=PROF_USERNAME, password=PROF_PASSWORD)
+        UserProfile.objects.create(user=professor, user_type='professor')
+        with override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(),
+                               EMBEDDING_BACKEND='hashing'):
+            self.client.post('/api/auth/upload/', {
+                'file': SimpleUploadedFile('notes.docx', make_docx('Sorting algorithms')), 'course_name': 'CS 225',
+            })
+            with self.assertLogs('accounts.timing', 'INFO') as logs:
+                run_pending()
+
+        job_line, index_line = [json.loads(record.getMessage()) for record in logs.records]
+        self.assertEqual(job_line['kind'], 'ingestion')
+        self.assertEqual(set(job_line['spans']), {'extract', 'index', 'embed'})
+        self.assertEqual((index_line['kind'], index_line['courses']), ('course_index', ['CS 225']))
+
+
+class MetricsTests(APITestCase):
+    """Test suite for the Prometheus metrics endpoint"""
+
+    def test_request_latency_and_queue_depth_are_exposed(self):
+        """Test /metrics reports per-route latency, in-flight requests and the ingestion queue"""
+        self.client.get('/api/auth/files/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        body = response.content.decode()
+        self.assertIn('http_request_duration_seconds_count{route="api/auth/files/",method="GET",status="200"}', body)
+        self.assertIn('http_requests_in_flight 1', body)    # the scrape itself
+        self.assertIn('ingestion_jobs{status="queued"} 0', body)
+        self.assertIn('chat_cache_hit_ratio{tier="exact"}', body)
+
+    @override_settings(CHAT_MODEL='metrics-model')
+    def test_generation_speed_is_recorded(self):
+        """Test LLM calls record their duration and tokens per second"""
+        server = FakeOllamaServer(('127.0.0.1', 0), ttft=0, tokens_per_s=1000).start()
+        self.addCleanup(server.shutdown)
+        with override_settings(OLLAMA_HOSTS=[server.url]):
+            llm.chat(messages=[{'role': 'user', 'content': 'Hi'}])
+            list(llm.chat(messages=[{'role': 'user', 'content': 'Hi'}], stream=True))
+        speeds = metrics.LLM_TOKENS_PER_SECOND.samples()[('metrics-model',)]
+        self.assertEqual(sum(speeds[:-1]), 2)
+        self.assertAlmostEqual(speeds[-1] / 2, 1000, delta=50)
+        self.assertEqual(sum(metrics.LLM_DURATION.samples()[('metrics-model', 'ok')][:-1]), 2)
+
+    def test_processes_are_added_up(self):
+        """Test snapshots of other workers are summed, dropping gauges of exited ones"""
+        exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+        exited.wait()
+        directory = tempfile.mkdtemp()
+        for pid, in_flight in ((os.getppid(), 3), (exited.pid, 7)):
+            snapshot = {
+                'ingestion_jobs_finished_total': [[['done'], 5]],
+                'http_requests_in_flight': [[[], in_flight]],
+            }
+            with open(os.path.join(directory, f'{pid}.json'), 'w') as f:
+                json.dump(snapshot, f)
+
+        before = metrics.REGISTRY.collect()
+        with override_settings(METRICS_DIR=directory):
+            metrics.REGISTRY.flush()
+            merged = metrics.REGISTRY.collect()
+        self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+        done = before['ingestion_jobs_finished_total'].get(('done',), 0)
+        self.assertEqual(merged['ingestion_jobs_finished_total'][('done',)], done + 10)
+        self.assertEqual(merged['http_requests_in_flight'][()], before['http_requests_in_flight'][()] + 3)
+
+
+@override_settings(RETRIEVAL_INDEX_ROOT=tempfile.mkdtemp(), EMBEDDING_BACKEND='hashing')
+class ChatLogTests(APITestCase):
+    """Test suite for the per-request generation log"""
+
+    def setUp(self):
+        answer_cache.reset()
+        chat_log._pending.clear()
+
+    @patch('accounts.llm.chat')
+    def test_generation_stats_are_logged(self, mock_chat):
+        """Test answers and cache hits are logged once the buffer is written"""
+        mock_chat.return_value = {
+            'model': 'llama3.2', 'message': {'content': 'Thursday.'},
+            'prompt_eval_count': 120, 'eval_count': 30, 'load_duration': 5_000_000,
+            'prompt_eval_duration': 200_000_000, 'eval_duration': 600_000_000,
+        }
+        for _ in range(2):
+            self.client.post('/api/auth/chat/', {'question': 'When is the exam?', 'course_name': 'CS 101'},
+                             format='json')
+        self.assertFalse(ChatLog.objects.exists())    # nothing written on the request path
+
+        self.assertEqual(chat_log.flush(), 2)
+        generated, cached = ChatLog.objects.order_by('id')
+        self.assertEqual((generated.model, generated.cache, generated.course_name), ('llama3.2', 'miss', 'CS 101'))
+        self.assertEqual((generated.prompt_eval_count, generated.eval_duration), (120, 600_000_000))
+        self.assertGreater(generated.prompt_tokens, 0)
+        self.assertEqual(cached.cache, 'exact')
+        self.assertIsNone(cached.eval_count)
+
+    def test_stats_report_speed_split_and_reloads(self):
+        """Test chat_stats aggregates tokens/sec, the prefill share and model loads"""
+        stats = dict(endpoint='chat', prompt_eval_count=500, eval_count=100,
+                     prompt_eval_duration=1_000_000_000, eval_duration=4_000_000_000)
+        ChatLog.objects.create(load_duration=3_000_000_000, **stats)   # cold start
+        ChatLog.objects.create(load_duration=10_000_000, **stats)
+        ChatLog.objects.create(endpoint='chat', cache='exact')
+
+        window, = chat_log.summarize('day')
+        self.assertEqual((window['requests'], window['cache_hits'], window['generations']), (3, 1, 2))
+        self.assertEqual(window['prefill_tokens_per_s'], 500)
+        self.assertEqual(window['decode_tokens_per_s'], 25)
+        self.assertAlmostEqual(window['prefill_share'], 0.2)
+        self.assertEqual(window['model_loads'], 1)
+
+        out = io.StringIO()
+        call_command('chat_stats', '--bucket', 'day', stdout=out)
+        self.assertIn('20%', out.getvalue())
+
+
+class DatabaseProfileTests(TestCase):
+    """Test the tuned SQLite profile"""
+
+    def test_connection_is_tuned(self):
+        """Test each connection sets a busy timeout and relaxed fsync"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite profile only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 20000)
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)   # NORMAL
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
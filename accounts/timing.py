@@ -0,0 +1,198 @@
+"""Per-request timing: named spans and ORM query time.
+
+``ServerTimingMiddleware`` starts a ``Timer`` for every request. Code on
+the request path wraps its stages in ``span("name")``; every database
+query is counted and timed. The totals go out in a ``Server-Timing``
+header (visible in the browser's network panel) and as one JSON line on
+the ``accounts.timing`` logger, for offline aggregation. Background
+ingestion jobs are timed the same way with ``timed("ingestion")``.
+
+The current timer lives in a context variable, so it follows the request
+into ``sync_to_async`` threads; outside a timed request ``span`` does
+nothing.
+"""
+
+import contextvars
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar("timer", default=None)
+
+
+class Timer:
+    def __init__(self, kind, **fields):
+        self.kind = kind
+        self.fields = fields
+        self.started = time.perf_counter()
+        self.spans = {}     # name -> [count, seconds]
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                entry = self.spans.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += elapsed
+
+    def add_query(self, seconds):
+        with self.lock:
+            self.queries += 1
+            self.query_seconds += seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """``Server-Timing`` header value: spans, then the ORM and the total so far"""
+        with self.lock:
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, (_, seconds) in self.spans.items()]
+            entries.append(f'db;dur={self.query_seconds * 1000:.1f};desc="{self.queries} queries"')
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "kind": self.kind,
+                **self.fields,
+                "total_ms": round(self.elapsed() * 1000, 2),
+                "db_queries": self.queries,
+                "db_ms": round(self.query_seconds * 1000, 2),
+                "spans": {name: round(seconds * 1000, 2) for name, (_, seconds) in self.spans.items()},
+            }
+
+    def log(self):
+        logger.info(json.dumps(self.as_dict()))
+
+
+class _NullTimer:
+    @contextmanager
+    def span(self, name):
+        yield
+
+
+NULL_TIMER = _NullTimer()
+
+
+def current():
+    """The timer of the request (or job) being served, or a no-op one"""
+    return _current.get() or NULL_TIMER
+
+
+def span(name):
+    return current().span(name)
+
+
+def _time_query(execute, sql, params, many, context):
+    timer = _current.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timer.add_query(time.perf_counter() - start)
+
+
+def install_query_timer(connection, **kwargs):
+    """Time every query on a connection (connected to ``connection_created``)"""
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+@contextmanager
+def timed(kind, **fields):
+    """Time a unit of work outside a request, logging it when done"""
+    timer = Timer(kind, **fields)
+    token = _current.set(timer)
+    try:
+        yield timer
+    finally:
+        _current.reset(token)
+        timer.log()
+
+
+class ServerTimingMiddleware:
+    """Adds a ``Server-Timing`` header and logs a JSON timing line per request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        timer, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(timer, response)
+
+    async def __acall__(self, request):
+        timer, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(timer, response)
+
+    def _start(self, request):
+        for connection in connections.all():
+            install_query_timer(connection)
+        timer = Timer("request", method=request.method, path=request.path)
+        return timer, _current.set(timer)
+
+    def _finish(self, timer, response):
+        timer.fields["status"] = response.status_code
+        response["Server-Timing"] = timer.server_timing()
+        if response.streaming:
+            # the header only covers the work done before the body; log once it's all sent
+            if response.is_async:
+                response.streaming_content = self._alog_when_sent(response.streaming_content, timer)
+            else:
+                response.streaming_content = self._log_when_sent(response.streaming_content, timer)
+        else:
+            timer.log()
+        return response
+
+    @staticmethod
+    def _log_when_sent(content, timer):
+        # spans and queries made while generating the body count too
+        token = _current.set(timer)
+        try:
+            yield from content
+        finally:
+            try:
+                _current.reset(token)
+            except ValueError:
+                pass    # closed from another context
+            timer.log()
+
+    @staticmethod
+    async def _alog_when_sent(content, timer):
+        try:
+            async for chunk in content:
+                yield chunk
+        finally:
+            timer.log()
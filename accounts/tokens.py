@@ -0,0 +1,66 @@
+"""Token counting for prompt budgeting.
+
+``PROMPT_TOKENIZER`` selects the tokenizer: ``"approximate"`` (no
+dependencies), or a dotted path to a class whose instances have a
+``count(text)`` method, e.g. a wrapper around the model's own tokenizer.
+"""
+
+import math
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+
+class ApproximateTokenizer:
+    """Estimates BPE token counts from words and punctuation.
+
+    Llama-style tokenizers average roughly 1.3 tokens per English word and
+    one per punctuation mark; long words and code push the count towards
+    one token per 4 characters, so the larger of the two estimates is used.
+    """
+
+    def count(self, text):
+        if not text:
+            return 0
+        pieces = WORD_RE.findall(text)
+        words = sum(1 for p in pieces if p[0].isalnum() or p[0] == "_")
+        by_pieces = math.ceil(words * 1.3) + (len(pieces) - words)
+        return max(by_pieces, math.ceil(len(text) / 4))
+
+
+TOKENIZER_BACKENDS = {
+    "approximate": ApproximateTokenizer,
+}
+
+
+@lru_cache(maxsize=None)
+def _build_tokenizer(backend):
+    if backend in TOKENIZER_BACKENDS:
+        return TOKENIZER_BACKENDS[backend]()
+    return import_string(backend)()
+
+
+def get_tokenizer():
+    """The configured tokenizer (``PROMPT_TOKENIZER``: a name or a dotted path)"""
+    return _build_tokenizer(settings.PROMPT_TOKENIZER)
+
+
+def truncate(text, max_tokens, tokenizer=None):
+    """The longest word prefix of ``text`` that fits in ``max_tokens``"""
+    tokenizer = tokenizer or get_tokenizer()
+    if tokenizer.count(text) <= max_tokens:
+        return text
+
+    words = text.split(" ")
+    low, high = 0, len(words)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if tokenizer.count(" ".join(words[:mid]) + " …") <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return " ".join(words[:low]) + " …" if low else ""
@@ -0,0 +1,120 @@
+"""Streaming upload handling for course files.
+
+Django's default handlers keep small uploads in memory and spool large
+ones to a temporary file, which had to be read back and copied into the
+blob store. ``BlobUploadHandler`` instead writes each chunk straight to a
+temporary file in the blob directory as the request body is parsed,
+hashing it and keeping the first bytes for type sniffing (libmagic) in the
+same pass; ``storage.publish_blob`` only has to rename it.
+
+A file bigger than its course's limit (``UPLOAD_MAX_MB``, overridden per
+course by ``UPLOAD_COURSE_MAX_MB``) is dropped as soon as it passes the
+limit. The limit is known while streaming only if the course is in the
+query string (``?course_name=``); the views check it again against the
+form's course once the request is parsed.
+"""
+
+import hashlib
+import os
+from functools import wraps
+
+import magic
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.views.decorators.csrf import csrf_exempt
+
+from .storage import blob_tempfile
+
+SNIFF_BYTES = 2048
+
+SNIFFED_FILE_TYPES = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx",
+    "application/msword": "docx",   # like get_file_type, .doc goes down the docx path
+    "application/zip": "docx",      # libmagic sometimes only recognizes the zip container
+}
+
+
+def upload_limit(course_name):
+    """Largest allowed upload for a course, in bytes"""
+    megabytes = settings.UPLOAD_COURSE_MAX_MB.get(course_name or "", settings.UPLOAD_MAX_MB)
+    return int(megabytes * 1024 * 1024)
+
+
+def too_large_error(course_name):
+    limit = upload_limit(course_name) / (1024 * 1024)
+    return f"File is larger than the {limit:g} MB limit" + (f" for {course_name}" if course_name else "")
+
+
+def content_matches(upload, file_type):
+    """False if the sniffed content contradicts the type the file name claims"""
+    sniffed = getattr(upload, "sniffed_type", None)
+    if sniffed in (None, "application/octet-stream"):
+        return True     # not sniffed, or binary that libmagic doesn't know
+    return SNIFFED_FILE_TYPES.get(sniffed) == file_type
+
+
+class HashedUpload(UploadedFile):
+    """An upload streamed to a temporary file next to the blobs"""
+
+    def __init__(self, name, content_type, charset, content_type_extra):
+        super().__init__(blob_tempfile(suffix=".upload"), name, content_type, 0, charset, content_type_extra)
+        self.content_hash = None
+        self.sniffed_type = None
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def close(self):
+        # called when the request finishes; the file is gone if it was stored
+        self.file.close()
+        try:
+            os.remove(self.file.name)
+        except FileNotFoundError:
+            pass
+
+
+class BlobUploadHandler(FileUploadHandler):
+    """Writes, hashes and sniffs each uploaded file in one pass"""
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.limit = upload_limit(request.GET.get("course_name") if request else None)
+        if request is not None:
+            request.rejected_uploads = []
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = HashedUpload(self.file_name, self.content_type, self.charset, self.content_type_extra)
+        self.digest = hashlib.sha256()
+        self.head = b""
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > self.limit:
+            if self.request is not None:
+                self.request.rejected_uploads.append(self.file_name)
+            raise SkipFile()    # closes (deletes) what was written and skips the rest
+        self.file.write(raw_data)
+        self.digest.update(raw_data)
+        if len(self.head) < SNIFF_BYTES:
+            self.head += raw_data[:SNIFF_BYTES - len(self.head)]
+        return None
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.content_hash = self.digest.hexdigest()
+        self.file.sniffed_type = magic.from_buffer(self.head, mime=True)
+        return self.file
+
+
+def blob_uploads(view):
+    """Parse the view's uploads with ``BlobUploadHandler`` (outermost decorator)"""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        # must be set before anything reads request.POST or request.FILES
+        request.upload_handlers = [BlobUploadHandler(request)]
+        return view(request, *args, **kwargs)
+    return csrf_exempt(wrapper)
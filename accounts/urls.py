@@ -7,7 +7,13 @@ urlpatterns = [
     path("register/", views.register),
     path("login/", views.login_view),
     path('upload/', views.upload_file),
+    path('upload/batch/', views.upload_batch),
     path('files/', views.list_files),
     path('files/<int:file_id>/delete/', views.delete_file),
+    path('jobs/<int:job_id>/', views.job_status),
     path('chat/', views.chat),
+    path('chat/stream/', views.chat_stream),
+    path('chat/async/', views.chat_async),
+    path('cache/stats/', views.cache_stats),
+    path('queue/stats/', views.queue_stats),
 ]
@@ -1,31 +1,79 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import PyPDF2
 from docx import Document
 
-def extract_text_from_pdf(file_path):
+# PDFs with at least this many pages are split into page ranges and
+# extracted on a process pool; smaller ones aren't worth the overhead
+PDF_PARALLEL_MIN_PAGES = 48
+PDF_PAGES_PER_TASK = 16
+PDF_MAX_PROCESSES = os.cpu_count() or 1
+
+_pdf_pool = None
+
+def _get_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is None:
+        # spawn, not fork: the web process has ingestion and server threads
+        _pdf_pool = ProcessPoolExecutor(
+            max_workers=PDF_MAX_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _pdf_pool
+
+def _extract_pdf_pages(file_path, start, stop):
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        return [reader.pages[n].extract_text() + "\n" for n in range(start, stop)]
+
+def extract_text_from_pdf(file_path, raise_errors=False, progress=None):
     try:
         with open(file_path, 'rb') as file:
             reader = PyPDF2.PdfReader(file)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text
+            page_count = len(reader.pages)
+            if page_count < PDF_PARALLEL_MIN_PAGES or PDF_MAX_PROCESSES < 2:
+                parts = []
+                for n, page in enumerate(reader.pages):
+                    parts.append(page.extract_text() + "\n")
+                    if progress:
+                        progress(n + 1, page_count)
+                return "".join(parts)
+
+        pool = _get_pdf_pool()
+        futures = [
+            pool.submit(_extract_pdf_pages, file_path, start, min(start + PDF_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, PDF_PAGES_PER_TASK)
+        ]
+        # results are collected in page order and joined once
+        parts = []
+        for future in futures:
+            parts.extend(future.result())
+            if progress:
+                progress(len(parts), page_count)
+        return "".join(parts)
     except Exception as e:
+        if raise_errors:
+            raise
         return f"Error: {str(e)}"
 
-def extract_text_from_docx(file_path):
+def extract_text_from_docx(file_path, raise_errors=False):
     try:
         doc = Document(file_path)
         return "\n".join([paragraph.text for paragraph in doc.paragraphs])
     except Exception as e:
+        if raise_errors:
+            raise
         return f"Error: {str(e)}"
 
 def get_file_type(filename):
     ext = filename.lower().split('.')[-1]
     return 'pdf' if ext == 'pdf' else 'docx' if ext in ['docx', 'doc'] else None
 
-def extract_text(file_path, file_type):
+def extract_text(file_path, file_type, raise_errors=False, progress=None):
     if file_type == 'pdf':
-        return extract_text_from_pdf(file_path)
+        return extract_text_from_pdf(file_path, raise_errors, progress)
     elif file_type == 'docx':
-        return extract_text_from_docx(file_path)
-    return "Unsupported file type"
\ No newline at end of file
+        return extract_text_from_docx(file_path, raise_errors)
+    return "Unsupported file type"
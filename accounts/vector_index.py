@@ -0,0 +1,169 @@
+"""Per-course embedding matrices stored as memory-mapped ``.npy`` files.
+
+Each course has ``<course>.npy`` (float32, one normalized row per chunk)
+and ``<course>.ids.npy`` (the ``DocumentChunk`` primary key of each row).
+Readers open the matrix with ``mmap_mode="r"`` so every worker process
+shares the OS page cache instead of holding its own copy, and a top-k
+cosine search is one matrix-vector product.
+
+Writers rebuild the files next to the old ones and swap them in with
+``os.replace``, so readers never observe a half-written matrix. Updates
+are read-modify-write, so writers of a course take ``index_lock`` (a file
+lock), since web workers and ``manage.py ingestion_worker`` may all be
+ingesting into the same course.
+"""
+
+import logging
+import os
+import tempfile
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from .embeddings import get_embedder
+from .retrieval import course_key, index_lock
+
+logger = logging.getLogger(__name__)
+
+
+def _paths(course_name):
+    root = Path(settings.RETRIEVAL_INDEX_ROOT) / "vectors"
+    key = course_key(course_name)
+    return root / f"{key}.npy", root / f"{key}.ids.npy"
+
+
+@lru_cache(maxsize=64)
+def _open(vectors_path, ids_path, mtime_ns):
+    vectors = np.load(vectors_path, mmap_mode="r")
+    ids = np.load(ids_path)
+    if len(ids) != len(vectors):
+        # caught between the two renames of a concurrent write
+        return None, None
+    return vectors, ids
+
+
+def load_course_vectors(course_name):
+    """``(vectors, ids)`` for a course, or ``(None, None)`` if it has no index"""
+    vectors_path, ids_path = _paths(course_name)
+    try:
+        return _open(str(vectors_path), str(ids_path), vectors_path.stat().st_mtime_ns)
+    except FileNotFoundError:
+        return None, None
+
+
+def _temp_path(path):
+    fd, name = tempfile.mkstemp(dir=path.parent, suffix=".tmp.npy")
+    os.close(fd)
+    return name
+
+
+def _write(course_name, vectors, ids):
+    """Replace a course's files; call with its ``index_lock`` held"""
+    vectors_path, ids_path = _paths(course_name)
+    vectors_path.parent.mkdir(parents=True, exist_ok=True)
+
+    tmp_ids, tmp_vectors = _temp_path(ids_path), _temp_path(vectors_path)
+    try:
+        np.save(tmp_ids, np.asarray(ids, dtype=np.int64))
+        out = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32, shape=vectors.shape)
+        out[:] = vectors
+        out.flush()
+        del out
+    except BaseException:
+        os.unlink(tmp_ids)
+        os.unlink(tmp_vectors)
+        raise
+
+    os.replace(tmp_ids, ids_path)
+    os.replace(tmp_vectors, vectors_path)
+
+
+def add_vectors(course_name, chunk_ids, vectors):
+    """Add (or replace) the rows of ``chunk_ids``"""
+    with index_lock(_paths(course_name)[0]):
+        old_vectors, old_ids = load_course_vectors(course_name)
+        if old_vectors is not None and old_vectors.shape[1] == vectors.shape[1]:
+            keep = ~np.isin(old_ids, chunk_ids)
+            vectors = np.concatenate([old_vectors[keep], vectors])
+            chunk_ids = np.concatenate([old_ids[keep], chunk_ids])
+        _write(course_name, vectors, chunk_ids)
+
+
+def remove_vectors(course_name, chunk_ids):
+    with index_lock(_paths(course_name)[0]):
+        old_vectors, old_ids = load_course_vectors(course_name)
+        if old_vectors is None:
+            return
+        keep = ~np.isin(old_ids, np.asarray(list(chunk_ids), dtype=np.int64))
+        _write(course_name, np.asarray(old_vectors[keep]), old_ids[keep])
+
+
+def search_vectors(course_name, query_vector, k, chunk_ids=None):
+    """Top-k ``(chunk_id, cosine)`` pairs, optionally restricted to ``chunk_ids``"""
+    vectors, ids = load_course_vectors(course_name)
+    if vectors is None or not len(ids) or vectors.shape[1] != len(query_vector):
+        return []
+
+    scores = vectors @ np.asarray(query_vector, dtype=np.float32)
+    if chunk_ids is not None:
+        scores = np.where(np.isin(ids, np.asarray(list(chunk_ids), dtype=np.int64)), scores, -np.inf)
+
+    k = min(k, len(ids))
+    top = np.argpartition(-scores, k - 1)[:k]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(int(ids[n]), float(scores[n])) for n in top if np.isfinite(scores[n])]
+
+
+def embedding_cache_path(uploaded_file):
+    return Path(settings.RETRIEVAL_INDEX_ROOT) / "embeddings" / f"{uploaded_file.content_hash}.npy"
+
+
+def embed_file(uploaded_file):
+    """Embed a file's chunks and append them to its course matrix.
+
+    Chunk vectors are also cached by content hash, so re-uploads of the
+    same document (e.g. into another course) skip the embedding model.
+    """
+    chunks = list(uploaded_file.chunks.values_list("id", "text"))
+    if not chunks:
+        return
+    ids, texts = zip(*chunks)
+
+    cache_path = embedding_cache_path(uploaded_file) if uploaded_file.content_hash else None
+    vectors = np.load(cache_path) if cache_path and cache_path.exists() else None
+    if vectors is None or len(vectors) != len(texts):
+        try:
+            vectors = get_embedder().embed(list(texts))
+        except Exception:
+            logger.warning("Embedding failed for file %s", uploaded_file.id, exc_info=True)
+            return
+        if cache_path:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            np.save(cache_path, vectors)
+    add_vectors(uploaded_file.course_name, np.array(ids, dtype=np.int64), vectors)
+
+
+def delete_embedding_cache(uploaded_file):
+    if uploaded_file.content_hash:
+        embedding_cache_path(uploaded_file).unlink(missing_ok=True)
+
+
+def unembed_file(uploaded_file):
+    chunk_ids = list(uploaded_file.chunks.values_list("id", flat=True))
+    if chunk_ids:
+        remove_vectors(uploaded_file.course_name, chunk_ids)
+
+
+def semantic_search(course_name, question, k, chunk_ids=None, query_vector=None):
+    """``query_vector``: the question's embedding, if the caller already has it"""
+    if load_course_vectors(course_name)[0] is None:
+        return []
+    if query_vector is None:
+        try:
+            query_vector = get_embedder().embed([question])[0]
+        except Exception as e:
+            logger.warning("Embedding the question failed: %s", e)
+            return []
+    return search_vectors(course_name, query_vector, k, chunk_ids=chunk_ids)
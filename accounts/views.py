@@ -5,9 +5,28 @@ from django.contrib.auth import authenticate, login
 from .models import UserProfile
 from rest_framework.decorators import parser_classes
 from rest_framework.parsers import MultiPartParser, FormParser
-from .utils import extract_text, get_file_type
-from .models import UploadedFile
-import ollama
+from .utils import get_file_type
+from .models import UploadedFile, IngestionJob, Conversation, ExtractedText
+from .retrieval import delete_file_index, build_course_index
+from .vector_index import unembed_file, delete_embedding_cache
+from .ingestion import enqueue, enqueue_many
+from .storage import blob_lock, blob_name, is_last_reference, publish_blob, stage_upload
+from .uploads import blob_uploads, content_matches, too_large_error, upload_limit
+from django.db import transaction
+from django.db.models import Q
+from django.conf import settings
+from asgiref.sync import sync_to_async
+from . import answer_cache, chat_log, conversations, llm, metrics as prometheus
+from .prompts import build_context, abuild_context, build_messages, unready_error, unready_file
+from .scheduler import Busy, get_scheduler, fairness_key
+from .timing import span
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+import base64
+import json
+from datetime import datetime
+
 
 @api_view(["POST"])
 def register(request):
@@ -36,10 +55,13 @@ def login_view(request):
         return Response({"username": user.username, "user_type": profile.user_type})
     return Response({"error": "Invalid credentials"}, status=401)
 
+@blob_uploads
 @api_view(["POST"])
 @parser_classes([MultiPartParser, FormParser])
 def upload_file(request):
     if 'file' not in request.FILES:
+        if request.rejected_uploads:
+            return Response({"error": too_large_error(request.query_params.get('course_name'))}, status=413)
         return Response({"error": "No file provided"}, status=400)
     
     file = request.FILES['file']
@@ -52,54 +74,187 @@ def upload_file(request):
         return Response({"error": "No professor user found"}, status=500)
     
     file_type = get_file_type(file.name)
-    if not file_type:
-        return Response({"error": "Unsupported file type"}, status=400)
-    
-    uploaded_file = UploadedFile.objects.create(
-        professor=user,
-        file=file,
-        original_filename=file.name,
-        file_type=file_type,
-        course_name=course_name
-    )
+    error = upload_error(file, file_type, course_name)
+    if error:
+        return Response({"error": error[0]}, status=error[1])
     
-    file_path = uploaded_file.file.path
-    extracted_text = extract_text(file_path, file_type)
-    uploaded_file.extracted_text = extracted_text
-    uploaded_file.save()
+    # Identical content is stored once, under its SHA-256
+    with span("store"):
+        tmp_name, content_hash = stage_upload(file)
+    # the row is committed before a delete of the same content can look for it
+    with blob_lock(content_hash), transaction.atomic():
+        blob = publish_blob(tmp_name, content_hash, file_type)
+        uploaded_file = UploadedFile.objects.create(
+            professor=user,
+            file=blob,
+            content_hash=content_hash,
+            original_filename=file.name,
+            file_type=file_type,
+            course_name=course_name
+        )
+        
+        # Extraction and indexing run in the background ingestion workers
+        with span("enqueue"):
+            job = enqueue(uploaded_file)
     
     return Response({
         "message": "File uploaded successfully",
         "file_id": uploaded_file.id,
+        "job_id": job.id,
         "filename": uploaded_file.original_filename,
-        "file_type": uploaded_file.file_type
+        "file_type": uploaded_file.file_type,
+        "status": uploaded_file.status,
     })
 
+def upload_error(file, file_type, course_name):
+    """Why an upload is refused, as ``(message, status)``, or None"""
+    if file.size > upload_limit(course_name):
+        return too_large_error(course_name), 413
+    if not file_type:
+        return "Unsupported file type", 400
+    if not content_matches(file, file_type):
+        return "File content does not match its type", 400
+    return None
+
+@blob_uploads
+@api_view(["POST"])
+@parser_classes([MultiPartParser, FormParser])
+def upload_batch(request):
+    """Upload several files (repeated ``files`` fields) to one course; returns a result per file"""
+    files = request.FILES.getlist('files')
+    course_name = request.data.get('course_name', '')
+    if not files and not request.rejected_uploads:
+        return Response({"error": "No files provided"}, status=400)
+    
+    # TEMPORARY: Get first professor user for testing
+    user = User.objects.filter(userprofile__user_type='professor').first()
+    if not user:
+        return Response({"error": "No professor user found"}, status=500)
+    
+    results, accepted = [], []
+    with span("store"):
+        for file in files:
+            file_type = get_file_type(file.name)
+            error = upload_error(file, file_type, course_name)
+            if error:
+                results.append({"filename": file.name, "error": error[0], "status_code": error[1]})
+                continue
+            tmp_name, content_hash = stage_upload(file)
+            result = {"filename": file.name, "file_type": file_type}
+            results.append(result)
+            accepted.append((result, tmp_name, UploadedFile(
+                professor=user,
+                file=blob_name(content_hash, file_type),
+                content_hash=content_hash,
+                original_filename=file.name,
+                file_type=file_type,
+                course_name=course_name,
+            )))
+    # dropped while streaming, past the limit of the course in the query string
+    for name in request.rejected_uploads:
+        results.append({"filename": name, "error": too_large_error(request.query_params.get('course_name')),
+                        "status_code": 413})
+    
+    # one INSERT for the files and one for their jobs, committed before a
+    # delete of the same content can look for them
+    with blob_lock(*(uploaded.content_hash for _, _, uploaded in accepted)), transaction.atomic():
+        for _, tmp_name, uploaded in accepted:
+            publish_blob(tmp_name, uploaded.content_hash, uploaded.file_type)
+        created = UploadedFile.objects.bulk_create([uploaded for _, _, uploaded in accepted])
+        with span("enqueue"):
+            jobs = enqueue_many(created)
+    for (result, _, _), uploaded, job in zip(accepted, created, jobs):
+        result.update(file_id=uploaded.id, job_id=job.id, status=uploaded.status)
+    
+    return Response({"uploaded": len(created), "files": results})
+
+FILE_LIST_FIELDS = ("id", "original_filename", "file_type", "course_name", "uploaded_at", "status", "progress")
+
+def encode_cursor(row):
+    raw = f"{row['uploaded_at'].isoformat()}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor):
+    """``(uploaded_at, id)`` of the last file on the previous page; raises ValueError"""
+    uploaded_at, file_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(uploaded_at), int(file_id)
+
 @api_view(["GET"])
 def list_files(request):
+    """Newest first, a page at a time: pass ``next_cursor`` back as ``cursor`` for the next page"""
     # TEMPORARY: Get first professor user
     user = User.objects.filter(userprofile__user_type='professor').first()
     if not user:
-        return Response({"files": []})
+        return Response({"files": [], "next_cursor": None})
     
-    files = UploadedFile.objects.filter(professor=user).order_by('-uploaded_at')
+    try:
+        limit = int(request.query_params.get("limit", settings.FILE_LIST_PAGE_SIZE))
+    except ValueError:
+        return Response({"error": "Invalid limit"}, status=400)
+    limit = max(1, min(limit, settings.FILE_LIST_MAX_PAGE_SIZE))
+    
+    files = UploadedFile.objects.filter(professor=user)
+    course_name = request.query_params.get("course_name")
+    if course_name:
+        files = files.filter(course_name=course_name)
+    cursor = request.query_params.get("cursor")
+    if cursor:
+        # keyset pagination: continue after the last row instead of counting an OFFSET
+        try:
+            uploaded_at, file_id = decode_cursor(cursor)
+        except ValueError:
+            return Response({"error": "Invalid cursor"}, status=400)
+        files = files.filter(Q(uploaded_at__lt=uploaded_at) | Q(uploaded_at=uploaded_at, id__lt=file_id))
+    
+    # only the listed columns leave the database, never the extracted text
+    rows = list(files.order_by('-uploaded_at', '-id').values(*FILE_LIST_FIELDS)[:limit + 1])
+    page = rows[:limit]
     
     return Response({
         "files": [{
-            "id": f.id,
-            "filename": f.original_filename,
-            "file_type": f.file_type,
-            "course_name": f.course_name,
-            "uploaded_at": f.uploaded_at,
-        } for f in files]
+            "id": f["id"],
+            "filename": f["original_filename"],
+            "file_type": f["file_type"],
+            "course_name": f["course_name"],
+            "uploaded_at": f["uploaded_at"],
+            "status": f["status"],
+            "progress": f["progress"],
+        } for f in page],
+        "next_cursor": encode_cursor(page[-1]) if len(rows) > len(page) else None,
+    })
+
+@api_view(["GET"])
+def job_status(request, job_id):
+    try:
+        job = IngestionJob.objects.select_related("file").get(id=job_id)
+    except IngestionJob.DoesNotExist:
+        return Response({"error": "Job not found"}, status=404)
+    
+    return Response({
+        "job_id": job.id,
+        "file_id": job.file_id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "error": job.error,
+        "file_status": job.file.status,
+        "progress": job.file.progress,
     })
 
 @api_view(["DELETE"])
 def delete_file(request, file_id):
     try:
         file = UploadedFile.objects.get(id=file_id)
-        file.file.delete()
-        file.delete()
+        unembed_file(file)
+        # an upload of the same content publishes and commits under this lock
+        with blob_lock(file.content_hash), transaction.atomic():
+            # the blob and its artifacts go with the last file that uses them
+            if is_last_reference(file):
+                file.file.delete(save=False)
+                delete_file_index(file)
+                delete_embedding_cache(file)
+                ExtractedText.objects.filter(key=file.text_key).delete()
+            file.delete()
+        build_course_index(file.course_name)
         return Response({"message": "File deleted"})
     except UploadedFile.DoesNotExist:
         return Response({"error": "File not found"}, status=404)
@@ -109,57 +264,204 @@ def chat(request):
     """Chat with AI about uploaded course materials"""
     question = request.data.get("question")
     file_id = request.data.get("file_id")
-    chat_history = request.data.get("chat_history", [])  # Get chat history
+    course_name = request.data.get("course_name")
     
     if not question:
         return Response({"error": "No question provided"}, status=400)
+    # answers come from the file's index, which its ingestion job builds
+    if (pending := unready_file(file_id)) is not None:
+        return Response({"error": unready_error(pending), "status": pending.status}, status=409)
     
-    # Get file content if file_id provided
-    context = ""
-    if file_id:
-        try:
-            file = UploadedFile.objects.get(id=file_id)
-            context = f"Context from {file.original_filename}:\n{file.extracted_text}\n\n"
-        except UploadedFile.DoesNotExist:
-            pass
-    
-    # Build messages with history
-    messages = []
-    
-    # Add system message with context
-    if context:
-        messages.append({
-            'role': 'system',
-            'content': f"{context}You are a helpful study assistant. Answer questions based on the course materials concisely."
-        })
+    try:
+        with span("conversation"):
+            conversation, chat_history = conversations.open_conversation(request, request.data)
+    except Conversation.DoesNotExist:
+        return Response({"error": "Conversation not found"}, status=404)
     
-    # Add chat history
-    for msg in chat_history:
-        messages.append({
-            'role': msg['role'],
-            'content': msg['content']
-        })
+    with span("cache"):
+        cached = answer_cache.lookup(question, chat_history, file_id, course_name)
+    if cached.entry:
+        conversations.record_turn(conversation, question, cached.entry["answer"])
+        chat_log.record("chat", cached.source, file_id=file_id, course_name=course_name)
+        return Response({"question": question, **cached.entry, "cached": True,
+                         "conversation_id": conversation.id if conversation else None})
     
-    # Add current question
-    messages.append({
-        'role': 'user',
-        'content': question
-    })
+    with span("retrieval"):
+        excerpts, file = build_context(question, file_id, course_name, cached.vector)
+    with span("prompt"):
+        messages, prompt_tokens = build_messages(excerpts, chat_history, question)
     
     try:
-        # Call Ollama with full conversation
-        response = ollama.chat(
-            model='llama3.2:3b',
-            messages=messages
-        )
+        # Wait for a generation slot, then call Ollama with the budgeted conversation
+        key = fairness_key(request, file_id, course_name)
+        with get_scheduler().slot(key), span("llm"):
+            response = llm.chat(
+                route=key,
+                messages=messages,
+                options={"num_ctx": settings.CHAT_CONTEXT_WINDOW}
+            )
         
         answer = response['message']['content']
+        file_used = file.original_filename if file else None
+        with span("save"):
+            answer_cache.store(cached, answer, file_used)
+            conversations.record_turn(conversation, question, answer)
+        chat_log.record("chat", response=response, file_id=file_id, course_name=course_name,
+                        prompt_tokens=prompt_tokens)
         
         return Response({
             "question": question,
             "answer": answer,
-            "file_used": file.original_filename if file_id else None
+            "file_used": file_used,
+            "cached": False,
+            "prompt_tokens": prompt_tokens,
+            "conversation_id": conversation.id if conversation else None
         })
     
+    except Busy as e:
+        return Response({"error": str(e)}, status=429, headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
-        return Response({"error": str(e)}, status=500)
\ No newline at end of file
+        return Response({"error": str(e)}, status=500)
+
+def sse_event(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+@api_view(["POST"])
+def chat_stream(request):
+    """Stream the AI answer as server-sent events, one event per token chunk"""
+    question = request.data.get("question")
+    file_id = request.data.get("file_id")
+    course_name = request.data.get("course_name")
+    
+    if not question:
+        return Response({"error": "No question provided"}, status=400)
+    if (pending := unready_file(file_id)) is not None:
+        return Response({"error": unready_error(pending), "status": pending.status}, status=409)
+    
+    try:
+        conversation, chat_history = conversations.open_conversation(request, request.data)
+    except Conversation.DoesNotExist:
+        return Response({"error": "Conversation not found"}, status=404)
+    
+    cached = answer_cache.lookup(question, chat_history, file_id, course_name)
+    scheduler = get_scheduler()
+    if not cached.entry and scheduler.is_full():
+        # reject before the stream starts, while a status code can still be sent
+        retry_after = scheduler.retry_after()
+        return Response({"error": str(Busy(retry_after))}, status=429, headers={"Retry-After": str(retry_after)})
+    
+    def cached_events():
+        conversations.record_turn(conversation, question, cached.entry["answer"])
+        chat_log.record("stream", cached.source, file_id=file_id, course_name=course_name)
+        yield sse_event({"token": cached.entry["answer"]})
+        yield sse_event({"done": True, "file_used": cached.entry["file_used"], "cached": True,
+                         "conversation_id": str(conversation.id) if conversation else None})
+    
+    def events():
+        with span("retrieval"):
+            excerpts, file = build_context(question, file_id, course_name, cached.vector)
+        with span("prompt"):
+            messages, prompt_tokens = build_messages(excerpts, chat_history, question)
+        file_used = file.original_filename if file else None
+        tokens, final = [], None
+        try:
+            key = fairness_key(request, file_id, course_name)
+            with scheduler.slot(key), span("llm"):
+                for chunk in llm.chat(route=key, messages=messages, stream=True,
+                                      options={"num_ctx": settings.CHAT_CONTEXT_WINDOW}):
+                    token = chunk['message']['content']
+                    if token:
+                        tokens.append(token)
+                        yield sse_event({"token": token})
+                    if chunk.get('done'):
+                        final = chunk   # carries the generation stats
+            answer = "".join(tokens)
+            answer_cache.store(cached, answer, file_used)
+            conversations.record_turn(conversation, question, answer)
+            chat_log.record("stream", response=final, file_id=file_id, course_name=course_name,
+                            prompt_tokens=prompt_tokens)
+            yield sse_event({"done": True, "file_used": file_used, "cached": False, "prompt_tokens": prompt_tokens,
+                             "conversation_id": str(conversation.id) if conversation else None})
+        except Exception as e:
+            yield sse_event({"error": str(e)})
+    
+    response = StreamingHttpResponse(cached_events() if cached.entry else events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"  # don't let a proxy buffer the stream
+    return response
+
+@csrf_exempt
+@require_POST
+async def chat_async(request):
+    """Async chat for ASGI servers: waiting on Ollama doesn't hold a worker thread"""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    
+    question = data.get("question")
+    file_id = data.get("file_id")
+    course_name = data.get("course_name")
+    
+    if not question:
+        return JsonResponse({"error": "No question provided"}, status=400)
+    if (pending := await sync_to_async(unready_file)(file_id)) is not None:
+        return JsonResponse({"error": unready_error(pending), "status": pending.status}, status=409)
+    
+    try:
+        conversation, chat_history = await sync_to_async(conversations.open_conversation)(request, data)
+    except Conversation.DoesNotExist:
+        return JsonResponse({"error": "Conversation not found"}, status=404)
+    
+    cached = await sync_to_async(answer_cache.lookup)(question, chat_history, file_id, course_name)
+    if cached.entry:
+        await sync_to_async(conversations.record_turn)(conversation, question, cached.entry["answer"])
+        chat_log.record("async", cached.source, file_id=file_id, course_name=course_name)
+        return JsonResponse({"question": question, **cached.entry, "cached": True,
+                             "conversation_id": str(conversation.id) if conversation else None})
+    
+    with span("retrieval"):
+        excerpts, file = await abuild_context(question, file_id, course_name, cached.vector)
+    with span("prompt"):
+        messages, prompt_tokens = build_messages(excerpts, chat_history, question)
+    
+    try:
+        key = fairness_key(request, file_id, course_name)
+        async with get_scheduler().aslot(key):
+            with span("llm"):
+                response = await llm.achat(route=key, messages=messages, options={"num_ctx": settings.CHAT_CONTEXT_WINDOW})
+        answer = response['message']['content']
+        file_used = file.original_filename if file else None
+        await sync_to_async(answer_cache.store)(cached, answer, file_used)
+        await sync_to_async(conversations.record_turn)(conversation, question, answer)
+        chat_log.record("async", response=response, file_id=file_id, course_name=course_name,
+                        prompt_tokens=prompt_tokens)
+        return JsonResponse({
+            "question": question,
+            "answer": answer,
+            "file_used": file_used,
+            "cached": False,
+            "prompt_tokens": prompt_tokens,
+            "conversation_id": str(conversation.id) if conversation else None
+        })
+    except Busy as e:
+        response = JsonResponse({"error": str(e)}, status=429)
+        response["Retry-After"] = str(e.retry_after)
+        return response
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@api_view(["GET"])
+def cache_stats(request):
+    """Hit/miss counters of the exact and semantic answer caches (this process)"""
+    return Response(answer_cache.stats())
+
+@api_view(["GET"])
+def queue_stats(request):
+    """Generation slots in use, queue depth and wait times (this process)"""
+    return Response(get_scheduler().stats())
+
+@require_GET
+def metrics(request):
+    """Prometheus metrics of every worker process (see ``accounts.metrics``)"""
+    return HttpResponse(prometheus.REGISTRY.render(), content_type=prometheus.CONTENT_TYPE)
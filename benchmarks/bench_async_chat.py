@@ -0,0 +1,193 @@
+"""Concurrent chat throughput: sync view on WSGI vs async view on ASGI.
+
+Starts a fake Ollama server with a fixed per-request latency, then runs
+the Django app twice in a subprocess:
+
+* ``wsgi``: the sync DRF ``chat`` view behind a WSGI server with a fixed
+  thread pool (like one gunicorn gthread worker), so each in-flight LLM
+  call pins a thread;
+* ``asgi``: the async ``chat_async`` view under uvicorn, one process.
+
+and fires batches of concurrent chat requests at each.
+
+    python -m benchmarks.bench_async_chat --latency 1.0 --concurrency 8 64 256
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+import httpx
+
+from benchmarks.fake_ollama import FakeOllamaServer
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+ENDPOINTS = {"wsgi": "/api/auth/chat/", "asgi": "/api/auth/chat/async/"}
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class PooledWSGIServer(WSGIServer):
+    """WSGI server that handles requests on a fixed-size thread pool"""
+
+    request_queue_size = 1024
+
+    def __init__(self, address, threads):
+        super().__init__(address, QuietHandler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def serve(mode, port, threads):
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "classwork_chatbot.settings")
+    if mode == "wsgi":
+        from classwork_chatbot.wsgi import application
+
+        server = PooledWSGIServer(("127.0.0.1", port), threads)
+        server.set_app(application)
+        server.serve_forever()
+    else:
+        import uvicorn
+
+        uvicorn.run("classwork_chatbot.asgi:application", host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not start")
+
+
+async def fire(url, concurrency, requests_per_client):
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        async def worker():
+            nonlocal errors
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                # a distinct question each time, or the answer cache would serve it
+                response = await client.post(url, json={"question": f"What is Big-O? #{uuid.uuid4()}"})
+                latencies.append(time.perf_counter() - start)
+                errors += response.status_code != 200
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        "p50_s": latencies[len(latencies) // 2],
+        "p95_s": latencies[min(int(len(latencies) * 0.95), len(latencies) - 1)],
+    }
+
+
+def server_env(ollama_url, workdir, **overrides):
+    """Environment for a benchmark server: the fake Ollama, no answer reuse
+    across questions, and a freshly migrated SQLite database in ``workdir``"""
+    env = dict(
+        os.environ,
+        OLLAMA_HOST=ollama_url,
+        OLLAMA_WARM_UP="false",
+        SEMANTIC_CACHE_ENABLED="false",
+        SQLITE_PATH=str(Path(workdir) / "db.sqlite3"),
+        PYTHONPATH=str(BASE_DIR),
+        **overrides,
+    )
+    subprocess.run([sys.executable, "manage.py", "migrate", "--noinput", "-v", "0"], cwd=BASE_DIR, env=env, check=True)
+    return env
+
+
+def run_mode(mode, args, ollama_url):
+    port = free_port()
+    workdir = tempfile.TemporaryDirectory()
+    # measure the server, not the LLM scheduler's admission limit
+    env = server_env(ollama_url, workdir.name, LLM_MAX_CONCURRENT="100000")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_async_chat", "--serve", mode,
+         "--port", str(port), "--threads", str(args.threads)],
+        cwd=BASE_DIR, env=env,
+    )
+    try:
+        wait_until_up(f"http://127.0.0.1:{port}/")
+        url = f"http://127.0.0.1:{port}{ENDPOINTS[mode]}"
+        return [
+            dict(mode=mode, **asyncio.run(fire(url, c, args.requests_per_client)))
+            for c in args.concurrency
+        ]
+    finally:
+        server.terminate()
+        server.wait()
+        workdir.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=1.0, help="fake model latency in seconds")
+    parser.add_argument("--threads", type=int, default=8, help="WSGI worker threads")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8, 64, 256])
+    parser.add_argument("--requests-per-client", type=int, default=2)
+    parser.add_argument("--modes", nargs="+", choices=sorted(ENDPOINTS), default=["wsgi", "asgi"])
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--serve", choices=sorted(ENDPOINTS), help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.threads)
+        return
+
+    ollama = FakeOllamaServer(("127.0.0.1", 0), ttft=args.latency).start()
+    results = []
+    for mode in args.modes:
+        results.extend(run_mode(mode, args, ollama.url))
+
+    print(f"{'mode':<6}{'conc':>6}{'reqs':>7}{'errors':>8}{'req/s':>10}{'p50 s':>9}{'p95 s':>9}")
+    for r in results:
+        print(f"{r['mode']:<6}{r['concurrency']:>6}{r['requests']:>7}{r['errors']:>8}"
+              f"{r['throughput_rps']:>10.1f}{r['p50_s']:>9.2f}{r['p95_s']:>9.2f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""End-to-end chat latency against a fake Ollama server.
+
+Runs the Django app in a subprocess (the sync ``chat`` view behind a
+threaded WSGI server, or the async view under uvicorn) pointed at a fake
+Ollama with a configurable time-to-first-token, generation speed and
+failure rate, then drives ``/api/auth/chat/`` at each concurrency level.
+
+Reports p50/p95/p99 latency and throughput, and splits each successful
+request into model time (as measured by the fake server) and Django
+overhead (everything else: routing, cache, retrieval, prompt building,
+DB writes, waiting for an LLM slot). Results are written as JSON.
+
+    python -m benchmarks.bench_chat_latency --ttft 0.3 --tokens-per-s 50 --concurrency 1 8 32
+"""
+
+import argparse
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+from benchmarks.bench_async_chat import BASE_DIR, ENDPOINTS, free_port, server_env, wait_until_up
+from benchmarks.fake_ollama import FakeOllamaServer
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+async def drive(url, concurrency, requests_per_client):
+    """Fire requests from ``concurrency`` clients; returns per-request records"""
+    records = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=600) as client:
+        async def worker():
+            for _ in range(requests_per_client):
+                # a distinct question each time, or the answer cache would serve it
+                question = f"What is Big-O? #{uuid.uuid4()}"
+                start = time.perf_counter()
+                response = await client.post(url, json={"question": question})
+                records.append({
+                    "question": question,
+                    "status": response.status_code,
+                    "latency_s": time.perf_counter() - start,
+                })
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return records, elapsed
+
+
+def summarize(records, elapsed, model_seconds):
+    ok = [r for r in records if r["status"] == 200]
+    latencies = [r["latency_s"] for r in records]
+    model = [model_seconds[r["question"]] for r in ok if r["question"] in model_seconds]
+    overhead = [r["latency_s"] - model_seconds[r["question"]] for r in ok if r["question"] in model_seconds]
+    return {
+        "requests": len(records),
+        "ok": len(ok),
+        "rejected_429": sum(r["status"] == 429 for r in records),
+        "errors": sum(r["status"] not in (200, 429) for r in records),
+        "throughput_rps": len(ok) / elapsed,
+        "p50_s": percentile(latencies, 0.50),
+        "p95_s": percentile(latencies, 0.95),
+        "p99_s": percentile(latencies, 0.99),
+        "model_mean_s": sum(model) / len(model) if model else None,
+        "overhead_mean_s": sum(overhead) / len(overhead) if overhead else None,
+        "overhead_p95_s": percentile(overhead, 0.95),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=sorted(ENDPOINTS), default="wsgi")
+    parser.add_argument("--threads", type=int, default=16, help="WSGI worker threads")
+    parser.add_argument("--ttft", type=float, default=0.3, help="fake model time to first token, seconds")
+    parser.add_argument("--tokens-per-s", type=float, default=50.0, help="fake model generation speed")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of model calls that fail")
+    parser.add_argument("--llm-slots", type=int, default=100000,
+                        help="LLM_MAX_CONCURRENT of the server (default: effectively unlimited)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--json", default=str(BASE_DIR / "benchmarks" / "results" / "chat_latency.json"),
+                        help="where to write results")
+    args = parser.parse_args()
+
+    ollama = FakeOllamaServer(("127.0.0.1", 0), ttft=args.ttft, tokens_per_s=args.tokens_per_s,
+                              failure_rate=args.failure_rate).start()
+    port = free_port()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        env = server_env(ollama.url, workdir, LLM_MAX_CONCURRENT=str(args.llm_slots))
+        server = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.bench_async_chat", "--serve", args.mode,
+             "--port", str(port), "--threads", str(args.threads)],
+            cwd=BASE_DIR, env=env,
+        )
+        try:
+            wait_until_up(f"http://127.0.0.1:{port}/")
+            url = f"http://127.0.0.1:{port}{ENDPOINTS[args.mode]}"
+            for concurrency in args.concurrency:
+                records, elapsed = asyncio.run(drive(url, concurrency, args.requests_per_client))
+                results.append({"concurrency": concurrency, **summarize(records, elapsed, ollama.model_seconds)})
+        finally:
+            server.terminate()
+            server.wait()
+
+    def ms(value):
+        return f"{value * 1000:.0f}" if value is not None else "-"
+
+    print(f"{'conc':>5}{'ok':>6}{'429':>5}{'err':>5}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'model ms':>10}{'django ms':>11}")
+    for r in results:
+        print(f"{r['concurrency']:>5}{r['ok']:>6}{r['rejected_429']:>5}{r['errors']:>5}{r['throughput_rps']:>8.1f}"
+              f"{ms(r['p50_s']):>9}{ms(r['p95_s']):>9}{ms(r['p99_s']):>9}"
+              f"{ms(r['model_mean_s']):>10}{ms(r['overhead_mean_s']):>11}")
+
+    path = Path(args.json)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "revision": git_revision(),
+        "parameters": {k: v for k, v in vars(args).items() if k != "json"},
+        "results": results,
+    }, indent=2))
+    print(f"wrote {path}")
+
+
+if __name__ == "__main__":
+    main()
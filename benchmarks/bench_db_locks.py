@@ -0,0 +1,170 @@
+"""Lock contention under concurrent writes, per database profile.
+
+Runs the same mixed workload against each ``DB_PROFILE`` in a fresh
+database (one subprocess per profile, since the profile is read at
+startup). For ``--seconds``, ``--threads`` threads, each with its own
+connection like the threads of a server and the ingestion workers, loop
+over
+
+* ``upload``: a transaction that checks for the content hash, then
+  inserts the file and its ingestion job (read, then write);
+* ``claim``: ``claim_next_job()``, as an ingestion worker polls;
+* ``list``: the newest page of the professor's file list.
+
+It reports completed operations per second, "database is locked"
+errors, and the p50/p95/max latency of each operation.
+
+    python -m benchmarks.bench_db_locks --threads 16 --seconds 20
+
+``postgres`` can be added to ``--profiles``; it uses the ``POSTGRES_*``
+settings, so point them at a scratch database.
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+OPERATIONS = ("upload", "claim", "list")
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "classwork_chatbot.settings")
+    import django
+
+    django.setup()
+
+
+def run_profile(args):
+    """Child process: run the workload against ``DB_PROFILE``, print JSON"""
+    setup_django()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from django.db import OperationalError, connection, transaction
+    from django.test import override_settings
+
+    from accounts.ingestion import claim_next_job
+    from accounts.models import IngestionJob, UploadedFile
+
+    call_command("migrate", verbosity=0)
+    professor = User.objects.create_user(username="bench-professor")
+    stop = time.perf_counter() + args.seconds
+    latencies = {name: [] for name in OPERATIONS}
+    errors = {name: 0 for name in OPERATIONS}
+    lock = threading.Lock()
+
+    def upload(rng):
+        content_hash = f"{rng.getrandbits(256):064x}"
+        with transaction.atomic():
+            if not UploadedFile.objects.filter(content_hash=content_hash).exists():
+                uploaded = UploadedFile.objects.create(
+                    professor=professor, file=f"uploads/bench/{content_hash}.pdf", file_type="pdf",
+                    original_filename="lecture.pdf", content_hash=content_hash, course_name="CS 101",
+                )
+                IngestionJob.objects.create(file=uploaded)
+
+    def claim(rng):
+        claim_next_job()
+
+    def list_page(rng):
+        list(UploadedFile.objects.filter(professor=professor).order_by("-uploaded_at", "-id")
+             .values("id", "original_filename", "status")[:50])
+
+    work = {"upload": upload, "claim": claim, "list": list_page}
+    weights = (args.write_share, args.write_share / 2, 1 - 1.5 * args.write_share)
+
+    def worker(seed):
+        rng = random.Random(seed)
+        mine = {name: [] for name in OPERATIONS}
+        failed = {name: 0 for name in OPERATIONS}
+        while time.perf_counter() < stop:
+            name = rng.choices(OPERATIONS, weights)[0]
+            start = time.perf_counter()
+            try:
+                work[name](rng)
+            except OperationalError as e:
+                if "locked" not in str(e):
+                    raise
+                failed[name] += 1
+            else:
+                mine[name].append(time.perf_counter() - start)
+        connection.close()
+        with lock:
+            for name in OPERATIONS:
+                latencies[name].extend(mine[name])
+                errors[name] += failed[name]
+
+    # DEBUG would keep every query of every thread in memory
+    with override_settings(DEBUG=False):
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(args.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    result = {}
+    for name in OPERATIONS:
+        times = sorted(latencies[name])
+        result[name] = {
+            "ops": len(times),
+            "errors": errors[name],
+            "p50_ms": statistics.median(times) * 1000 if times else None,
+            "p95_ms": times[int(len(times) * 0.95)] * 1000 if times else None,
+            "max_ms": times[-1] * 1000 if times else None,
+        }
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="+", default=["sqlite-basic", "sqlite"])
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--write-share", type=float, default=0.3, help="share of uploads (claims are half that)")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--run-profile", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        return run_profile(args)
+
+    results = {}
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as workdir:
+            env = {
+                **os.environ,
+                "DB_PROFILE": profile,
+                "SQLITE_PATH": str(Path(workdir) / "db.sqlite3"),
+                "INGESTION_RUN_IN_PROCESS": "false",
+                "OLLAMA_WARM_UP": "false",
+            }
+            child = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_db_locks", "--run-profile",
+                 "--threads", str(args.threads), "--seconds", str(args.seconds),
+                 "--write-share", str(args.write_share)],
+                cwd=BASE_DIR, env=env, check=True, capture_output=True, text=True,
+            )
+            results[profile] = json.loads(child.stdout.strip().splitlines()[-1])
+
+    print(f"{args.threads} threads for {args.seconds:g}s")
+    print(f"{'':<14}{'op':<8}{'ops/s':>8}{'locked':>8}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for profile, operations in results.items():
+        for name, r in operations.items():
+            latency = "".join(f"{r[key]:>9.1f}" if r[key] is not None else f"{'-':>9}"
+                              for key in ("p50_ms", "p95_ms", "max_ms"))
+            print(f"{profile:<14}{name:<8}{r['ops'] / args.seconds:>8.0f}{r['errors']:>8}{latency}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"parameters": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
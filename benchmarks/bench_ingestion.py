@@ -0,0 +1,181 @@
+"""Ingestion throughput over generated PDF and DOCX corpora.
+
+Generates synthetic PDFs (varying page counts) and DOCX files (varying
+paragraph and table counts), then measures
+
+* ``extract``: the extractor functions called directly on each file;
+* ``upload``: ``POST /api/auth/upload/`` followed by the ingestion job
+  (extraction, chunking, BM25 and embedding indexes), in process, against
+  a fresh SQLite database.
+
+and reports MB/s, pages/s (paragraphs for DOCX), peak RSS and database
+growth per document. Embeddings use the offline hashing embedder.
+
+    python -m benchmarks.bench_ingestion --pdf-pages 10 100 --docx-paragraphs 100 1000 --count 3
+"""
+
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+WORKDIR = tempfile.TemporaryDirectory()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "classwork_chatbot.settings")
+os.environ.update(
+    SQLITE_PATH=str(Path(WORKDIR.name) / "db.sqlite3"),
+    INGESTION_RUN_IN_PROCESS="false",   # jobs are drained and timed by the benchmark
+    EMBEDDING_BACKEND="hashing",
+    OLLAMA_WARM_UP="false",
+)
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+
+from accounts import utils  # noqa: E402
+from accounts.ingestion import run_pending  # noqa: E402
+from accounts.models import UploadedFile, UserProfile  # noqa: E402
+from benchmarks.corpus import make_docx, make_pdf  # noqa: E402
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its (pool) children so far"""
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024  # bytes on macOS, KiB on Linux
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return max(own, children) * 1024 / scale / 1024
+
+
+def db_bytes():
+    path = Path(settings.DATABASES["default"]["NAME"])
+    return sum(p.stat().st_size for p in (path, Path(f"{path}-wal")) if p.exists())
+
+
+def build_corpus(args):
+    """``(name, kind, units, bytes)``: units are pages for PDFs and paragraphs for DOCX"""
+    corpus, seed = [], 0
+    for pages in args.pdf_pages:
+        for _ in range(args.count):
+            seed += 1
+            corpus.append((f"pdf-{pages}p-{seed}.pdf", "pdf", pages, make_pdf(pages, seed=seed)))
+    for paragraphs in args.docx_paragraphs:
+        for tables in args.docx_tables:
+            for _ in range(args.count):
+                seed += 1
+                data = make_docx(paragraphs, tables=tables, seed=seed)
+                corpus.append((f"docx-{paragraphs}p-{tables}t-{seed}.docx", "docx", paragraphs, data))
+    return corpus
+
+
+def group_key(name):
+    return name.rsplit("-", 1)[0]
+
+
+def bench_extract(corpus, directory):
+    rows = []
+    for name, kind, units, data in corpus:
+        path = Path(directory) / name
+        path.write_bytes(data)
+        start = time.perf_counter()
+        text = utils.extract_text(str(path), kind, raise_errors=True)
+        seconds = time.perf_counter() - start
+        rows.append({"group": group_key(name), "kind": kind, "units": units, "bytes": len(data),
+                     "seconds": seconds, "chars": len(text)})
+    return rows
+
+
+def bench_upload(corpus):
+    call_command("migrate", verbosity=0)
+    professor = User.objects.create_user(username="bench-professor", password="bench")
+    UserProfile.objects.create(user=professor, user_type="professor")
+    client = Client()
+
+    rows = []
+    for name, kind, units, data in corpus:
+        before = db_bytes()
+        start = time.perf_counter()
+        response = client.post("/api/auth/upload/", {
+            "file": SimpleUploadedFile(name, data), "course_name": "BENCH 101",
+        })
+        uploaded = time.perf_counter()
+        assert response.status_code == 200, response.content
+        run_pending()
+        done = time.perf_counter()
+        status = UploadedFile.objects.values_list("status", flat=True).get(id=response.json()["file_id"])
+        rows.append({"group": group_key(name), "kind": kind, "units": units, "bytes": len(data),
+                     "upload_seconds": uploaded - start, "seconds": done - start,
+                     "db_growth_bytes": db_bytes() - before, "status": status})
+    return rows
+
+
+def summarize(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row["group"], []).append(row)
+    summary = []
+    for group, items in groups.items():
+        seconds = sum(r["seconds"] for r in items)
+        result = {
+            "group": group,
+            "docs": len(items),
+            "avg_mb": sum(r["bytes"] for r in items) / len(items) / 1e6,
+            "mb_per_s": sum(r["bytes"] for r in items) / 1e6 / seconds,
+            "units_per_s": sum(r["units"] for r in items) / seconds,
+            "ms_per_doc": seconds / len(items) * 1000,
+        }
+        if "db_growth_bytes" in items[0]:
+            result["db_kb_per_doc"] = sum(r["db_growth_bytes"] for r in items) / len(items) / 1024
+            result["upload_ms_per_doc"] = sum(r["upload_seconds"] for r in items) / len(items) * 1000
+            result["failed"] = sum(r["status"] != "ready" for r in items)
+        summary.append(result)
+    return summary
+
+
+def print_table(title, summary, peak):
+    print(f"\n{title} (peak RSS {peak:.0f} MB)")
+    print(f"{'group':<18}{'docs':>5}{'avg MB':>8}{'MB/s':>8}{'units/s':>10}{'ms/doc':>9}", end="")
+    upload = "db_kb_per_doc" in summary[0]
+    print(f"{'upload ms':>11}{'DB KB/doc':>11}{'failed':>8}" if upload else "")
+    for r in summary:
+        print(f"{r['group']:<18}{r['docs']:>5}{r['avg_mb']:>8.2f}{r['mb_per_s']:>8.2f}{r['units_per_s']:>10.0f}"
+              f"{r['ms_per_doc']:>9.0f}", end="")
+        print(f"{r['upload_ms_per_doc']:>11.1f}{r['db_kb_per_doc']:>11.1f}{r['failed']:>8}" if upload else "")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf-pages", type=int, nargs="*", default=[10, 100])
+    parser.add_argument("--docx-paragraphs", type=int, nargs="*", default=[100, 1000])
+    parser.add_argument("--docx-tables", type=int, nargs="+", default=[0, 20])
+    parser.add_argument("--count", type=int, default=3, help="documents per size")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args)
+    results = {}
+    with override_settings(MEDIA_ROOT=Path(WORKDIR.name) / "media",
+                           RETRIEVAL_INDEX_ROOT=Path(WORKDIR.name) / "indexes"):
+        extract = summarize(bench_extract(corpus, WORKDIR.name))
+        results["extract"] = {"peak_rss_mb": peak_rss_mb(), "groups": extract}
+        print_table("extract", extract, results["extract"]["peak_rss_mb"])
+
+        upload = summarize(bench_upload(corpus))
+        results["upload"] = {"peak_rss_mb": peak_rss_mb(), "groups": upload}
+        print_table("upload + ingestion", upload, results["upload"]["peak_rss_mb"])
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Response time of the file list with many large files.
+
+Fills a fresh SQLite database with ``--files`` uploads of ``--text-kb`` of
+extracted text each (by default 10k files of 1 MB), then times
+
+* ``legacy``: what ``list_files`` used to do, loading every full row of
+  the professor's files (streamed with ``iterator()`` here; with the text
+  inline on the row, as it was then, the list needed the whole table in
+  memory);
+* ``first page`` / ``last page`` / ``course page``: ``GET /api/auth/files/``
+  with keyset pagination and column projection, for the newest page, the
+  oldest page (reached by following cursors) and the newest page of one
+  course;
+
+first with the list indexes and again after dropping them.
+
+    python -m benchmarks.bench_list_files --files 10000 --text-kb 1024
+"""
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import timedelta
+from pathlib import Path
+
+WORKDIR = tempfile.TemporaryDirectory()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "classwork_chatbot.settings")
+os.environ.update(
+    SQLITE_PATH=str(Path(WORKDIR.name) / "db.sqlite3"),
+    INGESTION_RUN_IN_PROCESS="false",
+    OLLAMA_WARM_UP="false",
+)
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from accounts.models import ExtractedText, UploadedFile, UserProfile  # noqa: E402
+
+COURSES = [f"CS {100 + n}" for n in range(20)]
+LIST_URL = "/api/auth/files/"
+
+
+def populate(files, text_kb):
+    call_command("migrate", verbosity=0)
+    professor = User.objects.create_user(username="bench-professor", password="bench")
+    UserProfile.objects.create(user=professor, user_type="professor")
+    text = "lorem ipsum " * (text_kb * 1024 // 12)
+    now = timezone.now()
+    start = time.perf_counter()
+    for offset in range(0, files, 100):
+        with transaction.atomic():
+            batch = UploadedFile.objects.bulk_create([
+                UploadedFile(professor=professor, file=f"uploads/bench/{n}.pdf", file_type="pdf",
+                             original_filename=f"lecture-{n}.pdf", course_name=COURSES[n % len(COURSES)],
+                             status="ready", progress=100)
+                for n in range(offset, min(offset + 100, files))
+            ])
+            # bulk_create skips save(), which would store the text
+            ExtractedText.objects.bulk_create([
+                ExtractedText(key=f.text_key, data=ExtractedText.compress(text), length=len(text)) for f in batch
+            ])
+            # auto_now_add gave them all the same time; spread them out, one a minute
+            for uploaded in batch:
+                UploadedFile.objects.filter(id=uploaded.id).update(
+                    uploaded_at=now - timedelta(minutes=files - uploaded.id)
+                )
+    print(f"inserted {files} files of {text_kb} KB in {time.perf_counter() - start:.0f}s")
+    return professor
+
+
+def legacy_list(professor):
+    files = UploadedFile.objects.filter(professor=professor).order_by("-uploaded_at")
+    return [{
+        "id": f.id,
+        "filename": f.original_filename,
+        "file_type": f.file_type,
+        "course_name": f.course_name,
+        "uploaded_at": f.uploaded_at,
+        "status": f.status,
+        "progress": f.progress,
+    } for f in files.iterator(chunk_size=100)]
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def last_page_cursor(client, limit):
+    cursor, previous = None, None
+    while True:
+        data = client.get(LIST_URL, {"limit": limit, **({"cursor": cursor} if cursor else {})}).json()
+        if not data["next_cursor"]:
+            return previous
+        previous, cursor = cursor, data["next_cursor"]
+
+
+def measure(client, professor, cursor, args, legacy=True):
+    def get(**params):
+        response = client.get(LIST_URL, {"limit": args.limit, **params})
+        assert response.status_code == 200, response.content
+
+    results = {
+        "first page": timed(get, args.repeat),
+        "last page": timed(lambda: get(**({"cursor": cursor} if cursor else {})), args.repeat),
+        "course page": timed(lambda: get(course_name=COURSES[3]), args.repeat),
+    }
+    if legacy:
+        results = {"legacy": timed(lambda: legacy_list(professor), 1), **results}
+    return results
+
+
+def drop_list_indexes():
+    with connection.cursor() as cursor:
+        for name, info in connection.introspection.get_constraints(cursor, UploadedFile._meta.db_table).items():
+            if info["index"] and info["columns"][:1] == ["professor_id"] and len(info["columns"]) > 1:
+                cursor.execute(f'DROP INDEX "{name}"')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10000)
+    parser.add_argument("--text-kb", type=int, default=1024, help="extracted text per file")
+    parser.add_argument("--limit", type=int, default=50, help="page size")
+    parser.add_argument("--repeat", type=int, default=20, help="timed requests per case (median reported)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # DEBUG keeps the SQL (megabytes of text per insert) of every query in memory
+    with override_settings(DEBUG=False):
+        professor = populate(args.files, args.text_kb)
+        client = Client()
+        cursor = last_page_cursor(client, args.limit)
+        results = {"indexed": measure(client, professor, cursor, args)}
+        drop_list_indexes()
+        # without the indexes every page sorts the whole table: keep it short
+        args.repeat = min(args.repeat, 3)
+        results["no list indexes"] = measure(client, professor, cursor, args, legacy=False)
+
+    print(f"{'':<18}" + "".join(f"{name:>14}" for name in results["indexed"]))
+    for variant, cases in results.items():
+        print(f"{variant:<18}" + "".join(
+            f"{cases[name] * 1000:>11.1f} ms" if name in cases else f"{'-':>14}" for name in results["indexed"]
+        ))
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"parameters": vars(args), "seconds": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""PDF extraction throughput: single process vs the page-range process pool.
+
+    python -m benchmarks.bench_pdf_extraction --pages 10 100 1000
+"""
+
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from accounts import utils
+from benchmarks.corpus import make_pdf
+
+
+def time_extraction(path, parallel):
+    saved = utils.PDF_PARALLEL_MIN_PAGES
+    utils.PDF_PARALLEL_MIN_PAGES = saved if parallel else float("inf")
+    try:
+        start = time.perf_counter()
+        text = utils.extract_text_from_pdf(path, raise_errors=True)
+        return time.perf_counter() - start, text
+    finally:
+        utils.PDF_PARALLEL_MIN_PAGES = saved
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--words-per-page", type=int, default=300)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # start the pool once so worker spawn time isn't charged to the first run
+    utils._get_pdf_pool().submit(int).result()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in args.pages:
+            path = Path(tmp) / f"{pages}.pdf"
+            path.write_bytes(make_pdf(pages, args.words_per_page))
+            serial_s, serial_text = time_extraction(path, parallel=False)
+            pool_s, pool_text = time_extraction(path, parallel=True)
+            assert serial_text == pool_text
+            results.append({
+                "pages": pages,
+                "serial_pages_per_s": pages / serial_s,
+                "pool_pages_per_s": pages / pool_s,
+                "pool_used": pages >= utils.PDF_PARALLEL_MIN_PAGES and utils.PDF_MAX_PROCESSES > 1,
+            })
+
+    print(f"{'pages':>6}{'serial p/s':>13}{'pool p/s':>11}{'speedup':>9}  (pool from {utils.PDF_PARALLEL_MIN_PAGES} pages, "
+          f"{utils.PDF_MAX_PROCESSES} processes)")
+    for r in results:
+        print(f"{r['pages']:>6}{r['serial_pages_per_s']:>13.1f}{r['pool_pages_per_s']:>11.1f}"
+              f"{r['pool_pages_per_s'] / r['serial_pages_per_s']:>8.2f}x")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
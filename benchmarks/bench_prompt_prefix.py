@@ -0,0 +1,146 @@
+"""Prompt-cache reuse on follow-up questions, by prompt layout.
+
+Simulates a study session of follow-up questions about one document and
+compares three layouts:
+
+* ``legacy``: excerpts in rank order, then the instruction, in one system
+  message (the layout before prompts were made deterministic);
+* ``stable``: instruction first, then excerpts in document order
+  (``accounts.prompts.build_messages``);
+* ``pinned``: the whole document as one fixed block.
+
+For every follow-up it counts the tokens shared with the previous prompt,
+which is what Ollama's prompt cache lets it skip. With ``--ollama`` the
+prompts are also sent to the server at ``OLLAMA_HOST`` (one output token
+each) and the measured prefill time (``prompt_eval_duration``) is reported.
+
+    python -m benchmarks.bench_prompt_prefix --questions 8
+    python -m benchmarks.bench_prompt_prefix --ollama
+"""
+
+import argparse
+import json
+import os
+import random
+from pathlib import Path
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "classwork_chatbot.settings")
+django.setup()
+
+from django.conf import settings  # noqa: E402
+
+from accounts.prompts import SYSTEM_INSTRUCTION, Excerpt, build_messages  # noqa: E402
+from accounts.retrieval import BM25Index, chunk_text  # noqa: E402
+from accounts.tokens import ApproximateTokenizer  # noqa: E402
+from benchmarks.corpus import WORDS, lorem  # noqa: E402
+
+FILENAME = "lecture.pdf"
+
+
+def legacy_messages(excerpts, history, question):
+    context = "".join(f"Context from {e.filename}:\n{e.text}\n\n" for e in excerpts)
+    return [{"role": "system", "content": f"{context}{SYSTEM_INSTRUCTION}"}, *history,
+            {"role": "user", "content": question}]
+
+
+def render(messages):
+    """Approximation of the chat template: what the model's prompt cache sees"""
+    return "".join(f"<|{m['role']}|>\n{m['content']}<|eot|>" for m in messages)
+
+
+def shared_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+def session(layout, document, chunks, index, questions, answers):
+    """The prompts of one study session under a layout"""
+    history, prompts = [], []
+    for question, answer in zip(questions, answers):
+        ranked = [int(position) for position, _ in index.search(question, settings.RETRIEVAL_TOP_K)]
+        excerpts = [Excerpt(FILENAME, chunks[p], p) for p in ranked]
+        if layout == "legacy":
+            messages = legacy_messages(excerpts, history, question)
+        elif layout == "stable":
+            messages, _ = build_messages(excerpts, history, question)
+        else:
+            messages, _ = build_messages([Excerpt(FILENAME, document, 0)], history, question)
+        prompts.append(messages)
+        history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+    return prompts
+
+
+def measure_offline(prompts, tokenizer):
+    previous, shared, total = "", 0, 0
+    for n, messages in enumerate(prompts):
+        text = render(messages)
+        if n:  # the first question has nothing to reuse in any layout
+            shared += tokenizer.count(text[:shared_prefix(previous, text)])
+            total += tokenizer.count(text)
+        previous = text
+    return {"follow_up_prompt_tokens": total, "reusable_tokens": shared, "reuse_ratio": shared / total if total else 0.0}
+
+
+def measure_ollama(prompts):
+    from accounts.llm import chat
+
+    # evict whatever the previous layout left in the cache
+    chat(messages=[{"role": "user", "content": lorem(50, random.Random())}], options={"num_predict": 1})
+    evaluated, prefill_ms = [], []
+    for n, messages in enumerate(prompts):
+        response = chat(messages=messages, options={"num_predict": 1, "num_ctx": settings.CHAT_CONTEXT_WINDOW})
+        if n:
+            evaluated.append(response["prompt_eval_count"] or 0)
+            prefill_ms.append((response["prompt_eval_duration"] or 0) / 1e6)
+    return {
+        "avg_tokens_evaluated": sum(evaluated) / len(evaluated),
+        "avg_prefill_ms": sum(prefill_ms) / len(prefill_ms),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--words", type=int, default=1000, help="document length")
+    parser.add_argument("--questions", type=int, default=8, help="questions per session")
+    parser.add_argument("--ollama", action="store_true", help="also measure prefill on the Ollama server")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    document = lorem(args.words, rng)
+    chunks = chunk_text(document)
+    index = BM25Index.build(chunks)
+    questions = [f"what is the {' '.join(rng.sample(WORDS, 3))}?" for _ in range(args.questions)]
+    answers = [lorem(60, rng) for _ in questions]
+    tokenizer = ApproximateTokenizer()
+
+    results = []
+    for layout in ("legacy", "stable", "pinned"):
+        prompts = session(layout, document, chunks, index, questions, answers)
+        result = {"layout": layout, **measure_offline(prompts, tokenizer)}
+        if args.ollama:
+            result.update(measure_ollama(prompts))
+        results.append(result)
+
+    header = f"{'layout':<8}{'follow-up tokens':>18}{'reusable':>10}{'reuse':>8}"
+    if args.ollama:
+        header += f"{'evaluated':>11}{'prefill ms':>12}"
+    print(header)
+    for r in results:
+        line = (f"{r['layout']:<8}{r['follow_up_prompt_tokens']:>18}{r['reusable_tokens']:>10}"
+                f"{r['reuse_ratio']:>7.0%}")
+        if args.ollama:
+            line += f"{r['avg_tokens_evaluated']:>11.0f}{r['avg_prefill_ms']:>12.1f}"
+        print(line)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Database size and query time before and after moving text to ExtractedText.
+
+Builds a fresh SQLite database at the schema before the side store
+(migration 0008), with the extracted text inline on every ``UploadedFile``
+row, and measures
+
+* the database size (after ``VACUUM``);
+* ``changelist``: the admin's full-row fetch of 100 files;
+* ``scan``: a full-row fetch of every file;
+* ``one text``: loading the text of one file, as chat and indexing do.
+
+It then runs the data migration (timed), vacuums, and measures again.
+The text is synthetic prose with a Zipf-distributed vocabulary, which
+zlib compresses about as well as real lecture notes.
+
+    python -m benchmarks.bench_text_store --files 1000 --text-kb 256
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import statistics
+import string
+import tempfile
+import time
+from pathlib import Path
+
+WORKDIR = tempfile.TemporaryDirectory()
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "classwork_chatbot.settings")
+os.environ.update(
+    SQLITE_PATH=str(Path(WORKDIR.name) / "db.sqlite3"),
+    INGESTION_RUN_IN_PROCESS="false",
+    OLLAMA_WARM_UP="false",
+)
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.migrations.executor import MigrationExecutor  # noqa: E402
+from django.test import override_settings  # noqa: E402
+
+from accounts.models import UploadedFile  # noqa: E402
+
+BEFORE = ("accounts", "0008_uploadedfile_list_indexes")
+
+
+def prose(n_chars, rng, vocabulary, cum_weights):
+    words, size = [], 0
+    while size < n_chars:
+        sentence = rng.choices(vocabulary, cum_weights=cum_weights, k=rng.randint(8, 20))
+        sentence[0] = sentence[0].capitalize()
+        words.append(" ".join(sentence) + ".")
+        size += len(words[-1]) + 1
+    return " ".join(words)[:n_chars]
+
+
+def populate(files, text_kb):
+    call_command("migrate", *BEFORE, verbosity=0)
+    apps = MigrationExecutor(connection).loader.project_state(BEFORE).apps
+    User, OldFile = apps.get_model("auth", "User"), apps.get_model("accounts", "UploadedFile")
+    professor = User.objects.create(username="bench-professor")
+
+    rng = random.Random(0)
+    vocabulary = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(2, 10))) for _ in range(5000)]
+    cum_weights = list(itertools.accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+    for offset in range(0, files, 50):
+        OldFile.objects.bulk_create([
+            OldFile(professor=professor, file=f"uploads/bench/{n}.pdf", file_type="pdf",
+                    original_filename=f"lecture-{n}.pdf", content_hash=f"{n:064x}", course_name="CS 101",
+                    extracted_text=prose(text_kb * 1024, rng, vocabulary, cum_weights), status="ready")
+            for n in range(offset, min(offset + 50, files))
+        ])
+    return OldFile
+
+
+def db_size():
+    with connection.cursor() as cursor:
+        cursor.execute("VACUUM")
+    return Path(settings.DATABASES["default"]["NAME"]).stat().st_size
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def measure(model, repeat):
+    file_id = model.objects.order_by("id").values_list("id", flat=True)[model.objects.count() // 2]
+    return {
+        "db_mb": db_size() / 1e6,
+        "changelist_ms": timed(lambda: list(model.objects.order_by("-id")[:100]), repeat) * 1000,
+        "scan_ms": timed(lambda: sum(1 for _ in model.objects.iterator(chunk_size=100)), repeat) * 1000,
+        "one_text_ms": timed(lambda: len(model.objects.get(id=file_id).extracted_text), repeat) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--text-kb", type=int, default=256, help="extracted text per file")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per query (median reported)")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # DEBUG keeps the SQL (megabytes of text per insert) of every query in memory
+    with override_settings(DEBUG=False):
+        OldFile = populate(args.files, args.text_kb)
+        results = {"inline": measure(OldFile, args.repeat)}
+        start = time.perf_counter()
+        call_command("migrate", verbosity=0)
+        migration_s = time.perf_counter() - start
+        results["side store"] = measure(UploadedFile, args.repeat)
+
+    print(f"{args.files} files of {args.text_kb} KB, data migration took {migration_s:.1f}s")
+    print(f"{'':<12}{'DB MB':>9}{'changelist ms':>15}{'scan ms':>10}{'one text ms':>13}")
+    for layout, r in results.items():
+        print(f"{layout:<12}{r['db_mb']:>9.1f}{r['changelist_ms']:>15.1f}{r['scan_ms']:>10.1f}{r['one_text_ms']:>13.2f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({"parameters": vars(args), "migration_s": migration_s,
+                                               "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Synthetic course documents for the benchmarks."""
+
+import io
+import random
+
+WORDS = (
+    "algorithm array binary complexity graph hash heap invariant iterator "
+    "lecture linked list memory pointer proof queue recursion runtime search "
+    "sort stack string tree vertex edge midterm exam homework notation theorem"
+).split()
+
+
+def lorem(n_words, rng):
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def make_pdf(pages, words_per_page=300, seed=0):
+    """A valid PDF with ``pages`` pages of extractable Helvetica text"""
+    rng = random.Random(seed)
+    objects = {}
+    page_ids = [4 + 2 * n for n in range(pages)]
+
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode()
+    objects[3] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+
+    for n, page_id in enumerate(page_ids):
+        words = lorem(words_per_page, rng).split()
+        lines = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        text_ops = " ".join(f"({line}) Tj T*" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 800 Td (Page {n + 1}) Tj T* {text_ops} ET".encode()
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {page_id + 1} 0 R >>"
+        ).encode()
+        objects[page_id + 1] = b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = len(out)
+        out += b"%d 0 obj\n%s\nendobj\n" % (obj_id, objects[obj_id])
+
+    xref_at = len(out)
+    size = max(objects) + 1
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % size
+    for obj_id in range(1, size):
+        out += b"%010d 00000 n \n" % offsets[obj_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref_at)
+    return bytes(out)
+
+
+def make_docx(paragraphs, words_per_paragraph=60, tables=0, rows=8, cols=4, seed=0):
+    """A DOCX with ``paragraphs`` paragraphs of text and ``tables`` tables spread between them"""
+    from docx import Document
+
+    rng = random.Random(seed)
+    document = Document()
+    table_every = max(paragraphs // tables, 1) if tables else 0
+    added = 0
+    for n in range(paragraphs):
+        if n % 25 == 0:
+            document.add_heading(f"Section {n // 25 + 1}", level=1)
+        document.add_paragraph(lorem(words_per_paragraph, rng))
+        if table_every and (n + 1) % table_every == 0 and added < tables:
+            table = document.add_table(rows=rows, cols=cols)
+            for row in table.rows:
+                for cell in row.cells:
+                    cell.text = lorem(3, rng)
+            added += 1
+
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
@@ -0,0 +1,171 @@
+"""A tiny stand-in for the Ollama HTTP API, for benchmarks.
+
+Answers ``/api/chat`` (streaming and non-streaming) and ``/api/embed``,
+so the Django chat path can be load-tested without a GPU or a real
+model. A chat takes ``ttft`` seconds before the first token, then emits
+tokens at ``tokens_per_s``; a ``failure_rate`` fraction of chats fail
+with a 500. Responses carry Ollama's timing fields, and the server
+records how long it spent on each question (``model_seconds``).
+
+    python -m benchmarks.fake_ollama --port 11500 --ttft 0.5 --tokens-per-s 40
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ANSWER = "This is a canned answer from the fake Ollama server."
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "llama3.2:3b"}]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_POST(self):
+        payload = self._read_json()
+        if self.path == "/api/chat":
+            self._chat(payload)
+        elif self.path == "/api/embed":
+            self._embed(payload)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _chat(self, payload):
+        server = self.server
+        start = time.perf_counter()
+        messages = payload.get("messages") or []
+        question = messages[-1].get("content", "") if messages else ""
+        model = payload.get("model", "llama3.2:3b")
+        words = server.answer.split(" ")
+        tokens = [w if n == len(words) - 1 else w + " " for n, w in enumerate(words)]
+        prompt_tokens = len(json.dumps(messages)) // 4
+        token_delay = 1 / server.tokens_per_s if server.tokens_per_s else 0.0
+
+        time.sleep(server.ttft)
+        if server.should_fail():
+            self._send_json({"error": "fake model runner failed"}, status=500)
+            return
+
+        def stats():
+            total = time.perf_counter() - start
+            return {
+                "done": True,
+                "done_reason": "stop",
+                "total_duration": int(total * 1e9),
+                "load_duration": 0,
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int(server.ttft * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int(len(tokens) * token_delay * 1e9),
+            }
+
+        if not payload.get("stream", True):
+            time.sleep(token_delay * len(tokens))
+            self._send_json({
+                "model": model,
+                "message": {"role": "assistant", "content": server.answer},
+                **stats(),
+            })
+            server.record(question, time.perf_counter() - start)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(token_delay)
+            self._write_chunk({"model": model, "message": {"role": "assistant", "content": token}, "done": False})
+        self._write_chunk({"model": model, "message": {"role": "assistant", "content": ""}, **stats()})
+        self.wfile.write(b"0\r\n\r\n")
+        server.record(question, time.perf_counter() - start)
+
+    def _write_chunk(self, payload):
+        line = json.dumps(payload).encode() + b"\n"
+        self.wfile.write(f"{len(line):X}\r\n".encode() + line + b"\r\n")
+        self.wfile.flush()
+
+    def _embed(self, payload):
+        texts = payload.get("input", [])
+        texts = [texts] if isinstance(texts, str) else texts
+        embeddings = []
+        for text in texts:
+            seed = zlib.crc32(text.encode())
+            embeddings.append([((seed >> (i % 24)) & 0xFF) / 255.0 for i in range(64)])
+        self._send_json({"model": payload.get("model"), "embeddings": embeddings})
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, ttft=1.0, tokens_per_s=0.0, failure_rate=0.0, answer=ANSWER, seed=0):
+        super().__init__(address, FakeOllamaHandler)
+        self.ttft = ttft
+        self.tokens_per_s = tokens_per_s      # 0: all tokens at once
+        self.failure_rate = failure_rate
+        self.answer = answer
+        self.model_seconds = {}               # question -> seconds spent answering it
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def should_fail(self):
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def record(self, question, seconds):
+        with self._lock:
+            self.model_seconds[question] = seconds
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serve from a daemon thread and return self"""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--ttft", type=float, default=1.0, help="seconds before the first token")
+    parser.add_argument("--tokens-per-s", type=float, default=0.0, help="generation speed (0: instant)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of chats that fail")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer((args.host, args.port), ttft=args.ttft, tokens_per_s=args.tokens_per_s,
+                              failure_rate=args.failure_rate)
+    print(f"Fake Ollama listening on {server.url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
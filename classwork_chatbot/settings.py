@@ -3,7 +3,9 @@ Django settings for classwork_chatbot project.
 """
 
 from pathlib import Path
+import json
 import os
+from django.core.exceptions import ImproperlyConfigured
 from django.core.management.utils import get_random_secret_key
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,6 +59,8 @@ AUTHENTICATION_BACKENDS = (
 
 
 MIDDLEWARE = [
+    'accounts.timing.ServerTimingMiddleware',  # first, so it times everything below
+    'accounts.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',   # must be before CommonMiddleware
@@ -93,12 +97,65 @@ WSGI_APPLICATION = 'classwork_chatbot.wsgi.application'
 # Database
 # ----------------------------------------------------------------------
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_PROFILE picks the database setup:
+#   'sqlite'   single node (default): WAL journal so readers don't block the
+#              writer, IMMEDIATE transactions and a busy timeout so concurrent
+#              writers queue instead of failing with "database is locked"
+#   'postgres' several nodes/processes: PostgreSQL with a connection pool
+#              (POSTGRES_POOL_SIZE > 0, needs psycopg[pool]) or persistent
+#              connections
+#   'sqlite-basic' Django's plain SQLite defaults, for comparison
+DB_PROFILE = os.environ.get('DB_PROFILE', 'sqlite')
+
+if DB_PROFILE == 'postgres':
+    POSTGRES_POOL_SIZE = int(os.environ.get('POSTGRES_POOL_SIZE', '10'))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'classwork_chatbot'),
+            'USER': os.environ.get('POSTGRES_USER', 'postgres'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # a pool hands connections back after each request (persistent
+            # connections leak under ASGI); without one, e.g. behind a WSGI
+            # server, keep each thread's connection open between requests
+            'CONN_MAX_AGE': 0 if POSTGRES_POOL_SIZE else 600,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {'min_size': 2, 'max_size': POSTGRES_POOL_SIZE, 'timeout': 10},
+            } if POSTGRES_POOL_SIZE else {},
+        }
     }
-}
+elif DB_PROFILE == 'sqlite-basic':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+        }
+    }
+elif DB_PROFILE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # take the write lock when the transaction starts, so a
+                # read-then-write transaction waits instead of deadlocking
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,      # seconds to wait for the write lock
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    'PRAGMA synchronous=NORMAL;'    # safe with WAL, fsyncs at checkpoints only
+                    'PRAGMA busy_timeout=20000;'
+                    'PRAGMA mmap_size=268435456;'   # read through a 256 MB memory map
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"Unknown DB_PROFILE {DB_PROFILE!r}: use 'sqlite', 'postgres' or 'sqlite-basic'")
 
 
 # ----------------------------------------------------------------------
@@ -153,3 +210,160 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+
+
+# ----------------------------------------------------------------------
+# Retrieval (chunked BM25 index over extracted course material)
+# ----------------------------------------------------------------------
+
+RETRIEVAL_INDEX_ROOT = BASE_DIR / 'indexes'
+RETRIEVAL_CHUNK_WORDS = 200     # words per chunk
+RETRIEVAL_CHUNK_OVERLAP = 40    # words shared between neighbouring chunks
+RETRIEVAL_TOP_K = 4             # chunks sent to the model per question
+
+# Semantic tier: chunk embeddings in one memory-mapped matrix per course
+EMBEDDING_BACKEND = os.environ.get('EMBEDDING_BACKEND', 'ollama')  # 'ollama', 'hashing' or a dotted path
+EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'nomic-embed-text')
+EMBEDDING_DIM = 256             # dimension of the offline hashing embedder
+
+
+# ----------------------------------------------------------------------
+# Background ingestion of uploads (see accounts/ingestion.py)
+# ----------------------------------------------------------------------
+
+INGESTION_WORKERS = 2           # extraction/indexing threads
+INGESTION_RUN_IN_PROCESS = os.environ.get('INGESTION_RUN_IN_PROCESS', 'true').lower() == 'true'  # False when running `manage.py ingestion_worker`
+INGESTION_POLL_INTERVAL = 2     # seconds between job table polls
+INGESTION_MAX_ATTEMPTS = 3
+INGESTION_RETRY_BACKOFF = 5     # seconds before the first retry, doubled after each failure
+INGESTION_STALE_AFTER = 600     # seconds before a running job is assumed dead and requeued
+INGESTION_COURSE_INDEX_DELAY = 30  # longest wait for a course index rebuild while the queue stays busy
+
+
+# ----------------------------------------------------------------------
+# Caches
+# ----------------------------------------------------------------------
+
+# LocMemCache is per process; point 'answers' at a shared backend (e.g.
+# Redis or a FileBasedCache) when running several worker processes.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'answers': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'chat-answers',
+        'TIMEOUT': 6 * 60 * 60,                 # seconds an answer stays cached
+        'OPTIONS': {'MAX_ENTRIES': 5000},       # least recently used entries are culled first
+    },
+}
+ANSWER_CACHE_ALIAS = 'answers'
+
+# Paraphrased questions: reuse an answer when the question embeddings are this similar
+SEMANTIC_CACHE_ENABLED = os.environ.get('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+SEMANTIC_CACHE_THRESHOLD = 0.92     # cosine similarity
+SEMANTIC_CACHE_CAPACITY = 2048      # questions kept per process, least recently used evicted
+
+
+# ----------------------------------------------------------------------
+# Ollama (see accounts/llm.py)
+# ----------------------------------------------------------------------
+
+CHAT_MODEL = os.environ.get('CHAT_MODEL', 'llama3.2:3b')
+OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://127.0.0.1:11434')
+# Several servers (comma separated): requests about a document always go to
+# the same one, so its prompt cache keeps that document's prefix
+OLLAMA_HOSTS = os.environ.get('OLLAMA_HOSTS', OLLAMA_HOST).split(',')
+OLLAMA_TIMEOUT = 120            # seconds to wait for a generation
+OLLAMA_CONNECT_TIMEOUT = 5      # fail fast when Ollama isn't running
+OLLAMA_MAX_CONNECTIONS = 64     # pooled HTTP connections per client
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')  # how long the model stays loaded after a request
+OLLAMA_WARM_UP = os.environ.get('OLLAMA_WARM_UP', 'true').lower() == 'true'  # load CHAT_MODEL at startup
+
+# Generations admitted at once per process (match Ollama's OLLAMA_NUM_PARALLEL);
+# the rest wait their turn, round-robin across courses, or get a 429
+LLM_MAX_CONCURRENT = int(os.environ.get('LLM_MAX_CONCURRENT', 2))
+LLM_MAX_QUEUED = 64             # waiting requests before new ones are rejected
+LLM_MAX_WAIT = 60               # seconds a request may wait for a slot
+
+# ----------------------------------------------------------------------
+# Prompt budget (see accounts/prompts.py)
+# ----------------------------------------------------------------------
+
+CHAT_CONTEXT_WINDOW = 4096      # tokens; sent to Ollama as num_ctx
+CHAT_RESPONSE_TOKENS = 1024     # kept free for the answer, the prompt gets the rest
+PROMPT_PIN_DOCUMENT_TOKENS = 1500   # files up to this size are sent whole, for a stable cached prefix (0: always retrieve)
+PROMPT_TOKENIZER = os.environ.get('PROMPT_TOKENIZER', 'approximate')  # 'approximate' or a dotted path to a class with count(text)
+
+
+# ----------------------------------------------------------------------
+# Conversations (see accounts/conversations.py)
+# ----------------------------------------------------------------------
+
+CONVERSATION_SUMMARY_EVERY = 4      # turns collected before the summary is refreshed
+CONVERSATION_KEEP_TURNS = 2         # most recent turns always sent verbatim
+CONVERSATION_SUMMARY_MODEL = os.environ.get('CONVERSATION_SUMMARY_MODEL', CHAT_MODEL)
+
+
+# ----------------------------------------------------------------------
+# Request timing (see accounts/timing.py)
+# ----------------------------------------------------------------------
+
+# Every response carries a Server-Timing header. Set TIMING_LOG to a file
+# path to also get one JSON line per request / ingestion job there.
+TIMING_LOG = os.environ.get('TIMING_LOG', '')
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'message': {'format': '%(message)s'},
+    },
+    'handlers': {
+        'timing': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': TIMING_LOG,
+            'formatter': 'message',
+        } if TIMING_LOG else {'class': 'logging.NullHandler'},
+    },
+    'loggers': {
+        'accounts.timing': {'handlers': ['timing'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+
+# ----------------------------------------------------------------------
+# Prometheus metrics (see accounts/metrics.py), served at /metrics
+# ----------------------------------------------------------------------
+
+# With several worker processes, point METRICS_DIR at a directory they
+# share (empty it on deploy); /metrics then adds up every process.
+METRICS_DIR = os.environ.get('METRICS_DIR', '')
+METRICS_FLUSH_INTERVAL = 1.0        # seconds between a process's snapshots
+
+
+# ----------------------------------------------------------------------
+# Chat generation log (see accounts/chat_log.py, manage.py chat_stats)
+# ----------------------------------------------------------------------
+
+CHAT_LOG_FLUSH_INTERVAL = 2         # seconds between batched inserts
+CHAT_LOG_BATCH_SIZE = 500
+CHAT_LOG_MAX_PENDING = 10000        # rows buffered per process before the oldest are dropped
+CHAT_LOG_RELOAD_SECONDS = 1.0       # a load_duration above this means the model was (re)loaded
+
+
+# ----------------------------------------------------------------------
+# File list pagination
+# ----------------------------------------------------------------------
+
+FILE_LIST_PAGE_SIZE = 50
+FILE_LIST_MAX_PAGE_SIZE = 200
+
+
+# ----------------------------------------------------------------------
+# Uploads (see accounts/uploads.py)
+# ----------------------------------------------------------------------
+
+UPLOAD_MAX_MB = float(os.environ.get('UPLOAD_MAX_MB', '100'))
+# per-course overrides, e.g. UPLOAD_COURSE_MAX_MB='{"CS 101": 20, "ARCH 300": 500}'
+UPLOAD_COURSE_MAX_MB = json.loads(os.environ.get('UPLOAD_COURSE_MAX_MB', '{}'))
@@ -18,6 +18,8 @@ from django.contrib import admin
 from django.urls import path, include
 from django.http import HttpResponse
 
+from accounts import views as accounts_views
+
 
 # urlpatterns = [
 #     path('admin/', admin.site.urls),
@@ -28,4 +30,5 @@ urlpatterns = [
     path('', lambda request: HttpResponse("✅ Django backend is running successfully!")),
     path('admin/', admin.site.urls),
     path('api/auth/', include('accounts.urls')),
+    path('metrics', accounts_views.metrics),
 ]
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import time
 
 st.set_page_config(page_title="Professor Page", page_icon="📚")
 
@@ -40,16 +41,25 @@ uploaded_files = st.file_uploader(
 
 course_name = st.text_input("Course Name (optional)", placeholder="e.g., CS 225")
 
+# files per request; Django refuses more than 100 by default
+UPLOAD_BATCH_SIZE = 50
+
 if st.button("Upload Files") and uploaded_files:
-    for file in uploaded_files:
-        files = {"file": (file.name, file, file.type)}
-        data = {"course_name": course_name} if course_name else {}
+    data = {"course_name": course_name} if course_name else {}
+    for start in range(0, len(uploaded_files), UPLOAD_BATCH_SIZE):
+        batch = uploaded_files[start:start + UPLOAD_BATCH_SIZE]
+        files = [("files", (file.name, file, file.type)) for file in batch]
         
         try:
-            response = requests.post(f"{API_BASE}/upload/", files=files, data=data)
+            # the course in the query string lets the server enforce its size limit while streaming
+            response = requests.post(f"{API_BASE}/upload/batch/", files=files, data=data, params=data)
             
             if response.status_code == 200:
-                st.success(f"✅ Uploaded: {file.name}")
+                for result in response.json()["files"]:
+                    if "error" in result:
+                        st.error(f"❌ Failed: {result['filename']}: {result['error']}")
+                    else:
+                        st.success(f"✅ Uploaded: {result['filename']} (processing in the background)")
             else:
                 st.error(f"❌ Failed: {response.json().get('error')}")
         
@@ -63,23 +73,46 @@ else:
 
 st.subheader("Your Uploaded Files")
 
+if "files_cursor" not in st.session_state:
+    st.session_state.files_cursor = None
+
+processing = False
 try:
-    response = requests.get(f"{API_BASE}/files/")
+    # one page at a time, newest first
+    params = {"limit": 50}
+    if st.session_state.files_cursor:
+        params["cursor"] = st.session_state.files_cursor
+    response = requests.get(f"{API_BASE}/files/", params=params)
     
     if response.status_code == 200:
-        files = response.json().get("files", [])
+        data = response.json()
+        files = data.get("files", [])
         
         if files:
             for file in files:
                 col1, col2, col3 = st.columns([3, 1, 1])
                 with col1:
                     st.write(f"📄 {file['filename']}")
+                    if file.get("status") in ("pending", "processing"):
+                        processing = True
+                        st.progress(file.get("progress", 0) / 100, text="Processing...")
+                    elif file.get("status") == "failed":
+                        st.caption("⚠️ Text extraction failed")
                 with col2:
                     st.write(f"{file['file_type']}")
                 with col3:
                     if st.button("Delete", key=f"del_{file['id']}"):
                         requests.delete(f"{API_BASE}/files/{file['id']}/delete/")
                         st.rerun()
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.session_state.files_cursor and st.button("Newest files"):
+                    st.session_state.files_cursor = None
+                    st.rerun()
+            with col2:
+                if data.get("next_cursor") and st.button("Older files"):
+                    st.session_state.files_cursor = data["next_cursor"]
+                    st.rerun()
         else:
             st.info("No files.")
 except:
@@ -89,3 +122,8 @@ if st.button("Logout"):
     st.session_state.logged_in = False
     st.session_state.role = None
     st.switch_page("app.py")
+
+# poll until background processing of new uploads is done
+if processing:
+    time.sleep(2)
+    st.rerun()
@@ -1,5 +1,6 @@
 import streamlit as st
 import requests
+import json
 
 st.set_page_config(page_title="Student Page", page_icon="📖")
 # change overall font
@@ -32,6 +33,9 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+if "api_session" not in st.session_state:
+    st.session_state.api_session = requests.Session()
+
 st.title("ClassGPT - AI Study Assistant")
 
 st.caption("Ask questions, review materials, and study smarter with your class personalized chatbot")
@@ -44,15 +48,44 @@ if not st.session_state.get("logged_in") or st.session_state.get("role") != "Stu
 
 API_BASE = "http://localhost:8000/api/auth"
 
+@st.cache_data(ttl=30)
+def fetch_files():
+    """Every uploaded file, following the list's pages; reused across reruns for 30 s"""
+    files, params = [], {"limit": 200}
+    while True:
+        response = requests.get(f"{API_BASE}/files/", params=params)
+        if response.status_code != 200:
+            return files
+        data = response.json()
+        files += data.get("files", [])
+        if not data.get("next_cursor"):
+            return files
+        params["cursor"] = data["next_cursor"]
+
+
 # Get available files
 try:
-    response = requests.get(f"{API_BASE}/files/")
-    files = response.json().get("files", []) if response.status_code == 200 else []
+    files = fetch_files()
 except:
     files = []
 
-# File selector
+# Course and file selector; files uploaded without a course are the backend's "" course
+UNCATEGORIZED = ""
+selected_course = None
 if files:
+    courses = sorted({f['course_name'] for f in files if f.get('course_name')})
+    if any(not f.get('course_name') for f in files):
+        courses.append(UNCATEGORIZED)
+    if len(courses) > 1:
+        selected_course = st.selectbox(
+            "Course",
+            options=courses,
+            format_func=lambda c: "Uncategorized" if c == UNCATEGORIZED else c
+        )
+    else:
+        selected_course = courses[0]
+    files = [f for f in files if (f.get('course_name') or UNCATEGORIZED) == selected_course]
+
     file_options = {f['id']: f['filename'] for f in files}
     selected_file = st.selectbox(
         "Select course material", 
@@ -69,6 +102,7 @@ col1, col2 = st.columns([4, 1])
 with col2:
     if st.button("New Chat"):
         st.session_state.messages = []
+        st.session_state.conversation_id = None
         st.rerun()
 
 # Chat interface
@@ -76,6 +110,26 @@ st.subheader("Ask Questions")
 st.markdown("💡 *Tip: Ask about topics, key terms, or explanations from your uploaded slides.*")
 
 
+def stream_answer(data):
+    """Yield answer tokens from the backend's server-sent event stream"""
+    # the session cookie ties the conversation to this browser session
+    with st.session_state.api_session.post(f"{API_BASE}/chat/stream/", json=data, stream=True, timeout=120) as response:
+        if response.status_code != 200:
+            # e.g. 409 while the file is still being processed
+            raise RuntimeError(response.json().get("error", "Failed to get response"))
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            event = json.loads(line[len("data: "):])
+            if "error" in event:
+                raise RuntimeError(event["error"])
+            if "token" in event:
+                yield event["token"]
+            if event.get("done"):
+                # the backend keeps the history; later questions only send this id
+                st.session_state.conversation_id = event.get("conversation_id")
+
+
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
@@ -90,31 +144,21 @@ if prompt := st.chat_input("Ask a question about the course material..."):
     with st.chat_message("user"):
         st.write(prompt)
     
-    # Get AI response
+    # Stream the AI response token by token
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            try:
-                # Build chat history for context
-                chat_history = [{"role": msg["role"], "content": msg["content"]} 
-                                for msg in st.session_state.messages[-10:]]  # Last 10 messages
-                
-                data = {
-                    "question": prompt,
-                    "chat_history": chat_history
-                }
-                if selected_file:
-                    data["file_id"] = selected_file
-                
-                response = requests.post(f"{API_BASE}/chat/", json=data)
-                
-                if response.status_code == 200:
-                    answer = response.json()["answer"]
-                    st.write(answer)
-                    st.session_state.messages.append({"role": "assistant", "content": answer})
-                else:
-                    st.error("Failed to get response")
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
+        try:
+            data = {"question": prompt}
+            if st.session_state.get("conversation_id"):
+                data["conversation_id"] = st.session_state.conversation_id
+            if selected_file:
+                data["file_id"] = selected_file
+            elif selected_course is not None:
+                data["course_name"] = selected_course
+            
+            answer = st.write_stream(stream_answer(data))
+            st.session_state.messages.append({"role": "assistant", "content": answer})
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
 
 if st.button("Logout"):
     st.session_state.logged_in = False